@@ -0,0 +1,88 @@
+"""add invalidation notify triggers
+
+Revision ID: b5e0c7d3a912
+Revises: 4d7b2e91c0a6
+Create Date: 2026-10-19 17:25:51.804233
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+revision: str = "b5e0c7d3a912"
+down_revision: Union[str, Sequence[str], None] = "4d7b2e91c0a6"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# must match deskconn.invalidation.CHANNEL
+CHANNEL = "deskconn_invalidate"
+
+# table -> columns sent in the payload, enough for caches to find the affected entries
+TABLE_KEYS = {
+    "users": ["id", "email"],
+    "principals": ["id", "user_id"],
+    "devices": ["id", "user_id"],
+    "desktops": ["id", "authid", "user_id"],
+    "desktop_user_access": ["desktop_id", "user_id"],
+    "desktop_organization_access": ["desktop_id", "organization_id"],
+    "organization_members": ["organization_id", "user_id"],
+    "app_versions": ["id", "app_id"],
+}
+
+
+def upgrade() -> None:
+    op.execute(
+        f"""
+        CREATE FUNCTION deskconn.notify_row_change() RETURNS trigger AS $$
+        DECLARE
+            old_keys jsonb;
+            new_keys jsonb;
+        BEGIN
+            IF TG_OP <> 'INSERT' THEN
+                SELECT jsonb_object_agg(k, to_jsonb(OLD) -> k) INTO old_keys FROM unnest(TG_ARGV) AS k;
+            END IF;
+            IF TG_OP <> 'DELETE' THEN
+                SELECT jsonb_object_agg(k, to_jsonb(NEW) -> k) INTO new_keys FROM unnest(TG_ARGV) AS k;
+            END IF;
+
+            PERFORM pg_notify(
+                '{CHANNEL}',
+                jsonb_build_object('t', TG_TABLE_NAME, 'op', lower(TG_OP), 'old', old_keys, 'new', new_keys)::text
+            );
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        f"""
+        CREATE FUNCTION deskconn.notify_truncate() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('{CHANNEL}', jsonb_build_object('t', TG_TABLE_NAME, 'op', 'truncate')::text);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+
+    for table, keys in TABLE_KEYS.items():
+        arguments = ", ".join(f"'{key}'" for key in keys)
+        op.execute(
+            f"CREATE TRIGGER {table}_notify_change AFTER INSERT OR UPDATE OR DELETE ON deskconn.{table} "
+            f"FOR EACH ROW EXECUTE FUNCTION deskconn.notify_row_change({arguments})"
+        )
+        op.execute(
+            f"CREATE TRIGGER {table}_notify_truncate AFTER TRUNCATE ON deskconn.{table} "
+            "FOR EACH STATEMENT EXECUTE FUNCTION deskconn.notify_truncate()"
+        )
+
+
+def downgrade() -> None:
+    for table in TABLE_KEYS:
+        op.execute(f"DROP TRIGGER {table}_notify_truncate ON deskconn.{table}")
+        op.execute(f"DROP TRIGGER {table}_notify_change ON deskconn.{table}")
+
+    op.execute("DROP FUNCTION deskconn.notify_truncate()")
+    op.execute("DROP FUNCTION deskconn.notify_row_change()")
@@ -0,0 +1,35 @@
+"""add realm to desktop notify
+
+Revision ID: c3f1a8d92e47
+Revises: b5e0c7d3a912
+Create Date: 2026-10-19 18:02:14.519870
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+revision: str = "c3f1a8d92e47"
+down_revision: Union[str, Sequence[str], None] = "b5e0c7d3a912"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _recreate_trigger(keys: list[str]) -> None:
+    arguments = ", ".join(f"'{key}'" for key in keys)
+    op.execute("DROP TRIGGER desktops_notify_change ON deskconn.desktops")
+    op.execute(
+        "CREATE TRIGGER desktops_notify_change AFTER INSERT OR UPDATE OR DELETE ON deskconn.desktops "
+        f"FOR EACH ROW EXECUTE FUNCTION deskconn.notify_row_change({arguments})"
+    )
+
+
+def upgrade() -> None:
+    # the lookup filter learns realms created by other instances from the notification
+    _recreate_trigger(["id", "authid", "user_id", "realm"])
+
+
+def downgrade() -> None:
+    _recreate_trigger(["id", "authid", "user_id"])
@@ -0,0 +1,105 @@
+"""add change log
+
+Revision ID: d8a4c6e1f035
+Revises: c3f1a8d92e47
+Create Date: 2026-10-19 19:11:37.204615
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "d8a4c6e1f035"
+down_revision: Union[str, Sequence[str], None] = "c3f1a8d92e47"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# must match deskconn.invalidation.CHANNEL
+CHANNEL = "deskconn_invalidate"
+
+
+def _replace_functions(log: bool) -> None:
+    # every notification is also written to the change log, in the same transaction
+    publish = "INSERT INTO deskconn.change_log (payload) VALUES (payload);" if log else ""
+    op.execute(
+        f"""
+        CREATE OR REPLACE FUNCTION deskconn.notify_row_change() RETURNS trigger AS $$
+        DECLARE
+            old_keys jsonb;
+            new_keys jsonb;
+            payload text;
+        BEGIN
+            IF TG_OP <> 'INSERT' THEN
+                SELECT jsonb_object_agg(k, to_jsonb(OLD) -> k) INTO old_keys FROM unnest(TG_ARGV) AS k;
+            END IF;
+            IF TG_OP <> 'DELETE' THEN
+                SELECT jsonb_object_agg(k, to_jsonb(NEW) -> k) INTO new_keys FROM unnest(TG_ARGV) AS k;
+            END IF;
+
+            payload := jsonb_build_object(
+                't', TG_TABLE_NAME, 'op', lower(TG_OP), 'old', old_keys, 'new', new_keys
+            )::text;
+            {publish}
+            PERFORM pg_notify('{CHANNEL}', payload);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        f"""
+        CREATE OR REPLACE FUNCTION deskconn.notify_truncate() RETURNS trigger AS $$
+        DECLARE
+            payload text := jsonb_build_object('t', TG_TABLE_NAME, 'op', 'truncate')::text;
+        BEGIN
+            {publish}
+            PERFORM pg_notify('{CHANNEL}', payload);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+
+
+def upgrade() -> None:
+    op.create_table(
+        "change_log",
+        sa.Column("id", sa.BigInteger(), autoincrement=True, nullable=False),
+        sa.Column("xid", sa.BigInteger(), server_default=sa.text("pg_current_xact_id()::text::bigint"), nullable=False),
+        sa.Column("payload", sa.Text(), nullable=False),
+        sa.Column("changed_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        schema="deskconn",
+    )
+    op.create_index(op.f("ix_deskconn_change_log_xid"), "change_log", ["xid"], unique=False, schema="deskconn")
+    op.create_index(
+        op.f("ix_deskconn_change_log_changed_at"), "change_log", ["changed_at"], unique=False, schema="deskconn"
+    )
+
+    _replace_functions(log=True)
+
+    # for bulk loads that bypass the triggers: every cache of every process drops everything, now or on its return
+    op.execute(
+        f"""
+        CREATE FUNCTION deskconn.flush_caches() RETURNS void AS $$
+        DECLARE
+            payload text := '{{"op": "flush"}}';
+        BEGIN
+            INSERT INTO deskconn.change_log (payload) VALUES (payload);
+            PERFORM pg_notify('{CHANNEL}', payload);
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP FUNCTION deskconn.flush_caches()")
+    _replace_functions(log=False)
+
+    op.drop_index(op.f("ix_deskconn_change_log_changed_at"), table_name="change_log", schema="deskconn")
+    op.drop_index(op.f("ix_deskconn_change_log_xid"), table_name="change_log", schema="deskconn")
+    op.drop_table("change_log", schema="deskconn")
@@ -0,0 +1,67 @@
+"""restrict notify triggers to cached columns
+
+Revision ID: e7c4b2f9a160
+Revises: d8a4c6e1f035
+Create Date: 2026-10-20 09:14:52.381604
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+revision: str = "e7c4b2f9a160"
+down_revision: Union[str, Sequence[str], None] = "d8a4c6e1f035"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# table -> columns sent in the payload; users also carry is_verified for the authorization index
+TABLE_KEYS = {
+    "users": ["id", "email", "is_verified"],
+    "principals": ["id", "user_id"],
+    "devices": ["id", "user_id"],
+    "desktops": ["id", "authid", "user_id", "realm"],
+    "desktop_user_access": ["desktop_id", "user_id"],
+    "desktop_organization_access": ["desktop_id", "organization_id"],
+    "organization_members": ["organization_id", "user_id"],
+    "app_versions": ["id", "app_id"],
+}
+
+# table -> columns whose updates notify and are written to the change log; updates of any other column, e.g. an OTP
+# stored on users at every login, change nothing an in-process cache or the authorization index holds
+UPDATE_COLUMNS = {
+    "users": ["id", "email", "name", "password", "salt", "is_verified"],
+    "principals": ["id", "user_id", "public_key", "expires_at"],
+    "devices": ["id", "user_id", "device_id", "public_key"],
+    "desktops": ["id", "authid", "user_id", "realm", "public_key"],
+    "desktop_user_access": ["desktop_id", "user_id", "role"],
+    "desktop_organization_access": ["desktop_id", "organization_id", "role"],
+    "organization_members": ["organization_id", "user_id", "role"],
+    # rollouts are edited in place and every column is served
+    "app_versions": None,
+}
+
+PREVIOUS_TABLE_KEYS = {**TABLE_KEYS, "users": ["id", "email"]}
+
+
+def _recreate_trigger(table: str, keys: list[str], update_columns: list[str] | None) -> None:
+    arguments = ", ".join(f"'{key}'" for key in keys)
+    update = "UPDATE" if update_columns is None else f"UPDATE OF {', '.join(update_columns)}"
+    op.execute(f"DROP TRIGGER {table}_notify_change ON deskconn.{table}")
+    op.execute(
+        f"CREATE TRIGGER {table}_notify_change AFTER INSERT OR {update} OR DELETE ON deskconn.{table} "
+        f"FOR EACH ROW EXECUTE FUNCTION deskconn.notify_row_change({arguments})"
+    )
+
+
+def upgrade() -> None:
+    for table, keys in TABLE_KEYS.items():
+        if UPDATE_COLUMNS[table] is not None or keys != PREVIOUS_TABLE_KEYS[table]:
+            _recreate_trigger(table, keys, UPDATE_COLUMNS[table])
+
+
+def downgrade() -> None:
+    for table, keys in PREVIOUS_TABLE_KEYS.items():
+        if UPDATE_COLUMNS[table] is not None or keys != TABLE_KEYS[table]:
+            _recreate_trigger(table, keys, None)
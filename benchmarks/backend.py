@@ -0,0 +1,278 @@
+"""Micro-benchmarks for the hot query functions of ``deskconn.database.backend``.
+
+    python -m benchmarks.backend --scales small,medium
+    python -m benchmarks.backend --scales small --update-baseline
+
+Each scale loads a generated dataset profile, times every case over a sample of principals and writes
+``EXPLAIN (ANALYZE, BUFFERS)`` output of every statement the case ran next to its timings, so a slower case
+points at the query that changed.
+"""
+
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import statistics
+from pathlib import Path
+from contextlib import nullcontext
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine, async_sessionmaker
+
+from deskconn import models
+from benchmarks import postgres
+from benchmarks.dataset import PROFILES, BENCH_APP, generate, Dataset
+from deskconn.database.backend import user as user_backend
+from deskconn.database.backend import update as update_backend
+from deskconn.database.backend import desktop as desktop_backend
+from deskconn.database.backend import principal as principal_backend
+
+BENCHMARKS_DIR = Path(__file__).parent
+DEFAULT_BASELINE = BENCHMARKS_DIR / "backend_baseline.json"
+DEFAULT_RESULTS_DIR = BENCHMARKS_DIR / "results" / "backend"
+
+# principals each case cycles through, so one row's cache locality does not decide the result
+SAMPLE_SIZE = 50
+
+
+@dataclass
+class Subject:
+    """A desktop owner and their desktop, plus a user without direct access to it."""
+
+    user: models.User
+    desktop: models.Desktop
+    stranger: models.User
+
+
+@dataclass
+class Context:
+    subjects: list[Subject]
+    app: models.App
+
+
+Case = Callable[[AsyncSession, Context, Subject], Awaitable[Any]]
+
+CASES: dict[str, Case] = {
+    "user.get_user_by_email": lambda db, ctx, s: user_backend.get_user_by_email(db, s.user.email),
+    "user.get_user_public_keys": lambda db, ctx, s: user_backend.get_user_public_keys(db, s.user.id),
+    "principal.user_principal_exists": lambda db, ctx, s: principal_backend.user_principal_exists(db, "0" * 64, s.user),
+    "desktop.get_desktop_by_authid": lambda db, ctx, s: desktop_backend.get_desktop_by_authid(db, s.desktop.authid),
+    "desktop.get_desktop_by_realm": lambda db, ctx, s: desktop_backend.get_desktop_by_realm(db, s.desktop.realm),
+    "desktop.get_desktop_by_public_key": lambda db, ctx, s: desktop_backend.get_desktop_by_public_key(
+        db, s.desktop.authid, s.desktop.public_key
+    ),
+    "desktop.has_desktop_access.direct": lambda db, ctx, s: desktop_backend.has_desktop_access(
+        db, s.desktop.id, s.user.id
+    ),
+    # misses the direct grant, so the organization path runs as well
+    "desktop.has_desktop_access.via_org": lambda db, ctx, s: desktop_backend.has_desktop_access(
+        db, s.desktop.id, s.stranger.id
+    ),
+    "desktop.get_user_desktops": lambda db, ctx, s: desktop_backend.get_user_desktops(db, s.user.id),
+    "desktop.get_user_desktops_with_role": lambda db, ctx, s: desktop_backend.get_user_desktops_with_role(
+        db, s.user.id
+    ),
+    "desktop.get_desktop_access_public_keys": lambda db, ctx, s: desktop_backend.get_desktop_access_public_keys(
+        db, s.desktop.id
+    ),
+    "desktop.list_desktop_invites_inbox": lambda db, ctx, s: desktop_backend.list_desktop_invites_inbox(db, s.user),
+    "update.get_app_by_name": lambda db, ctx, s: update_backend.get_app_by_name(db, ctx.app.name),
+    "update.get_latest_app_version": lambda db, ctx, s: update_backend.get_latest_app_version(db, ctx.app.id),
+}
+
+
+async def load_context(sessionmaker: async_sessionmaker, dataset: Dataset, rng: random.Random) -> Context:
+    picked = rng.sample(range(len(dataset.desktops)), min(SAMPLE_SIZE, len(dataset.desktops)))
+    emails = [dataset.users[i].email for i in picked]
+    strangers = [dataset.users[(i + 1) % len(dataset.users)].email for i in picked]
+    authids = [dataset.desktops[i].authid for i in picked]
+
+    async with sessionmaker() as db:
+        users = {
+            u.email: u for u in (await db.scalars(select(models.User).where(models.User.email.in_(emails + strangers))))
+        }
+        desktops = {
+            d.authid: d for d in (await db.scalars(select(models.Desktop).where(models.Desktop.authid.in_(authids))))
+        }
+        app = await update_backend.get_app_by_name(db, BENCH_APP)
+
+    subjects = [
+        Subject(users[email], desktops[authid], users[stranger])
+        for email, authid, stranger in zip(emails, authids, strangers)
+    ]
+
+    return Context(subjects=subjects, app=app)
+
+
+class StatementCapture:
+    def __init__(self, engine: AsyncEngine):
+        self._engine = engine
+        self.statements: list[tuple[str, Any]] = []
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        self.statements.append((statement, parameters))
+
+    def __enter__(self) -> "StatementCapture":
+        event.listen(self._engine.sync_engine, "before_cursor_execute", self._before_cursor_execute)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        event.remove(self._engine.sync_engine, "before_cursor_execute", self._before_cursor_execute)
+
+
+async def explain(engine: AsyncEngine, statements: list[tuple[str, Any]]) -> str:
+    sections = []
+    async with engine.connect() as conn:
+        for statement, parameters in statements:
+            # ANALYZE executes the statement, so only ever explain reads
+            if not statement.lstrip().upper().startswith(("SELECT", "WITH")):
+                continue
+
+            result = await conn.exec_driver_sql(f"EXPLAIN (ANALYZE, BUFFERS) {statement}", parameters)
+            plan = "\n".join(row[0] for row in result)
+            sections.append(f"-- parameters: {parameters!r}\n{statement}\n\n{plan}")
+        await conn.rollback()
+
+    return "\n\n".join(sections) + "\n"
+
+
+async def run_case(
+    case: Case, sessionmaker: async_sessionmaker, engine: AsyncEngine, ctx: Context, iterations: int
+) -> tuple[dict[str, Any], str]:
+    # one untimed pass per subject warms the pool, the statement caches and the buffer cache
+    for subject in ctx.subjects:
+        async with sessionmaker() as db:
+            await case(db, ctx, subject)
+
+    timings = []
+    for i in range(iterations):
+        subject = ctx.subjects[i % len(ctx.subjects)]
+        async with sessionmaker() as db:
+            started = time.perf_counter()
+            await case(db, ctx, subject)
+            timings.append(time.perf_counter() - started)
+
+    with StatementCapture(engine) as capture:
+        async with sessionmaker() as db:
+            await case(db, ctx, ctx.subjects[0])
+
+    timings.sort()
+    stats = {
+        "iterations": iterations,
+        "statements": len(capture.statements),
+        "min": timings[0],
+        "mean": statistics.fmean(timings),
+        "p50": timings[len(timings) // 2],
+        "p95": timings[min(len(timings) - 1, int(0.95 * len(timings)))],
+    }
+
+    return stats, await explain(engine, capture.statements)
+
+
+async def run_scale(database_url: str, scale: str, args) -> dict[str, dict[str, Any]]:
+    dataset = await generate(database_url, PROFILES[scale], args.seed, truncate=True)
+
+    engine = create_async_engine(database_url)
+    sessionmaker = async_sessionmaker(engine, expire_on_commit=False)
+    ctx = await load_context(sessionmaker, dataset, random.Random(args.seed))
+
+    artifacts = args.results_dir / scale
+    artifacts.mkdir(parents=True, exist_ok=True)
+
+    results = {}
+    try:
+        for name, case in CASES.items():
+            if args.case and not any(pattern in name for pattern in args.case):
+                continue
+
+            stats, plans = await run_case(case, sessionmaker, engine, ctx, args.iterations)
+            (artifacts / f"{name}.explain.txt").write_text(plans)
+            results[name] = stats
+            print(
+                f"{scale:<10} {name:<45} p50 {stats['p50'] * 1000:>8.3f}ms  p95 {stats['p95'] * 1000:>8.3f}ms  "
+                f"{stats['statements']} statement(s)"
+            )
+    finally:
+        await engine.dispose()
+
+    (artifacts / "timings.json").write_text(json.dumps(results, indent=2) + "\n")
+
+    return results
+
+
+async def benchmark(args) -> dict[str, dict[str, dict[str, Any]]]:
+    results = {}
+    database = nullcontext(args.database_url) if args.database_url else postgres.disposable_postgres()
+    with database as database_url:
+        if args.database_url:
+            postgres.migrate(database_url)
+
+        for scale in args.scales:
+            results[scale] = await run_scale(database_url, scale, args)
+
+    return results
+
+
+def find_regressions(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    problems = []
+    for scale, cases in results.items():
+        for name, stats in cases.items():
+            expected = baseline.get(scale, {}).get(name)
+            if expected is None:
+                continue
+
+            if stats["statements"] > expected["statements"]:
+                problems.append(f"{scale} {name}: {stats['statements']} statements, baseline {expected['statements']}")
+
+            if stats["p50"] > expected["p50"] * (1 + tolerance):
+                problems.append(
+                    f"{scale} {name}: p50 {stats['p50'] * 1000:.3f}ms, baseline {expected['p50'] * 1000:.3f}ms, "
+                    f"see {scale}/{name}.explain.txt"
+                )
+
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="deskconn backend query micro-benchmarks")
+    parser.add_argument("--scales", type=lambda value: value.split(","), default=["small", "medium"])
+    parser.add_argument("--case", action="append", help="only run cases containing this substring, repeatable")
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--database-url", help="use this disposable database instead of a container, it is truncated")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--results-dir", type=Path, default=DEFAULT_RESULTS_DIR)
+    parser.add_argument("--tolerance", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    unknown = set(args.scales) - set(PROFILES)
+    if unknown:
+        parser.error(f"unknown scales {sorted(unknown)}, choose from {sorted(PROFILES)}")
+
+    results = asyncio.run(benchmark(args))
+
+    baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    if args.update_baseline:
+        for scale, cases in results.items():
+            baseline.setdefault(scale, {}).update(cases)
+        args.baseline.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
+        print(f"\nbaseline written to {args.baseline}")
+        return
+
+    problems = find_regressions(results, baseline, args.tolerance)
+    if problems:
+        print(f"\nregressions against baseline (plans in {args.results_dir}):")
+        for problem in problems:
+            print(f"  {problem}")
+        sys.exit(1)
+
+    print(f"\nno regressions against baseline, artifacts in {args.results_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,448 @@
+"""Synthetic dataset generator, bulk-loading the tables of ``deskconn.models`` with COPY.
+
+    python -m benchmarks.dataset --database-url postgresql+asyncpg://... --profile production --truncate
+
+Ids, keys, emails and realms are derived from row indexes, so the same profile and seed always produce the same
+dataset and benchmarks can address its principals without reading them back.
+"""
+
+import uuid
+import random
+import asyncio
+import hashlib
+import argparse
+import itertools
+from datetime import timedelta
+from dataclasses import dataclass, field, fields, replace
+from typing import Any, Iterable, Iterator
+
+import asyncpg
+
+from deskconn import models, helpers
+
+BENCH_APP = "deskconn"
+BENCH_PASSWORD = "benchmark-password"
+APP_VERSIONS = ("0.1.0", "0.2.0", "0.3.0", "0.4.0")
+
+# rows per COPY; bounds memory while keeping round trips negligible
+COPY_BATCH = 50_000
+
+# namespaces for index-derived ids, so rows of different tables never collide
+_USER, _DESKTOP, _PRINCIPAL, _ORGANIZATION, _MEMBER, _USER_ACCESS, _ORG_ACCESS, _INVITE, _APP = range(1, 10)
+
+
+@dataclass
+class Profile:
+    users: int
+    # the first `desktops` users own one desktop each
+    desktops: int
+    # principals per user follow a geometric distribution with this mean, and the first never expires
+    principals_per_user: float = 2.0
+    expired_principal_fraction: float = 0.3
+    organizations: int = 0
+    # organizations with at least 10k members, on top of the heavy-tailed sizes of the rest
+    large_organizations: int = 0
+    large_organization_members: int = 10_000
+    organization_size_alpha: float = 1.5
+    max_organization_members: int = 2_000
+    # fraction of desktops shared with organizations, each with up to this many; bigger organizations
+    # are picked proportionally more often, which concentrates access rows on them
+    org_shared_desktop_fraction: float = 0.5
+    orgs_per_shared_desktop: int = 3
+    # extra users each desktop is shared with, geometric with this mean
+    shared_users_per_desktop: float = 1.0
+    # pending invites that expired without being answered
+    stale_desktop_invites: int = 0
+    stale_organization_invites: int = 0
+
+
+PROFILES: dict[str, Profile] = {
+    "small": Profile(users=2_000, desktops=500, organizations=20, max_organization_members=200),
+    "medium": Profile(
+        users=200_000,
+        desktops=30_000,
+        organizations=2_000,
+        large_organizations=1,
+        stale_desktop_invites=20_000,
+        stale_organization_invites=10_000,
+    ),
+    "production": Profile(
+        users=2_000_000,
+        desktops=300_000,
+        principals_per_user=3.0,
+        organizations=20_000,
+        large_organizations=5,
+        large_organization_members=15_000,
+        stale_desktop_invites=200_000,
+        stale_organization_invites=100_000,
+    ),
+}
+
+
+def _id(namespace: int, index: int) -> uuid.UUID:
+    return uuid.UUID(int=(namespace << 96) | index, version=4)
+
+
+def _key(kind: str, index: int, seed: int) -> str:
+    return hashlib.sha256(f"{seed}:{kind}:{index}".encode()).hexdigest()
+
+
+def user_email(index: int) -> str:
+    return f"bench-user-{index}@example.com"
+
+
+def user_public_key(index: int, seed: int = 0, principal: int = 0) -> str:
+    return _key(f"principal:{principal}", index, seed)
+
+
+def desktop_authid(index: int) -> str:
+    return f"bench-desktop-{index}"
+
+
+def desktop_public_key(index: int, seed: int = 0) -> str:
+    return _key("desktop", index, seed)
+
+
+def desktop_realm(index: int) -> str:
+    return str(_id(_DESKTOP, index + (1 << 48)))
+
+
+def _geometric(rng: random.Random, mean: float) -> int:
+    """Number of extra events with the given mean, at least 0."""
+    if mean <= 0:
+        return 0
+
+    p = 1 / (1 + mean)
+    count = 0
+    while rng.random() > p:
+        count += 1
+
+    return count
+
+
+@dataclass
+class BenchUser:
+    email: str
+    public_key: str
+
+
+@dataclass
+class BenchDesktop:
+    authid: str
+    realm: str
+    public_key: str
+    owner: str
+
+
+@dataclass
+class Dataset:
+    """Principals of a generated dataset that benchmarks drive traffic as: every desktop and its owner."""
+
+    users: list[BenchUser] = field(default_factory=list)
+    desktops: list[BenchDesktop] = field(default_factory=list)
+    app: str = BENCH_APP
+    versions: tuple[str, ...] = APP_VERSIONS
+
+    @classmethod
+    def of(cls, profile: Profile, seed: int = 0) -> "Dataset":
+        dataset = cls()
+        for i in range(profile.desktops):
+            dataset.users.append(BenchUser(email=user_email(i), public_key=user_public_key(i, seed)))
+            dataset.desktops.append(
+                BenchDesktop(
+                    authid=desktop_authid(i),
+                    realm=desktop_realm(i),
+                    public_key=desktop_public_key(i, seed),
+                    owner=user_email(i),
+                )
+            )
+
+        return dataset
+
+
+class Generator:
+    def __init__(self, profile: Profile, seed: int = 0):
+        if profile.desktops > profile.users:
+            raise ValueError("a profile cannot have more desktops than users")
+
+        self.profile = profile
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.now = helpers.utcnow()
+        self.organization_sizes = self._organization_sizes()
+
+    def _organization_sizes(self) -> list[int]:
+        p = self.profile
+        sizes = [p.large_organization_members] * p.large_organizations
+        for _ in range(p.organizations - p.large_organizations):
+            size = int(2 * self.rng.paretovariate(p.organization_size_alpha))
+            sizes.append(min(size, p.max_organization_members))
+
+        return [min(size, p.users) for size in sizes]
+
+    def _ago(self, max_days: int) -> Any:
+        return self.now - timedelta(seconds=self.rng.randrange(max_days * 86400))
+
+    def users(self) -> Iterator[dict[str, Any]]:
+        # hashing dominates generation time and every user shares the password anyway
+        password, salt = helpers.hash_password_and_generate_salt(BENCH_PASSWORD)
+        for i in range(self.profile.users):
+            yield {
+                "id": _id(_USER, i),
+                "email": user_email(i),
+                "password": password,
+                "name": f"Bench User {i}",
+                "salt": salt,
+                "is_verified": True,
+                "created_at": self._ago(720),
+            }
+
+    def principals(self) -> Iterator[dict[str, Any]]:
+        row = itertools.count()
+        for i in range(self.profile.users):
+            for principal in range(1 + _geometric(self.rng, self.profile.principals_per_user - 1)):
+                expired = principal > 0 and self.rng.random() < self.profile.expired_principal_fraction
+                yield {
+                    "id": _id(_PRINCIPAL, next(row)),
+                    "public_key": user_public_key(i, self.seed, principal),
+                    "created_at": self._ago(365),
+                    "expires_at": self.now + timedelta(days=-self.rng.randrange(1, 365) if expired else 365),
+                    "user_id": _id(_USER, i),
+                }
+
+    def desktops(self) -> Iterator[dict[str, Any]]:
+        for i in range(self.profile.desktops):
+            yield {
+                "id": _id(_DESKTOP, i),
+                "authid": desktop_authid(i),
+                "name": f"desktop-{i}",
+                "public_key": desktop_public_key(i, self.seed),
+                "realm": desktop_realm(i),
+                "created_at": self._ago(365),
+                "user_id": _id(_USER, i),
+            }
+
+    def desktop_user_access(self) -> Iterator[dict[str, Any]]:
+        row = itertools.count()
+        for i in range(self.profile.desktops):
+            shared = {i}
+            for _ in range(_geometric(self.rng, self.profile.shared_users_per_desktop)):
+                shared.add(self.rng.randrange(self.profile.users))
+
+            for user in sorted(shared):
+                yield {
+                    "id": _id(_USER_ACCESS, next(row)),
+                    "role": models.DesktopAccessRole.owner.value
+                    if user == i
+                    else models.DesktopAccessRole.member.value,
+                    "desktop_id": _id(_DESKTOP, i),
+                    "user_id": _id(_USER, user),
+                    "created_at": self._ago(365),
+                }
+
+    def organizations(self) -> Iterator[dict[str, Any]]:
+        for i in range(len(self.organization_sizes)):
+            yield {
+                "id": _id(_ORGANIZATION, i),
+                "name": f"Bench Organization {i}",
+                "created_at": self._ago(720),
+                "owner_id": _id(_USER, self._organization_owner(i)),
+            }
+
+    def _organization_owner(self, index: int) -> int:
+        return (index * 7919) % self.profile.users
+
+    def organization_members(self) -> Iterator[dict[str, Any]]:
+        row = itertools.count()
+        for i, size in enumerate(self.organization_sizes):
+            owner = self._organization_owner(i)
+            members = set(self.rng.sample(range(self.profile.users), size)) - {owner}
+            for user in itertools.chain([owner], sorted(members)):
+                if user == owner:
+                    role = models.OrganizationMemberRole.owner
+                elif self.rng.random() < 0.05:
+                    role = models.OrganizationMemberRole.admin
+                else:
+                    role = models.OrganizationMemberRole.member
+
+                yield {
+                    "id": _id(_MEMBER, next(row)),
+                    "role": role.value,
+                    "created_at": self._ago(720),
+                    "organization_id": _id(_ORGANIZATION, i),
+                    "user_id": _id(_USER, user),
+                }
+
+    def desktop_organization_access(self) -> Iterator[dict[str, Any]]:
+        if not self.organization_sizes:
+            return
+
+        row = itertools.count()
+        organizations = range(len(self.organization_sizes))
+        cum_weights = list(itertools.accumulate(self.organization_sizes))
+        for i in range(self.profile.desktops):
+            if self.rng.random() >= self.profile.org_shared_desktop_fraction:
+                continue
+
+            count = self.rng.randint(1, self.profile.orgs_per_shared_desktop)
+            for organization in sorted(set(self.rng.choices(organizations, cum_weights=cum_weights, k=count))):
+                yield {
+                    "id": _id(_ORG_ACCESS, next(row)),
+                    "role": models.DesktopAccessRole.member.value,
+                    "desktop_id": _id(_DESKTOP, i),
+                    "organization_id": _id(_ORGANIZATION, organization),
+                    "created_at": self._ago(365),
+                }
+
+    def _stale_invite(self) -> dict[str, Any]:
+        created_at = self._ago(365)
+        return {
+            "status": models.InvitationStatus.pending.value,
+            "created_at": created_at,
+            "expires_at": created_at + timedelta(days=7),
+        }
+
+    def desktop_invites(self) -> Iterator[dict[str, Any]]:
+        if self.profile.desktops == 0:
+            return
+
+        for i in range(self.profile.stale_desktop_invites):
+            desktop = self.rng.randrange(self.profile.desktops)
+            yield {
+                "id": _id(_INVITE, i),
+                "role": models.DesktopAccessRole.member.value,
+                "desktop_id": _id(_DESKTOP, desktop),
+                "inviter_id": _id(_USER, desktop),
+                "invitee_user_id": _id(_USER, self.rng.randrange(self.profile.users)),
+                **self._stale_invite(),
+            }
+
+    def organization_invites(self) -> Iterator[dict[str, Any]]:
+        if not self.organization_sizes:
+            return
+
+        for i in range(self.profile.stale_organization_invites):
+            organization = self.rng.randrange(len(self.organization_sizes))
+            yield {
+                "id": _id(_INVITE, (1 << 48) + i),
+                "role": models.OrganizationInviteRole.member.value,
+                "organization_id": _id(_ORGANIZATION, organization),
+                "inviter_id": _id(_USER, self._organization_owner(organization)),
+                "invitee_id": _id(_USER, self.rng.randrange(self.profile.users)),
+                **self._stale_invite(),
+            }
+
+    def apps(self) -> Iterator[dict[str, Any]]:
+        yield {"id": _id(_APP, 0), "name": BENCH_APP, "last_updated": self.now, "created_at": self.now}
+
+    def app_versions(self) -> Iterator[dict[str, Any]]:
+        for i, version in enumerate(APP_VERSIONS):
+            yield {
+                "id": _id(_APP, i + 1),
+                "version": version,
+                "checksum": _key("app", i, self.seed),
+                "size": 50_000_000,
+                "released_at": self.now - timedelta(days=len(APP_VERSIONS) - i),
+                "rollout_percentage": 100,
+                "app_id": _id(_APP, 0),
+            }
+
+    def tables(self) -> list[tuple[type[models.Base], Iterable[dict[str, Any]]]]:
+        # in foreign key order
+        return [
+            (models.User, self.users()),
+            (models.Principal, self.principals()),
+            (models.Desktop, self.desktops()),
+            (models.DesktopUserAccess, self.desktop_user_access()),
+            (models.Organization, self.organizations()),
+            (models.OrganizationMember, self.organization_members()),
+            (models.DesktopOrganizationAccess, self.desktop_organization_access()),
+            (models.DesktopInvite, self.desktop_invites()),
+            (models.OrganizationInvite, self.organization_invites()),
+            (models.App, self.apps()),
+            (models.AppVersion, self.app_versions()),
+        ]
+
+
+def asyncpg_dsn(database_url: str) -> str:
+    return database_url.replace("postgresql+asyncpg://", "postgresql://", 1)
+
+
+async def copy_rows(conn: asyncpg.Connection, model: type[models.Base], rows: Iterable[dict[str, Any]]) -> int:
+    table = model.__table__
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        return 0
+
+    unknown = set(first) - set(table.columns.keys())
+    if unknown:
+        raise ValueError(f"columns {sorted(unknown)} do not exist in table '{table.name}'")
+
+    columns = list(first)
+    count = 0
+    for batch in itertools.batched(itertools.chain([first], rows), COPY_BATCH):
+        await conn.copy_records_to_table(
+            table.name,
+            schema_name=table.schema,
+            columns=columns,
+            records=[tuple(row[column] for column in columns) for row in batch],
+        )
+        count += len(batch)
+
+    return count
+
+
+async def generate(database_url: str, profile: Profile, seed: int = 0, truncate: bool = False) -> Dataset:
+    """Loads the profile into a migrated database and returns the principals benchmarks can drive."""
+    generator = Generator(profile, seed)
+    conn = await asyncpg.connect(asyncpg_dsn(database_url))
+    try:
+        tables = [f"{models.DESKCONN_SCHEMA}.{model.__tablename__}" for model, _ in generator.tables()]
+        async with conn.transaction():
+            # the invalidation triggers would queue a notification per copied row
+            for table in tables:
+                await conn.execute(f"ALTER TABLE {table} DISABLE TRIGGER USER")
+
+            if truncate:
+                await conn.execute(f"TRUNCATE {', '.join(tables)} CASCADE")
+
+            for model, rows in generator.tables():
+                count = await copy_rows(conn, model, rows)
+                print(f"loaded {count} rows into {model.__tablename__}")
+
+            for table in tables:
+                await conn.execute(f"ALTER TABLE {table} ENABLE TRIGGER USER")
+
+            # running services flush their caches instead, and so do stopped ones when they catch up
+            await conn.execute(f"SELECT {models.DESKCONN_SCHEMA}.flush_caches()")
+
+        for model, _ in generator.tables():
+            await conn.execute(f"ANALYZE {models.DESKCONN_SCHEMA}.{model.__tablename__}")
+    finally:
+        await conn.close()
+
+    return Dataset.of(profile, seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="bulk-load a synthetic deskconn dataset")
+    parser.add_argument("--database-url", required=True)
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="small")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--truncate", action="store_true", help="empty the generated tables first")
+    # every numeric profile field can be overridden, e.g. --users 5000000 --large-organizations 10
+    for profile_field in fields(Profile):
+        parser.add_argument(
+            f"--{profile_field.name.replace('_', '-')}", type=type(getattr(PROFILES["small"], profile_field.name))
+        )
+    args = parser.parse_args()
+
+    overrides = {f.name: getattr(args, f.name) for f in fields(Profile) if getattr(args, f.name) is not None}
+    profile = replace(PROFILES[args.profile], **overrides)
+
+    asyncio.run(generate(args.database_url, profile, args.seed, args.truncate))
+
+
+if __name__ == "__main__":
+    main()
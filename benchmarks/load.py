@@ -0,0 +1,354 @@
+"""End-to-end load benchmark: runs main:app against a local router stand-in and a disposable Postgres.
+
+python -m benchmarks.load --mix default --duration 30
+python -m benchmarks.load --mix default --update-baseline
+
+Latency and throughput depend on the machine, so the baseline is recorded on the host that runs the check, in the
+git-ignored results directory, and a baseline from another host or with other options is not compared against.
+"""
+
+import os
+import sys
+import platform
+import json
+import time
+import random
+import asyncio
+import argparse
+import subprocess
+from pathlib import Path
+from contextlib import nullcontext
+from collections import defaultdict
+
+from xconn import AsyncClient
+from xconn.exception import ApplicationError
+from xconn.async_session import AsyncSession
+from wampproto.auth import AnonymousAuthenticator
+
+from deskconn import helpers
+from benchmarks import postgres, workloads
+from benchmarks.dataset import generate, Dataset, PROFILES
+from benchmarks.router import AUTHEXTRA_AUTHROLE
+
+PROCEDURE_METRICS = "io.xconn.deskconn.account.metrics.get"
+SERVICE_AUTHID = "deskconn-account-service"
+ROUTER_AUTHID = "deskconn-router"
+
+BENCHMARKS_DIR = Path(__file__).parent
+ROOT_DIR = BENCHMARKS_DIR.parent
+DEFAULT_RESULTS_DIR = BENCHMARKS_DIR / "results"
+DEFAULT_BASELINE = DEFAULT_RESULTS_DIR / "baseline.json"
+
+# report fields a baseline has to share with a run before their numbers are compared
+COMPARABLE_FIELDS = ("host", "profile", "concurrency")
+
+
+def host_fingerprint() -> dict:
+    return {
+        "node": platform.node(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "python": platform.python_version(),
+    }
+
+
+def percentile(samples: list[float], q: float) -> float:
+    if not samples:
+        return 0.0
+
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Recorder:
+    def __init__(self):
+        self.enabled = False
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    async def call(self, uri: str, session: AsyncSession, args: list) -> None:
+        started = time.perf_counter()
+        try:
+            await session.call(uri, args)
+        except ApplicationError as e:
+            if self.enabled:
+                self.errors[uri][e.message] += 1
+            return
+
+        if self.enabled:
+            self.latencies[uri].append(time.perf_counter() - started)
+
+
+async def connect(url: str, authid: str, authrole: str) -> AsyncSession:
+    client = AsyncClient(authenticator=AnonymousAuthenticator(authid, {AUTHEXTRA_AUTHROLE: authrole}))
+
+    return await client.connect(url, helpers.CLOUD_REALM)
+
+
+async def wait_for_router(url: str, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            await (await connect(url, "bench-probe", helpers.ROLE_USER)).leave()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.2)
+
+
+async def wait_for_service(admin: AsyncSession, service: subprocess.Popen, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if service.poll() is not None:
+            raise RuntimeError(f"service exited with code {service.returncode} before registering its procedures")
+
+        try:
+            await admin.call(PROCEDURE_METRICS)
+            return
+        except ApplicationError:
+            await asyncio.sleep(0.5)
+
+    raise TimeoutError(f"service did not register its procedures within {timeout} seconds")
+
+
+async def fetch_db_statements(admin: AsyncSession) -> dict[str, tuple[int, int]]:
+    result = await admin.call(PROCEDURE_METRICS)
+    procedures = result.args[0]["procedures"]
+
+    return {uri: (stats["calls"], stats["db_statements"]) for uri, stats in procedures.items()}
+
+
+async def drive(workers: list[workloads.Worker], dataset: Dataset, mix: dict[str, int], recorder: Recorder, seconds):
+    choose = workloads.pick(mix)
+    deadline = time.monotonic() + seconds
+
+    async def run(worker: workloads.Worker):
+        while time.monotonic() < deadline:
+            await choose()(worker, dataset, recorder.call)
+
+    await asyncio.gather(*(run(worker) for worker in workers))
+
+
+def build_report(args, recorder: Recorder, before: dict, after: dict, elapsed: float) -> dict:
+    procedures = {}
+    for uri in sorted(set(recorder.latencies) | set(recorder.errors)):
+        samples = recorder.latencies.get(uri, [])
+        calls_before, statements_before = before.get(uri, (0, 0))
+        calls_after, statements_after = after.get(uri, (0, 0))
+        served = calls_after - calls_before
+
+        procedures[uri] = {
+            "calls": len(samples),
+            "errors": dict(recorder.errors.get(uri, {})),
+            "throughput": len(samples) / elapsed,
+            "p50": percentile(samples, 0.50),
+            "p95": percentile(samples, 0.95),
+            "p99": percentile(samples, 0.99),
+            "db_statements_per_call": (statements_after - statements_before) / served if served else 0.0,
+        }
+
+    return {
+        "mix": args.mix,
+        "duration": elapsed,
+        "concurrency": args.concurrency,
+        "profile": args.profile,
+        "host": host_fingerprint(),
+        "throughput": sum(len(samples) for samples in recorder.latencies.values()) / elapsed,
+        "procedures": procedures,
+    }
+
+
+def incomparable_fields(report: dict, baseline: dict) -> list[str]:
+    return [field for field in COMPARABLE_FIELDS if baseline.get(field) != report[field]]
+
+
+def find_regressions(report: dict, baseline: dict, latency_tolerance: float, throughput_tolerance: float) -> list[str]:
+    problems = []
+    if report["throughput"] < baseline["throughput"] * (1 - throughput_tolerance):
+        problems.append(f"throughput {report['throughput']:.1f}/s, baseline {baseline['throughput']:.1f}/s")
+
+    for uri, expected in baseline["procedures"].items():
+        actual = report["procedures"].get(uri)
+        if actual is None:
+            problems.append(f"{uri}: not called")
+            continue
+
+        for quantile in ("p95", "p99"):
+            if actual[quantile] > expected[quantile] * (1 + latency_tolerance):
+                problems.append(
+                    f"{uri}: {quantile} {actual[quantile] * 1000:.2f}ms, baseline {expected[quantile] * 1000:.2f}ms"
+                )
+
+        # statement counts are deterministic, so any increase is a regression
+        if actual["db_statements_per_call"] > expected["db_statements_per_call"] + 0.01:
+            problems.append(
+                f"{uri}: {actual['db_statements_per_call']:.2f} statements per call, "
+                f"baseline {expected['db_statements_per_call']:.2f}"
+            )
+
+    for uri, stats in report["procedures"].items():
+        if stats["errors"]:
+            problems.append(f"{uri}: errors {stats['errors']}")
+
+    return problems
+
+
+def print_report(report: dict) -> None:
+    print(f"\nmix={report['mix']} concurrency={report['concurrency']} throughput={report['throughput']:.1f} calls/s")
+    print(f"{'procedure':<50} {'calls':>8} {'calls/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'stmts':>6}")
+    for uri, stats in report["procedures"].items():
+        print(
+            f"{uri:<50} {stats['calls']:>8} {stats['throughput']:>9.1f} {stats['p50'] * 1000:>8.2f} "
+            f"{stats['p95'] * 1000:>8.2f} {stats['p99'] * 1000:>8.2f} {stats['db_statements_per_call']:>6.2f}"
+        )
+
+
+async def benchmark(args) -> dict:
+    router_url = f"ws://127.0.0.1:{args.router_port}/ws"
+    # router, service and load generator each get their own process so none of them skews the others
+    router = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.router", "--port", str(args.router_port)], cwd=ROOT_DIR
+    )
+    try:
+        await wait_for_router(router_url)
+        return await run_against(args, router_url)
+    finally:
+        router.terminate()
+        router.wait()
+
+
+async def run_against(args, router_url: str) -> dict:
+    database = nullcontext(args.database_url) if args.database_url else postgres.disposable_postgres()
+    with database as database_url:
+        if args.database_url:
+            postgres.migrate(database_url)
+
+        profile = PROFILES[args.profile]
+        if args.no_generate:
+            dataset = Dataset.of(profile, args.seed)
+        else:
+            dataset = await generate(database_url, profile, args.seed)
+
+        args.results_dir.mkdir(parents=True, exist_ok=True)
+        service_log = open(args.results_dir / "service.log", "w")
+        service = subprocess.Popen(
+            [args.xcorn, "main:app", "--url", router_url, "--realm", helpers.CLOUD_REALM, "--authid", SERVICE_AUTHID],
+            env={
+                **os.environ,
+                "DESKCONN_DATABASE_URL": database_url,
+                "X_DEBUG": "true",
+                # every benchmark worker signs up many accounts from one session, measure the service not the limiter
+                "DESKCONN_RATE_LIMIT_SESSION": "1000000000/1",
+                # the workers outnumber the pool on purpose; calls queue for a slot instead of being shed
+                "DESKCONN_ADMISSION_WAIT_MS": "60000",
+            },
+            cwd=ROOT_DIR,
+            stdout=service_log,
+            stderr=subprocess.STDOUT,
+        )
+        try:
+            admin = await connect(router_url, "bench-admin", helpers.ROLE_ADMIN)
+            await wait_for_service(admin, service)
+
+            router_session = await connect(router_url, ROUTER_AUTHID, "router")
+            workers = []
+            for i in range(args.concurrency):
+                user, desktop = dataset.users[i % len(dataset.users)], dataset.desktops[i % len(dataset.desktops)]
+                workers.append(
+                    workloads.Worker(
+                        user=user,
+                        desktop=desktop,
+                        user_session=await connect(router_url, user.email, helpers.ROLE_USER),
+                        desktop_session=await connect(
+                            router_url, desktop.authid, helpers.ROLE_DESKTOP.format(authid=desktop.authid)
+                        ),
+                        router_session=router_session,
+                    )
+                )
+
+            mix = workloads.MIXES[args.mix]
+            recorder = Recorder()
+            await drive(workers, dataset, mix, recorder, args.warmup)
+
+            before = await fetch_db_statements(admin)
+            recorder.enabled = True
+            started = time.monotonic()
+            await drive(workers, dataset, mix, recorder, args.duration)
+            elapsed = time.monotonic() - started
+            recorder.enabled = False
+            after = await fetch_db_statements(admin)
+        finally:
+            service.terminate()
+            service.wait()
+            service_log.close()
+
+    return build_report(args, recorder, before, after, elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="deskconn account service load benchmark")
+    parser.add_argument("--mix", choices=sorted(workloads.MIXES), default="default")
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--warmup", type=float, default=5)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="small", help="dataset to generate and drive")
+    parser.add_argument("--router-port", type=int, default=18080)
+    parser.add_argument("--database-url", help="use this (empty) database instead of a disposable container")
+    parser.add_argument(
+        "--no-generate",
+        action="store_true",
+        help="the database already holds --profile generated with --seed, e.g. a production-sized one",
+    )
+    parser.add_argument("--xcorn", default=str(Path(sys.executable).parent / "xcorn"))
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--results-dir", type=Path, default=DEFAULT_RESULTS_DIR)
+    parser.add_argument("--latency-tolerance", type=float, default=0.25)
+    parser.add_argument("--throughput-tolerance", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.no_generate and not args.database_url:
+        parser.error("--no-generate requires --database-url")
+
+    random.seed(args.seed)
+    report = asyncio.run(benchmark(args))
+    print_report(report)
+
+    (args.results_dir / f"{args.mix}.json").write_text(json.dumps(report, indent=2))
+
+    baselines = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    if args.update_baseline:
+        baselines[args.mix] = report
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(baselines, indent=2, sort_keys=True) + "\n")
+        print(f"\nbaseline for mix '{args.mix}' written to {args.baseline}")
+        return
+
+    if args.mix not in baselines:
+        # a check without a baseline would pass whatever the numbers are
+        print(f"\nno baseline for mix '{args.mix}' in {args.baseline}, run with --update-baseline to record one")
+        sys.exit(1)
+
+    # numbers from another machine or load shape would flag or hide regressions at random
+    mismatched = incomparable_fields(report, baselines[args.mix])
+    if mismatched:
+        print(
+            f"\nthe baseline for mix '{args.mix}' in {args.baseline} differs in {', '.join(mismatched)}, "
+            "run with --update-baseline on this host to record a comparable one"
+        )
+        sys.exit(1)
+
+    problems = find_regressions(report, baselines[args.mix], args.latency_tolerance, args.throughput_tolerance)
+    if problems:
+        print("\nregressions against baseline:")
+        for problem in problems:
+            print(f"  {problem}")
+        sys.exit(1)
+
+    print("\nno regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
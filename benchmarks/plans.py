@@ -0,0 +1,177 @@
+"""Query-plan regression snapshots for a curated set of backend queries.
+
+    python -m benchmarks.plans --update   # after an intended index or query change, commit benchmarks/plans/
+    python -m benchmarks.plans            # compare against the committed snapshots
+
+Plans come from ``EXPLAIN (FORMAT JSON)`` against a generated dataset, so estimates depend on the profile, the seed
+and ANALYZE sampling; keep the first two fixed and treat small cost drift as noise (``--cost-tolerance``). Losing an
+index scan or gaining a sequential scan always fails.
+"""
+
+import sys
+import json
+import random
+import asyncio
+import argparse
+from pathlib import Path
+from contextlib import nullcontext
+from typing import Any
+
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine, async_sessionmaker
+
+from benchmarks import postgres
+from benchmarks.dataset import PROFILES, generate
+from benchmarks.backend import CASES, StatementCapture, load_context
+
+SNAPSHOT_DIR = Path(__file__).parent / "plans"
+
+# queries whose plans are pinned; names refer to benchmarks.backend.CASES
+PLAN_CASES = (
+    "user.get_user_by_email",
+    "user.get_user_public_keys",
+    "principal.user_principal_exists",
+    "desktop.get_desktop_by_authid",
+    "desktop.has_desktop_access.via_org",
+    "desktop.get_user_desktops",
+    "desktop.get_user_desktops_with_role",
+    "desktop.get_desktop_access_public_keys",
+    "desktop.list_desktop_invites_inbox",
+    "update.get_latest_app_version",
+)
+
+INDEX_SCANS = {"Index Scan", "Index Only Scan", "Bitmap Index Scan"}
+
+
+def summarize(node: dict[str, Any]) -> dict[str, Any]:
+    """Keeps the parts of a plan node that identify its shape and estimated cost."""
+    summary = {"node": node["Node Type"], "cost": node["Total Cost"], "rows": node["Plan Rows"]}
+    for key, name in (("Relation Name", "relation"), ("Index Name", "index"), ("Join Type", "join")):
+        if key in node:
+            summary[name] = node[key]
+
+    children = [summarize(child) for child in node.get("Plans", [])]
+    if children:
+        summary["plans"] = children
+
+    return summary
+
+
+def walk(summary: dict[str, Any]):
+    yield summary
+    for child in summary.get("plans", []):
+        yield from walk(child)
+
+
+def shape(summary: dict[str, Any]) -> list[str]:
+    return [f"{node['node']}({node.get('relation') or node.get('index') or ''})" for node in walk(summary)]
+
+
+def compare(expected: dict[str, Any], actual: dict[str, Any], cost_tolerance: float) -> list[str]:
+    problems = []
+
+    indexes_before = {node["index"] for node in walk(expected) if node["node"] in INDEX_SCANS}
+    indexes_now = {node["index"] for node in walk(actual) if node["node"] in INDEX_SCANS}
+    for index in sorted(indexes_before - indexes_now):
+        problems.append(f"no longer uses index {index}")
+
+    seq_before = {node["relation"] for node in walk(expected) if node["node"] == "Seq Scan"}
+    seq_now = {node["relation"] for node in walk(actual) if node["node"] == "Seq Scan"}
+    for relation in sorted(seq_now - seq_before):
+        problems.append(f"now sequentially scans {relation}")
+
+    if not problems and shape(expected) != shape(actual):
+        problems.append(
+            f"plan changed:\n      was {' -> '.join(shape(expected))}\n      now {' -> '.join(shape(actual))}"
+        )
+
+    if actual["cost"] > expected["cost"] * (1 + cost_tolerance):
+        problems.append(f"estimated cost {actual['cost']:.2f}, snapshot {expected['cost']:.2f}")
+
+    return problems
+
+
+async def capture_plans(engine: AsyncEngine, ctx, name: str) -> list[dict[str, Any]]:
+    sessionmaker = async_sessionmaker(engine, expire_on_commit=False)
+    with StatementCapture(engine) as capture:
+        async with sessionmaker() as db:
+            await CASES[name](db, ctx, ctx.subjects[0])
+
+    plans = []
+    async with engine.connect() as conn:
+        for statement, parameters in capture.statements:
+            result = await conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters)
+            plan = result.scalar()
+            plan = json.loads(plan) if isinstance(plan, str) else plan
+            plans.append({"statement": statement, "plan": summarize(plan[0]["Plan"])})
+
+    return plans
+
+
+async def collect(args) -> dict[str, list[dict[str, Any]]]:
+    database = nullcontext(args.database_url) if args.database_url else postgres.disposable_postgres()
+    with database as database_url:
+        if args.database_url:
+            postgres.migrate(database_url)
+
+        dataset = await generate(database_url, PROFILES[args.profile], args.seed, truncate=True)
+        engine = create_async_engine(database_url)
+        try:
+            ctx = await load_context(
+                async_sessionmaker(engine, expire_on_commit=False), dataset, random.Random(args.seed)
+            )
+
+            return {name: await capture_plans(engine, ctx, name) for name in PLAN_CASES}
+        finally:
+            await engine.dispose()
+
+
+def check(captured: dict[str, list[dict[str, Any]]], cost_tolerance: float) -> list[str]:
+    problems = []
+    for name, plans in captured.items():
+        path = SNAPSHOT_DIR / f"{name}.json"
+        if not path.exists():
+            problems.append(f"{name}: no snapshot, run with --update to record one")
+            continue
+
+        snapshot = json.loads(path.read_text())
+        if len(snapshot) != len(plans):
+            problems.append(f"{name}: runs {len(plans)} statements, snapshot has {len(snapshot)}")
+            continue
+
+        for i, (expected, actual) in enumerate(zip(snapshot, plans)):
+            for problem in compare(expected["plan"], actual["plan"], cost_tolerance):
+                problems.append(f"{name} statement {i + 1}: {problem}")
+
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="compare backend query plans against committed snapshots")
+    parser.add_argument("--update", action="store_true", help="rewrite the snapshots")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="medium")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--database-url", help="use this disposable database instead of a container, it is truncated")
+    parser.add_argument("--cost-tolerance", type=float, default=1.0)
+    args = parser.parse_args()
+
+    captured = asyncio.run(collect(args))
+
+    if args.update:
+        SNAPSHOT_DIR.mkdir(exist_ok=True)
+        for name, plans in captured.items():
+            (SNAPSHOT_DIR / f"{name}.json").write_text(json.dumps(plans, indent=2) + "\n")
+        print(f"wrote {len(captured)} plan snapshots to {SNAPSHOT_DIR}")
+        return
+
+    problems = check(captured, args.cost_tolerance)
+    if problems:
+        print("query plan regressions:")
+        for problem in problems:
+            print(f"  {problem}")
+        sys.exit(1)
+
+    print("query plans match snapshots")
+
+
+if __name__ == "__main__":
+    main()
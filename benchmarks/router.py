@@ -0,0 +1,72 @@
+import asyncio
+import argparse
+
+from wampproto import messages
+from wampproto.auth import IServerAuthenticator, Request, Response
+from xconn import Router, Server
+from xconn.realm import Realm
+
+from deskconn import helpers
+
+# authrole requested by a benchmark client through its HELLO authextra
+AUTHEXTRA_AUTHROLE = "authrole"
+
+
+class TrustingAuthenticator(IServerAuthenticator):
+    """Admits every anonymous HELLO with the authid and authrole the client asks for.
+
+    Stands in for the deskconn router's authentication, which calls back into this service; the
+    benchmark drives those verification procedures directly instead.
+    """
+
+    def methods(self) -> list[str]:
+        return ["anonymous"]
+
+    def authenticate(self, request: Request) -> Response:
+        authrole = (request.auth_extra or {}).get(AUTHEXTRA_AUTHROLE, helpers.ROLE_USER)
+
+        return Response(request.authid, authrole)
+
+
+class DisclosingRealm(Realm):
+    """Realm that discloses the caller to callees, as the deskconn router does."""
+
+    async def receive_message(self, session_id: int, msg: messages.Message):
+        if msg.TYPE != messages.Call.TYPE:
+            return await super().receive_message(session_id, msg)
+
+        recipient = self.dealer.receive_message(session_id, msg)
+        if isinstance(recipient.message, messages.Invocation):
+            caller = self.clients[session_id]
+            recipient.message.details.update(
+                {"caller": session_id, "caller_authid": caller.authid, "caller_authrole": caller.authrole}
+            )
+
+        await self.clients[recipient.recipient].send_message(recipient.message)
+
+
+class DisclosingRouter(Router):
+    def add_realm(self, name: str):
+        self.realms[name] = DisclosingRealm()
+
+
+async def start_router(host: str, port: int, realm: str = helpers.CLOUD_REALM) -> None:
+    router = DisclosingRouter()
+    router.add_realm(realm)
+
+    await Server(router, TrustingAuthenticator()).start(host, port)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WAMP router stand-in for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18080)
+    args = parser.parse_args()
+
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(start_router(args.host, args.port))
+    loop.run_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import random
+import itertools
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+
+from xconn.async_session import AsyncSession
+
+from deskconn import helpers
+from benchmarks.dataset import Dataset, BenchUser, BenchDesktop
+
+PROCEDURE_CRA_VERIFY = "io.xconn.deskconn.account.cra.verify"
+PROCEDURE_CRYPTOSIGN_VERIFY = "io.xconn.deskconn.account.cryptosign.verify"
+PROCEDURE_ACCESS_KEY_LIST = "io.xconn.deskconn.desktop.access.key.list"
+PROCEDURE_DESKTOP_LIST = "io.xconn.deskconn.desktop.list"
+PROCEDURE_UPDATE_CHECK = "io.xconn.deskconn.app.update.check"
+PROCEDURE_ACCOUNT_CREATE = "io.xconn.deskconn.account.create"
+
+_signup_ids = itertools.count()
+
+
+@dataclass
+class Worker:
+    """Sessions of one simulated client: a user, the desktop it owns and the router calling in on their behalf."""
+
+    user: BenchUser
+    desktop: BenchDesktop
+    user_session: AsyncSession
+    desktop_session: AsyncSession
+    router_session: AsyncSession
+
+
+# required arguments are passed positionally, in the order of the procedure's parameters or request model fields
+Call = Callable[[str, AsyncSession, list[Any]], Awaitable[Any]]
+Operation = Callable[[Worker, Dataset, Call], Awaitable[None]]
+
+
+async def auth_cryptosign(worker: Worker, dataset: Dataset, call: Call) -> None:
+    await call(
+        PROCEDURE_CRYPTOSIGN_VERIFY,
+        worker.router_session,
+        [worker.user.email, worker.user.public_key, helpers.CLOUD_REALM],
+    )
+
+
+async def auth_cra(worker: Worker, dataset: Dataset, call: Call) -> None:
+    await call(PROCEDURE_CRA_VERIFY, worker.router_session, [worker.user.email, worker.desktop.realm])
+
+
+async def desktop_reconnect(worker: Worker, dataset: Dataset, call: Call) -> None:
+    # the router authenticates the desktop, which then fetches the keys allowed to reach it
+    await call(
+        PROCEDURE_CRYPTOSIGN_VERIFY,
+        worker.router_session,
+        [worker.desktop.authid, worker.desktop.public_key, worker.desktop.realm],
+    )
+    await call(PROCEDURE_ACCESS_KEY_LIST, worker.desktop_session, [])
+
+
+async def desktop_list(worker: Worker, dataset: Dataset, call: Call) -> None:
+    await call(PROCEDURE_DESKTOP_LIST, worker.user_session, [])
+
+
+async def update_check(worker: Worker, dataset: Dataset, call: Call) -> None:
+    await call(
+        PROCEDURE_UPDATE_CHECK,
+        worker.desktop_session,
+        [dataset.app, random.choice(dataset.versions), "linux", "amd64"],
+    )
+
+
+async def signup(worker: Worker, dataset: Dataset, call: Call) -> None:
+    signup_id = next(_signup_ids)
+    await call(
+        PROCEDURE_ACCOUNT_CREATE,
+        worker.router_session,
+        [f"bench-signup-{signup_id}-{random.getrandbits(32):08x}@example.com", "Bench Signup", "benchmark-password"],
+    )
+
+
+OPERATIONS: dict[str, Operation] = {
+    "auth.cryptosign": auth_cryptosign,
+    "auth.cra": auth_cra,
+    "desktop.reconnect": desktop_reconnect,
+    "desktop.list": desktop_list,
+    "update.check": update_check,
+    "signup": signup,
+}
+
+# relative weights of the operations each worker picks from
+MIXES: dict[str, dict[str, int]] = {
+    "default": {
+        "auth.cryptosign": 30,
+        "auth.cra": 10,
+        "desktop.reconnect": 25,
+        "desktop.list": 15,
+        "update.check": 15,
+        "signup": 5,
+    },
+    "auth": {"auth.cryptosign": 70, "auth.cra": 30},
+    "reconnect-storm": {"desktop.reconnect": 80, "update.check": 20},
+    "signup-burst": {"signup": 90, "auth.cryptosign": 10},
+}
+
+
+def pick(mix: dict[str, int]) -> Callable[[], Operation]:
+    names = list(mix)
+    weights = [mix[name] for name in names]
+
+    def choose() -> Operation:
+        return OPERATIONS[random.choices(names, weights)[0]]
+
+    return choose
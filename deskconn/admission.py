@@ -0,0 +1,157 @@
+import os
+import asyncio
+from dataclasses import dataclass, asdict
+from typing import Any
+
+from xconn.exception import ApplicationError
+
+from deskconn import metrics, uris
+from deskconn.middleware import ProcedureCall, Handler
+from deskconn.database import database
+
+LANE_AUTH = "auth"
+LANE_DEFAULT = "default"
+LANE_BULK = "bulk"
+
+# verification gates every router connection, so it may use capacity no other lane can
+AUTH_PROCEDURES = {
+    "io.xconn.deskconn.account.cra.verify",
+    "io.xconn.deskconn.account.cryptosign.verify",
+    "io.xconn.deskconn.desktop.access",
+    "io.xconn.deskconn.desktop.access.key.list",
+}
+
+# procedures whose cost grows with the size of a user's or organization's data
+BULK_PROCEDURES = {
+    "io.xconn.deskconn.organization.get",
+    "io.xconn.deskconn.organization.list",
+    "io.xconn.deskconn.desktop.list",
+    "io.xconn.deskconn.desktop.access.user.list",
+    "io.xconn.deskconn.desktop.invitation.inbox.list",
+    "io.xconn.deskconn.desktop.invitation.outbox.list",
+    "io.xconn.deskconn.device.list",
+    "io.xconn.deskconn.account.principal.list",
+}
+
+# operational procedures stay reachable when the service is overloaded
+EXEMPT_PREFIXES = (
+    "io.xconn.deskconn.account.health",
+    "io.xconn.deskconn.account.metrics.",
+    "io.xconn.deskconn.account.slow_queries.",
+    "io.xconn.deskconn.account.profile.",
+    "io.xconn.deskconn.account.memory.",
+    "io.xconn.deskconn.account.schema.",
+)
+
+# concurrent invocations admitted, by default one per connection the pool can open
+ADMISSION_CAPACITY = int(
+    os.getenv("DESKCONN_ADMISSION_CAPACITY", str(database.DB_POOL_SIZE + database.DB_MAX_OVERFLOW))
+)
+# part of the capacity only auth procedures may use. This reserves invocations, not pool connections: background
+# work such as cache rebuilds, replica reloads, rate limit buckets and the exempt procedures draw from the same pool
+# without being admitted, so the reservation is best-effort and auth calls can still queue on the pool under load
+ADMISSION_AUTH_RESERVED = int(os.getenv("DESKCONN_ADMISSION_AUTH_RESERVED", str(max(1, ADMISSION_CAPACITY // 4))))
+# part of the capacity bulk procedures may use at most
+ADMISSION_BULK_SHARE = float(os.getenv("DESKCONN_ADMISSION_BULK_SHARE", "0.25"))
+# how long a call waits for a slot before it is rejected, 0 rejects at once
+ADMISSION_WAIT_MS = float(os.getenv("DESKCONN_ADMISSION_WAIT_MS", "50"))
+
+if not 0 <= ADMISSION_AUTH_RESERVED < ADMISSION_CAPACITY:
+    raise ValueError("'DESKCONN_ADMISSION_AUTH_RESERVED' must be less than the admission capacity.")
+
+if not 0 < ADMISSION_BULK_SHARE <= 1:
+    raise ValueError("'DESKCONN_ADMISSION_BULK_SHARE' must be greater than 0 and at most 1.")
+
+
+@dataclass
+class LaneStats:
+    limit: int
+    in_flight: int = 0
+    admitted: int = 0
+    rejected: int = 0
+
+
+shared_limit = ADMISSION_CAPACITY - ADMISSION_AUTH_RESERVED
+
+lanes = {
+    LANE_AUTH: LaneStats(limit=ADMISSION_CAPACITY),
+    LANE_DEFAULT: LaneStats(limit=shared_limit),
+    LANE_BULK: LaneStats(limit=max(1, min(shared_limit, int(ADMISSION_CAPACITY * ADMISSION_BULK_SHARE)))),
+}
+
+_released = asyncio.Condition()
+
+
+def lane_of(uri: str) -> str | None:
+    if uri.startswith(EXEMPT_PREFIXES):
+        return None
+
+    if uri in AUTH_PROCEDURES:
+        return LANE_AUTH
+
+    if uri in BULK_PROCEDURES:
+        return LANE_BULK
+
+    return LANE_DEFAULT
+
+
+def _has_room(lane: str) -> bool:
+    total = sum(stats.in_flight for stats in lanes.values())
+    if lane == LANE_AUTH:
+        return total < ADMISSION_CAPACITY
+
+    # the other lanes share what auth has not reserved; each admitted call holds at most one connection, so this keeps
+    # the reserved connections free of other invocations, though not of work that bypasses admission
+    shared = lanes[LANE_DEFAULT].in_flight + lanes[LANE_BULK].in_flight
+    return shared < shared_limit and total < ADMISSION_CAPACITY and lanes[lane].in_flight < lanes[lane].limit
+
+
+async def _admit(lane: str) -> bool:
+    if _has_room(lane):
+        return True
+
+    if ADMISSION_WAIT_MS <= 0:
+        return False
+
+    try:
+        async with _released:
+            await asyncio.wait_for(_released.wait_for(lambda: _has_room(lane)), ADMISSION_WAIT_MS / 1000)
+    except asyncio.TimeoutError:
+        return False
+
+    return True
+
+
+async def _release(stats: LaneStats) -> None:
+    stats.in_flight -= 1
+    async with _released:
+        _released.notify_all()
+
+
+async def middleware(call: ProcedureCall, call_next: Handler) -> Any:
+    lane = lane_of(call.uri)
+    if lane is None:
+        return await call_next()
+
+    stats = lanes[lane]
+    if not await _admit(lane):
+        stats.rejected += 1
+        raise ApplicationError(uris.ERROR_SERVICE_OVERLOADED, f"Service overloaded ({lane} calls), retry later")
+
+    stats.in_flight += 1
+    stats.admitted += 1
+    try:
+        return await call_next()
+    finally:
+        await _release(stats)
+
+
+def admission_stats() -> dict[str, Any]:
+    return {
+        "capacity": ADMISSION_CAPACITY,
+        "auth_reserved": ADMISSION_AUTH_RESERVED,
+        **{f"{lane}.{key}": value for lane, stats in lanes.items() for key, value in asdict(stats).items()},
+    }
+
+
+metrics.register_collector("admission", admission_stats)
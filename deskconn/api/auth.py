@@ -1,9 +1,9 @@
 from xconn import Component
 from xconn.exception import ApplicationError
 from sqlalchemy.ext.asyncio import AsyncSession
-from xconn.types import Depends, Result
+from xconn.types import Depends, Result, CallDetails
 
-from deskconn import schemas, uris, helpers, models
+from deskconn import schemas, uris, helpers, models, rate_limit, lookup_filter, desktop_replica
 from deskconn.database.database import get_database
 from deskconn.database.backend import user as user_backend
 from deskconn.database.backend import device as device_backend
@@ -16,6 +16,9 @@ component = Component()
 
 @component.register("io.xconn.deskconn.account.cra.verify", response_model=schemas.CRAUser)
 async def verify_cra(authid: str, realm: str, db: AsyncSession = Depends(get_database)):
+    if not lookup_filter.might_exist(lookup_filter.KIND_EMAIL, authid):
+        raise ApplicationError(uris.ERROR_USER_NOT_FOUND, f"User with authid '{authid}' not found")
+
     db_user = await user_backend.get_user_by_email(db, authid)
     if db_user is None:
         raise ApplicationError(uris.ERROR_USER_NOT_FOUND, f"User with authid '{authid}' not found")
@@ -29,7 +32,12 @@ async def verify_cra(authid: str, realm: str, db: AsyncSession = Depends(get_dat
 
 
 @component.register("io.xconn.deskconn.account.login")
-async def login(email: str, db: AsyncSession = Depends(get_database)):
+async def login(email: str, details: CallDetails, db: AsyncSession = Depends(get_database)):
+    await rate_limit.check("io.xconn.deskconn.account.login", email, details)
+
+    if not lookup_filter.might_exist(lookup_filter.KIND_EMAIL, email):
+        raise ApplicationError(uris.ERROR_USER_NOT_FOUND, f"User with email '{email}' not found")
+
     db_user = await user_backend.get_user_by_email(db, email)
     if db_user is None:
         raise ApplicationError(uris.ERROR_USER_NOT_FOUND, f"User with email '{email}' not found")
@@ -56,7 +64,10 @@ async def verify_login(rs: schemas.LoginVerify, db: AsyncSession = Depends(get_d
 
 @component.register("io.xconn.deskconn.account.cryptosign.verify")
 async def verify_cryptosign(authid: str, public_key: str, realm: str, db: AsyncSession = Depends(get_database)):
-    db_user = await user_backend.get_user_by_email(db, authid)
+    db_user = None
+    if lookup_filter.might_exist(lookup_filter.KIND_EMAIL, authid):
+        db_user = await user_backend.get_user_by_email(db, authid)
+
     if db_user is not None:
         if not db_user.is_verified:
             raise ApplicationError(uris.ERROR_USER_NOT_VERIFIED, f"User with authid '{authid}' is not verified")
@@ -72,24 +83,38 @@ async def verify_cryptosign(authid: str, public_key: str, realm: str, db: AsyncS
 
         authrole = helpers.ROLE_USER
     else:
-        db_desktop = await desktop_backend.get_desktop_by_public_key(db, authid, public_key)
-        if db_desktop is None:
+        desktop_realm = await get_desktop_realm(db, authid, public_key)
+        if desktop_realm is None:
             raise ApplicationError(
                 uris.ERROR_DEVICE_NOT_FOUND, f"Desktop with authid '{authid}' public key '{public_key}' not found"
             )
 
-        if realm not in (db_desktop.realm, helpers.CLOUD_REALM):
+        if realm not in (desktop_realm, helpers.CLOUD_REALM):
             raise ApplicationError(
                 uris.ERROR_AUTHENTICATION_FAILED, f"Desktop is not authorized to access realm '{realm}'"
             )
 
-        authrole = helpers.ROLE_DESKTOP.format(authid=db_desktop.authid)
+        authrole = helpers.ROLE_DESKTOP.format(authid=authid)
 
     return Result(args=[{"authid": authid, "authrole": authrole}])
 
 
+async def get_desktop_realm(db: AsyncSession, authid: str, public_key: str) -> str | None:
+    if desktop_replica.ready():
+        return desktop_replica.verify(authid, public_key)
+
+    if not lookup_filter.might_exist(lookup_filter.KIND_AUTHID, authid):
+        return None
+
+    db_desktop = await desktop_backend.get_desktop_by_public_key(db, authid, public_key)
+    return None if db_desktop is None else db_desktop.realm
+
+
 @component.register("io.xconn.deskconn.desktop.access")
 async def desktop_access(authid: str, desktop_authid: str, db: AsyncSession = Depends(get_database)):
+    if not lookup_filter.might_exist(lookup_filter.KIND_EMAIL, authid):
+        raise ApplicationError(uris.ERROR_USER_NOT_FOUND, f"User with authid '{authid}' not found")
+
     db_user = await user_backend.get_user_by_email(db, authid)
     if db_user is None:
         raise ApplicationError(uris.ERROR_USER_NOT_FOUND, f"User with authid '{authid}' not found")
@@ -97,7 +122,10 @@ async def desktop_access(authid: str, desktop_authid: str, db: AsyncSession = De
     if not db_user.is_verified:
         raise ApplicationError(uris.ERROR_USER_NOT_VERIFIED, f"User with authid '{authid}' is not verified")
 
-    db_desktop = await desktop_backend.get_desktop_by_authid(db, desktop_authid)
+    db_desktop = None
+    if lookup_filter.might_exist(lookup_filter.KIND_AUTHID, desktop_authid):
+        db_desktop = await desktop_backend.get_desktop_by_authid(db, desktop_authid)
+
     if db_desktop is None:
         raise ApplicationError(uris.ERROR_DEVICE_NOT_FOUND, f"Desktop with authid '{desktop_authid}' not found")
 
@@ -113,7 +141,10 @@ async def validate_user_connect_to_desktop(db: AsyncSession, authid: str, realm:
     if realm == helpers.CLOUD_REALM:
         return
 
-    db_desktop = await desktop_backend.get_desktop_by_realm(db, realm)
+    db_desktop = None
+    if lookup_filter.might_exist(lookup_filter.KIND_REALM, realm):
+        db_desktop = await desktop_backend.get_desktop_by_realm(db, realm)
+
     if db_desktop is None:
         raise ApplicationError(uris.ERROR_DEVICE_NOT_FOUND, f"Desktop with realm '{realm}' not found")
 
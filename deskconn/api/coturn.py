@@ -1,9 +1,12 @@
+from uuid import UUID
+
 from xconn import Component
 from xconn.types import Depends, CallDetails
 from xconn.exception import ApplicationError
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from deskconn import schemas, uris, helpers
+from deskconn import schemas, uris, helpers, metrics, invalidation
+from deskconn.cache import AsyncCache, MISSING
 from deskconn.database.database import get_database
 from deskconn.database.backend import user as user_backend
 from deskconn.database.backend import desktop as desktop_backend
@@ -16,20 +19,100 @@ COTURN_URLS = [
     "turn:turn.deskconn.com:3478?transport=udp",
 ]
 
+# how long issued credentials (and the authid they were issued for) are served from memory
+REUSE_WINDOW = helpers.TURN_CREDS_TTL * helpers.TURN_CREDS_REUSE_FRACTION
 
-@component.register("io.xconn.deskconn.coturn.credentials.create")
-async def generate_coturn_credentials(details: CallDetails, db: AsyncSession = Depends(get_database)):
-    db_user = await user_backend.get_user_by_email(db, details.authid)
-    if db_user is None:
-        db_desktop = await desktop_backend.get_desktop_by_authid(db, details.authid)
+# authid -> principal id
+principal_ids: AsyncCache[str, UUID] = AsyncCache(
+    "coturn.principal_ids", ttl=REUSE_WINDOW, max_size=helpers.TURN_CREDS_CACHE_SIZE
+)
+# principal id -> last issued credentials
+credentials: AsyncCache[UUID, helpers.CoturnCredentials] = AsyncCache(
+    "coturn.credentials", ttl=REUSE_WINDOW, max_size=helpers.TURN_CREDS_CACHE_SIZE
+)
+
+# credentials signed; reused ones are counted as hits of the credentials cache
+issued_stats = {"issued": 0}
+
+
+def forget_principal(authid: str) -> None:
+    """Drops cached state for an authid whose user or desktop no longer exists."""
+    principal_id = principal_ids.peek(authid)
+    principal_ids.invalidate(authid)
+    if principal_id is not MISSING:
+        credentials.invalidate(principal_id)
+
+
+def invalidate(change: invalidation.Change | None) -> None:
+    if change is None:
+        principal_ids.clear()
+        credentials.clear()
+        return
+
+    # a principal id only changes hands when its user or desktop is deleted or its authid changes
+    column = "email" if change.table == "users" else "authid"
+    if change.op == "insert" or (change.op == "update" and change.old[column] == change.new[column]):
+        return
+
+    for authid in change.values(column):
+        forget_principal(authid)
+
+
+invalidation.register("coturn_credentials", ("users", "desktops"), invalidate)
+
+
+async def resolve_principal_id(db: AsyncSession, authid: str) -> UUID:
+    async def load() -> UUID:
+        db_user = await user_backend.get_user_by_email(db, authid)
+        if db_user is not None:
+            return db_user.id
+
+        db_desktop = await desktop_backend.get_desktop_by_authid(db, authid)
         if db_desktop is None:
-            raise ApplicationError(uris.ERROR_NOT_FOUND, f"User/Desktop with authid '{details.authid}' not found")
-        user_id = db_desktop.id
-    else:
-        user_id = db_user.id
+            raise ApplicationError(uris.ERROR_NOT_FOUND, f"User/Desktop with authid '{authid}' not found")
 
-    creds = helpers.generate_coturn_credentials(user_id)
+        return db_desktop.id
+
+    return await principal_ids.get_or_load(authid, load)
+
+
+def issue_credentials(principal_id: UUID) -> helpers.CoturnCredentials:
+    creds = credentials.get(principal_id)
+    if creds is MISSING:
+        creds = helpers.generate_coturn_credentials(principal_id)
+        issued_stats["issued"] += 1
+        credentials.set(principal_id, creds)
+
+    return creds
+
+
+@component.register("io.xconn.deskconn.coturn.credentials.create")
+async def generate_coturn_credentials(details: CallDetails, db: AsyncSession = Depends(get_database)):
+    user_id = await resolve_principal_id(db, details.authid)
+    creds = issue_credentials(user_id)
 
     return schemas.CoturnCredentials(
         username=creds.username, credential=creds.credential, expires_at=creds.expires_at, urls=COTURN_URLS
     ).model_dump()
+
+
+def collect_stats() -> dict:
+    return {
+        "hits": credentials.stats.hits,
+        "misses": credentials.stats.misses,
+        "issued": issued_stats["issued"],
+        "hit_rate": credentials.stats.hit_rate,
+        "authid_hits": principal_ids.stats.hits,
+        "authid_misses": principal_ids.stats.misses,
+        "authid_coalesced": principal_ids.stats.coalesced,
+        "cached_principals": len(principal_ids),
+        "cached_credentials": len(credentials),
+    }
+
+
+metrics.register_collector("coturn_credentials", collect_stats)
+
+
+@component.register("io.xconn.deskconn.coturn.credentials.stats", allowed_roles=[helpers.ROLE_ADMIN])
+async def credentials_stats():
+    return collect_stats()
@@ -5,11 +5,12 @@ from xconn.exception import ApplicationError
 from sqlalchemy.ext.asyncio import AsyncSession
 from xconn.types import Depends, CallDetails
 
-from deskconn import schemas, uris, models, helpers
+from deskconn import schemas, uris, models, helpers, lookup_filter, desktop_replica
 from deskconn.database.database import get_database
 from deskconn.database.backend import user as user_backend
 from deskconn.database.backend import desktop as desktop_backend
 from deskconn.database.backend import organization as organization_backend
+from deskconn.api.coturn import forget_principal
 
 component = Component()
 
@@ -40,11 +41,15 @@ async def attach(rs: schemas.DesktopCreate, details: CallDetails, db: AsyncSessi
     )
 
     desktop = await desktop_backend.create_desktop(db, rs, db_user, realm)
+    lookup_filter.add(lookup_filter.KIND_AUTHID, desktop.authid)
+    lookup_filter.add(lookup_filter.KIND_REALM, desktop.realm)
+    desktop_replica.put(desktop)
 
     # publish new keys to desktops
     desktop_authorizations = await desktop_backend.get_user_desktops_authid_with_authrole(db, db_user.id)
     for desktop_authid, authrole in desktop_authorizations:
-        await component.session.publish(
+        await helpers.publish(
+            component.session,
             helpers.TOPIC_KEY_ADD.format(machine_id=desktop_authid),
             [desktop.authid, desktop.public_key, authrole],
             options={"acknowledge": True},
@@ -77,7 +82,10 @@ async def update(rs: schemas.DesktopUpdate, details: CallDetails, db: AsyncSessi
     if db_desktop is None:
         raise ApplicationError(uris.ERROR_DESKTOP_NOT_FOUND, f"Desktop with id '{rs.id}' not found")
 
-    return await desktop_backend.update_desktop(db, db_desktop, data)
+    db_desktop = await desktop_backend.update_desktop(db, db_desktop, data)
+    desktop_replica.put(db_desktop)
+
+    return db_desktop
 
 
 @component.register("io.xconn.deskconn.desktop.detach")
@@ -102,9 +110,13 @@ async def detach(rs: schemas.DesktopDetach, details: CallDetails, db: AsyncSessi
     )
 
     await desktop_backend.delete_desktop(db, db_desktop)
+    forget_principal(db_desktop.authid)
+    desktop_replica.remove(db_desktop)
 
-    await component.session.publish(
-        helpers.TOPIC_DESKTOP_DETACH.format(machine_id=db_desktop.authid), options={"acknowledge": True}
+    await helpers.publish(
+        component.session,
+        helpers.TOPIC_DESKTOP_DETACH.format(machine_id=db_desktop.authid),
+        options={"acknowledge": True},
     )
 
     await helpers.call_cloud_router_rpc(
@@ -114,7 +126,8 @@ async def detach(rs: schemas.DesktopDetach, details: CallDetails, db: AsyncSessi
     # publish keys removal to desktops
     db_desktops = await desktop_backend.get_user_desktops(db, db_user.id)
     for desktop in db_desktops:
-        await component.session.publish(
+        await helpers.publish(
+            component.session,
             helpers.TOPIC_KEY_REMOVE.format(machine_id=desktop.authid),
             [{db_desktop.authid: [db_desktop.public_key]}],
             options={"acknowledge": True},
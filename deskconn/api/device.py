@@ -29,7 +29,8 @@ async def create(rs: schemas.DeviceCreate, details: CallDetails, db: AsyncSessio
     # publish new keys to desktops
     desktop_authorizations = await desktop_backend.get_user_desktops_authid_with_authrole(db, db_user.id)
     for desktop_authid, authrole in desktop_authorizations:
-        await component.session.publish(
+        await helpers.publish(
+            component.session,
             helpers.TOPIC_KEY_ADD.format(machine_id=desktop_authid),
             [db_user.email, device.public_key, authrole],
             options={"acknowledge": True},
@@ -67,7 +68,8 @@ async def delete(device_id: str, details: CallDetails, db: AsyncSession = Depend
     # publish keys removal to desktops
     db_desktops = await desktop_backend.get_user_desktops(db, db_user.id)
     for desktop in db_desktops:
-        await component.session.publish(
+        await helpers.publish(
+            component.session,
             helpers.TOPIC_KEY_REMOVE.format(machine_id=desktop.authid),
             [{db_user.email: [public_key]}],
             options={"acknowledge": True},
@@ -0,0 +1,141 @@
+import asyncio
+
+from xconn import Component, uris as xconn_uris
+from xconn.exception import ApplicationError
+
+from deskconn import health, helpers, memory, metrics, profiling, schemas, uris
+from deskconn.database import database
+
+component = Component()
+
+PROFILE_MAX_SECONDS = 3600
+MEMORY_MAX_FRAMES = 64
+
+
+@component.register("io.xconn.deskconn.account.metrics.get", allowed_roles=[helpers.ROLE_ADMIN])
+async def get_metrics():
+    return metrics.snapshot()
+
+
+@component.register("io.xconn.deskconn.account.health", allowed_roles=[helpers.ROLE_ADMIN])
+async def get_health():
+    return await health.get(component.session)
+
+
+@component.register("io.xconn.deskconn.account.slow_queries.list", allowed_roles=[helpers.ROLE_ADMIN])
+async def list_slow_queries(rs: schemas.SlowQueryList):
+    entries = [
+        entry for entry in reversed(database.slow_queries) if rs.procedure is None or entry.procedure == rs.procedure
+    ]
+
+    return [entry.as_dict() for entry in entries[: rs.limit]]
+
+
+@component.register("io.xconn.deskconn.account.slow_queries.clear", allowed_roles=[helpers.ROLE_ADMIN])
+async def clear_slow_queries():
+    database.slow_queries.clear()
+
+
+@component.register("io.xconn.deskconn.account.profile.start", allowed_roles=[helpers.ROLE_ADMIN])
+async def start_profile(rs: schemas.ProfileStart):
+    if rs.calls is not None and rs.calls < 1:
+        raise ApplicationError(xconn_uris.ERROR_INVALID_ARGUMENT, "'calls' must be at least 1")
+
+    if not 0 < rs.seconds <= PROFILE_MAX_SECONDS:
+        raise ApplicationError(
+            xconn_uris.ERROR_INVALID_ARGUMENT, f"'seconds' must be between 0 and {PROFILE_MAX_SECONDS}"
+        )
+
+    if rs.interval_ms < 1:
+        raise ApplicationError(xconn_uris.ERROR_INVALID_ARGUMENT, "'interval_ms' must be at least 1")
+
+    return profiling.start(rs.procedure, rs.interval_ms / 1000, rs.calls, rs.seconds).as_dict()
+
+
+@component.register("io.xconn.deskconn.account.profile.get", allowed_roles=[helpers.ROLE_ADMIN])
+async def get_profile(dump: bool = False):
+    return profile_result(dump)
+
+
+@component.register("io.xconn.deskconn.account.profile.stop", allowed_roles=[helpers.ROLE_ADMIN])
+async def stop_profile(dump: bool = False):
+    if profiling.session is not None:
+        profiling.session.stop()
+
+    return profile_result(dump)
+
+
+def profile_result(dump: bool) -> dict:
+    if profiling.session is None:
+        raise ApplicationError(uris.ERROR_NOT_FOUND, "No profile has been started")
+
+    result = profiling.session.as_dict()
+    if dump:
+        result["path"] = profiling.dump(profiling.session)
+
+    return result
+
+
+@component.register("io.xconn.deskconn.account.memory.start", allowed_roles=[helpers.ROLE_ADMIN])
+async def start_memory_tracing(frames: int = 1):
+    if not 1 <= frames <= MEMORY_MAX_FRAMES:
+        raise ApplicationError(xconn_uris.ERROR_INVALID_ARGUMENT, f"'frames' must be between 1 and {MEMORY_MAX_FRAMES}")
+
+    memory.start(frames)
+
+    return memory.status()
+
+
+@component.register("io.xconn.deskconn.account.memory.stop", allowed_roles=[helpers.ROLE_ADMIN])
+async def stop_memory_tracing():
+    memory.stop()
+
+    return memory.status()
+
+
+@component.register("io.xconn.deskconn.account.memory.status", allowed_roles=[helpers.ROLE_ADMIN])
+async def memory_status():
+    return memory.status()
+
+
+@component.register("io.xconn.deskconn.account.memory.snapshot", allowed_roles=[helpers.ROLE_ADMIN])
+async def take_memory_snapshot(rs: schemas.MemorySnapshotTake):
+    ensure_memory_query(rs.limit, rs.key_type)
+
+    snapshot_id = await memory.take_snapshot()
+    _, snapshot = memory.snapshots.taken[snapshot_id]
+
+    return {"id": snapshot_id, "top": await asyncio.to_thread(memory.top, snapshot, rs.key_type, rs.limit, rs.module)}
+
+
+@component.register("io.xconn.deskconn.account.memory.diff", allowed_roles=[helpers.ROLE_ADMIN])
+async def diff_memory_snapshots(rs: schemas.MemorySnapshotDiff):
+    """Growth since snapshot ``old``, up to snapshot ``new`` or a snapshot taken now."""
+    ensure_memory_query(rs.limit, rs.key_type)
+
+    old, new = rs.old, rs.new
+    if new is None:
+        new = await memory.take_snapshot()
+
+    for snapshot_id in (old, new):
+        if snapshot_id not in memory.snapshots.taken:
+            raise ApplicationError(uris.ERROR_NOT_FOUND, f"Memory snapshot '{snapshot_id}' not found")
+
+    _, old_snapshot = memory.snapshots.taken[old]
+    _, new_snapshot = memory.snapshots.taken[new]
+    growth = await asyncio.to_thread(memory.diff, old_snapshot, new_snapshot, rs.key_type, rs.limit, rs.module)
+
+    return {"old": old, "new": new, "diff": growth}
+
+
+def ensure_memory_query(limit: int, key_type: str) -> None:
+    if not memory.tracemalloc.is_tracing():
+        raise ApplicationError(uris.ERROR_NOT_FOUND, "Memory tracing is not started")
+
+    if limit < 1:
+        raise ApplicationError(xconn_uris.ERROR_INVALID_ARGUMENT, "'limit' must be at least 1")
+
+    if key_type not in memory.KEY_TYPES:
+        raise ApplicationError(
+            xconn_uris.ERROR_INVALID_ARGUMENT, f"'key_type' must be one of {', '.join(memory.KEY_TYPES)}"
+        )
@@ -1,9 +1,12 @@
-from xconn import Component
-from xconn.types import Depends
+from uuid import UUID
+from datetime import datetime
+
+from xconn import Component, uris as xconn_uris
+from xconn.types import Depends, CallDetails
 from xconn.exception import ApplicationError
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from deskconn import helpers, schemas, uris
+from deskconn import helpers, schemas, uris, models
 from deskconn.database.database import get_database
 from deskconn.database.backend import update as update_backend
 
@@ -11,7 +14,7 @@ component = Component()
 
 
 @component.register("io.xconn.deskconn.app.update.check")
-async def check(rs: schemas.AppVersionCheck, db: AsyncSession = Depends(get_database)):
+async def check(rs: schemas.AppVersionCheck, details: CallDetails, db: AsyncSession = Depends(get_database)):
     app = await update_backend.get_app_by_name(db, rs.name)
     if app is None:
         raise ApplicationError(uris.ERROR_NOT_FOUND, f"App '{rs.name}' not found")
@@ -23,6 +26,13 @@ async def check(rs: schemas.AppVersionCheck, db: AsyncSession = Depends(get_data
     if latest_version.version == rs.version:
         return None
 
+    # desktops outside the rollout cohort of the newest release are served the newest release they qualify for
+    bucket = helpers.rollout_bucket(app.name, details.authid)
+    if not in_rollout_cohort(bucket, latest_version):
+        latest_version = await select_rollout_version(db, app.id, latest_version, bucket, rs.version)
+        if latest_version is None:
+            return None
+
     asset_name = helpers.release_asset_name(app.name, latest_version.version, rs.os, rs.cpu_architecture)
     download_url = helpers.release_download_url(
         helpers.DEFAULT_DESKCONN_RELEASE_BASE_URL,
@@ -42,11 +52,22 @@ async def check(rs: schemas.AppVersionCheck, db: AsyncSession = Depends(get_data
         asset_name=asset_name,
         checksum=latest_version.checksum,
         released_at=latest_version.released_at,
+        size=latest_version.size,
+        deltas=await select_delta_assets(db, app, latest_version, rs),
     ).model_dump()
 
 
 @component.register("io.xconn.deskconn.app.update", response_model=schemas.AppVersionGet)
 async def upload(rs: schemas.AppVersionUpload, db: AsyncSession = Depends(get_database)):
+    validate_rollout_schedule(rs.rollout_starts_at, rs.rollout_ends_at)
+
+    delta_keys = {(delta.from_version, delta.os, delta.cpu_architecture) for delta in rs.deltas}
+    if len(delta_keys) != len(rs.deltas):
+        raise ApplicationError(xconn_uris.ERROR_INVALID_ARGUMENT, "Duplicate delta for the same version and platform")
+
+    if any(delta.from_version == rs.version for delta in rs.deltas):
+        raise ApplicationError(xconn_uris.ERROR_INVALID_ARGUMENT, "Delta cannot start from the version it upgrades to")
+
     app = await update_backend.get_app_by_name(db, rs.name)
     if app is None:
         app = await update_backend.create_app(db, rs.name)
@@ -58,3 +79,93 @@ async def upload(rs: schemas.AppVersionUpload, db: AsyncSession = Depends(get_da
         )
 
     return await update_backend.create_app_version(db, app, rs)
+
+
+@component.register("io.xconn.deskconn.app.update.rollout", response_model=schemas.AppVersionGet)
+async def rollout(rs: schemas.AppVersionRolloutUpdate, db: AsyncSession = Depends(get_database)):
+    app = await update_backend.get_app_by_name(db, rs.name)
+    if app is None:
+        raise ApplicationError(uris.ERROR_NOT_FOUND, f"App '{rs.name}' not found")
+
+    app_version = await update_backend.get_app_version(db, app.id, rs.version)
+    if app_version is None:
+        raise ApplicationError(uris.ERROR_NOT_FOUND, f"Version '{rs.version}' for app '{rs.name}' not found")
+
+    # a schedule that is not sent is kept; sending null removes it
+    data = rs.model_dump(exclude_unset=True, exclude={"name", "version"})
+    validate_rollout_schedule(
+        data.get("rollout_starts_at", app_version.rollout_starts_at),
+        data.get("rollout_ends_at", app_version.rollout_ends_at),
+    )
+
+    return await update_backend.update_app_version_rollout(db, app_version, data)
+
+
+def in_rollout_cohort(bucket: int, app_version: models.AppVersion) -> bool:
+    return helpers.in_rollout_cohort(
+        bucket, app_version.rollout_percentage, app_version.rollout_starts_at, app_version.rollout_ends_at
+    )
+
+
+async def select_rollout_version(
+    db: AsyncSession, app_id: UUID, latest_version: models.AppVersion, bucket: int, current_version: str
+) -> models.AppVersion | None:
+    # newest first; the running release is listed even when pulled back to 0%, so its desktops are never downgraded
+    previous_versions = await update_backend.get_previous_app_versions(
+        db, app_id, latest_version.released_at, current_version
+    )
+    for app_version in previous_versions:
+        # the caller already runs a release at least as new as anything its cohort is offered
+        if app_version.version == current_version:
+            return None
+
+        if in_rollout_cohort(bucket, app_version):
+            return app_version
+
+    return None
+
+
+async def select_delta_assets(
+    db: AsyncSession, app: models.App, app_version: models.AppVersion, rs: schemas.AppVersionCheck
+) -> list[schemas.AppVersionDeltaAsset]:
+    rows = await update_backend.get_app_version_deltas(db, app.id, rs.os, rs.cpu_architecture, app_version.released_at)
+    path = helpers.cheapest_delta_path(
+        [(delta.from_version, to_version, delta.size, (delta, to_version)) for delta, to_version in rows],
+        rs.version,
+        app_version.version,
+    )
+    if path is None:
+        return []
+
+    total_size, chain = path
+    if app_version.size is not None and total_size >= app_version.size:
+        return []
+
+    return [
+        schemas.AppVersionDeltaAsset(
+            from_version=delta.from_version,
+            to_version=to_version,
+            download_url=helpers.release_delta_download_url(
+                helpers.DEFAULT_DESKCONN_RELEASE_BASE_URL,
+                delta.from_version,
+                to_version,
+                app.name,
+                rs.os,
+                rs.cpu_architecture,
+            ),
+            asset_name=helpers.release_delta_asset_name(
+                app.name, delta.from_version, to_version, rs.os, rs.cpu_architecture
+            ),
+            size=delta.size,
+            checksum=delta.checksum,
+        )
+        for delta, to_version in chain
+    ]
+
+
+def validate_rollout_schedule(starts_at: datetime | None, ends_at: datetime | None) -> None:
+    if starts_at is None or ends_at is None:
+        return
+
+    if ends_at <= starts_at:
+        raise ApplicationError(xconn_uris.ERROR_INVALID_ARGUMENT, "'rollout_ends_at' must be after 'rollout_starts_at'")
@@ -3,20 +3,27 @@ from xconn.exception import ApplicationError
 from sqlalchemy.ext.asyncio import AsyncSession
 from xconn.types import Depends, CallDetails
 
-from deskconn import schemas, uris, helpers
+from deskconn import schemas, uris, helpers, rate_limit, lookup_filter
 from deskconn.database.database import get_database
 from deskconn.database.backend import user as user_backend
 from deskconn.database.backend import desktop as desktop_backend
+from deskconn.api.coturn import forget_principal
 
 component = Component()
 
 
 @component.register("io.xconn.deskconn.account.create", response_model=schemas.UserGet)
-async def create(rs: schemas.UserCreate, db: AsyncSession = Depends(get_database)):
+async def create(rs: schemas.UserCreate, details: CallDetails, db: AsyncSession = Depends(get_database)):
+    await rate_limit.check("io.xconn.deskconn.account.create", rs.email, details)
+
     if await user_backend.get_user_by_email(db, rs.email) is not None:
         raise ApplicationError(uris.ERROR_USER_EXISTS, f"User with email '{rs.email}' already exists")
 
-    return await user_backend.create_user(db, rs)
+    db_user = await user_backend.create_user(db, rs)
+    # other instances learn of the user from its change notification
+    lookup_filter.add(lookup_filter.KIND_EMAIL, db_user.email)
+
+    return db_user
 
 
 @component.register("io.xconn.deskconn.account.get", response_model=schemas.UserGet)
@@ -52,10 +59,14 @@ async def delete(details: CallDetails, db: AsyncSession = Depends(get_database))
     authorized_keys = await user_backend.get_user_public_keys(db, db_user.id)
 
     await user_backend.delete_user(db, db_user)
+    forget_principal(db_user.email)
 
     for desktop in db_desktops:
-        await component.session.publish(
-            helpers.TOPIC_KEY_REMOVE.format(machine_id=desktop.authid), [authorized_keys], options={"acknowledge": True}
+        await helpers.publish(
+            component.session,
+            helpers.TOPIC_KEY_REMOVE.format(machine_id=desktop.authid),
+            [authorized_keys],
+            options={"acknowledge": True},
         )
 
 
@@ -77,7 +88,9 @@ async def account_verification(rs: schemas.UserVerify, db: AsyncSession = Depend
 
 
 @component.register("io.xconn.deskconn.account.otp.resend")
-async def otp_resend(email: str, db: AsyncSession = Depends(get_database)):
+async def otp_resend(email: str, details: CallDetails, db: AsyncSession = Depends(get_database)):
+    await rate_limit.check("io.xconn.deskconn.account.otp.resend", email, details)
+
     db_user = await user_backend.get_user_by_email(db, email)
     if db_user is None:
         raise ApplicationError(uris.ERROR_USER_NOT_FOUND, f"User with email '{email}' not found")
@@ -86,7 +99,9 @@ async def otp_resend(email: str, db: AsyncSession = Depends(get_database)):
 
 
 @component.register("io.xconn.deskconn.account.password.forget")
-async def forget_password(email: str, db: AsyncSession = Depends(get_database)):
+async def forget_password(email: str, details: CallDetails, db: AsyncSession = Depends(get_database)):
+    await rate_limit.check("io.xconn.deskconn.account.password.forget", email, details)
+
     db_user = await user_backend.get_user_by_email(db, email)
     if db_user is None:
         return None
@@ -0,0 +1,235 @@
+import os
+import json
+import time
+import asyncio
+from uuid import UUID
+from typing import Any
+
+from sqlalchemy import Row
+
+from deskconn import helpers, metrics, invalidation, workers
+from deskconn.authz_reader import (
+    MAGIC,
+    VERSION,
+    HEADER,
+    REALM,
+    SUBJECT,
+    POSTING,
+    ENTRY,
+    key_digest,
+    realm_digest,
+)
+from deskconn.database.database import AsyncSessionLocal
+from deskconn.database.backend import authz as authz_backend
+from deskconn.database.backend import desktop as desktop_backend
+
+# where the index for deskconn.authz_reader is written, empty disables the exporter
+AUTHZ_INDEX_PATH = os.getenv("DESKCONN_AUTHZ_INDEX_PATH", "")
+# rewritten this often even without changes, so expired principals drop out of the file
+AUTHZ_INDEX_INTERVAL_SECONDS = float(os.getenv("DESKCONN_AUTHZ_INDEX_INTERVAL_SECONDS", "300"))
+# changes within this long of each other are written out together
+AUTHZ_INDEX_DEBOUNCE_SECONDS = float(os.getenv("DESKCONN_AUTHZ_INDEX_DEBOUNCE_SECONDS", "1"))
+# a rewrite after a change waits until this long after the previous one started, so a burst of changes is one rewrite
+AUTHZ_INDEX_MIN_INTERVAL_SECONDS = float(os.getenv("DESKCONN_AUTHZ_INDEX_MIN_INTERVAL_SECONDS", "10"))
+
+# every table the answer of cryptosign verification depends on
+TABLES = (
+    "users",
+    "principals",
+    "devices",
+    "desktops",
+    "desktop_user_access",
+    "desktop_organization_access",
+    "organization_members",
+)
+
+# tables whose updates change a key even when the columns in the notification stay the same
+KEY_TABLES = frozenset({"principals", "devices", "desktops"})
+
+ROLES = [helpers.ROLE_USER, helpers.ROLE_DESKTOP]
+ROLE_USER, ROLE_DESKTOP = range(len(ROLES))
+
+SCAN_BATCH_SIZE = 5000
+RETRY_DELAY = 10.0
+
+_changed = asyncio.Event()
+_exporter: asyncio.Task | None = None
+
+stats = {
+    "builds": 0,
+    "errors": 0,
+    "ignored_changes": 0,
+    "entries": 0,
+    "subjects": 0,
+    "realms": 0,
+    "bytes": 0,
+    "build_seconds": 0.0,
+}
+
+
+def affects_index(change: invalidation.Change) -> bool:
+    """Whether the change can alter a key, its subject's realms or whether a user may authenticate at all.
+
+    Inserts and deletes always can. An update of a user's name or password, or of an access role, leaves the
+    notified columns (keys, email and is_verified) as they were and does not.
+    """
+    if change.op != "update" or change.table in KEY_TABLES:
+        return True
+
+    return change.old != change.new
+
+
+def _invalidate(change: invalidation.Change | None) -> None:
+    if change is not None and not affects_index(change):
+        stats["ignored_changes"] += 1
+        return
+
+    _changed.set()
+
+
+async def _read() -> tuple[int, dict[UUID, set[str]], list[Row], list[Row]]:
+    """The watermark, user realms, desktop keys and user keys, all from one consistent snapshot."""
+    async with AsyncSessionLocal() as db:
+        await db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+        watermark = await authz_backend.read_watermark(db)
+
+        user_realms: dict[UUID, set[str]] = {}
+        async for user_id, realm in authz_backend.stream_user_realms(db, SCAN_BATCH_SIZE):
+            user_realms.setdefault(user_id, set()).add(realm)
+
+        desktops = [row async for row in desktop_backend.stream_credentials(db, SCAN_BATCH_SIZE)]
+        user_keys = [row async for row in authz_backend.stream_user_keys(db, helpers.utcnow(), SCAN_BATCH_SIZE)]
+
+    return watermark, user_realms, desktops, user_keys
+
+
+def pack(watermark: int, user_realms: dict[UUID, set[str]], desktops: list[Row], user_keys: list[Row]) -> bytes:
+    """Serializes who may authenticate with which key on which realm; CPU-bound, run it off the event loop."""
+    # subject -> (role, realms); a subject is a user or a desktop, shared by all of its keys
+    subjects: dict[tuple[int, UUID], tuple[int, set[str]]] = {}
+    # key digest -> (subject, expiry)
+    entries: dict[bytes, tuple[tuple[int, UUID], int]] = {}
+
+    for row in desktops:
+        subject = (ROLE_DESKTOP, row.id)
+        subjects[subject] = (ROLE_DESKTOP, {helpers.CLOUD_REALM, row.realm})
+        entries[key_digest(row.authid, row.public_key)] = (subject, 0)
+
+    # verification looks the authid up as a user first, so user keys replace desktop keys
+    for email, user_id, public_key, expires_at in user_keys:
+        subject = (ROLE_USER, user_id)
+        if subject not in subjects:
+            subjects[subject] = (ROLE_USER, {helpers.CLOUD_REALM, *user_realms.get(user_id, ())})
+
+        digest = key_digest(email, public_key)
+        expiry = 0 if expires_at is None else int(expires_at.timestamp())
+        previous = entries.get(digest)
+        if previous is None or previous[0][0] == ROLE_DESKTOP or (previous[1] and (not expiry or expiry > previous[1])):
+            entries[digest] = (subject, expiry)
+
+    realms = sorted({realm for _, subject_realms in subjects.values() for realm in subject_realms}, key=realm_digest)
+    realm_index = {realm: index for index, realm in enumerate(realms)}
+    subject_index = {subject: index for index, subject in enumerate(subjects)}
+
+    subject_records, posting_records = [], []
+    for role, subject_realms in subjects.values():
+        postings = sorted(realm_index[realm] for realm in subject_realms)
+        subject_records.append(SUBJECT.pack(role, len(posting_records), len(postings)))
+        posting_records.extend(POSTING.pack(posting) for posting in postings)
+
+    entry_records = [
+        ENTRY.pack(digest, subject_index[subject], expiry) for digest, (subject, expiry) in sorted(entries.items())
+    ]
+
+    meta = json.dumps({"roles": ROLES}).encode()
+    header = HEADER.pack(
+        MAGIC,
+        VERSION,
+        0,
+        time.time_ns(),
+        time.time(),
+        watermark,
+        len(meta),
+        len(realms),
+        len(subject_records),
+        len(posting_records),
+        len(entry_records),
+    )
+
+    return b"".join(
+        [header, meta, *(REALM.pack(realm_digest(realm)) for realm in realms), *subject_records, *posting_records]
+        + entry_records
+    )
+
+
+async def build() -> bytes:
+    """The index of the current database contents, as written to AUTHZ_INDEX_PATH."""
+    data = await asyncio.to_thread(pack, *await _read())
+
+    *_, realm_count, subject_count, _, entry_count = HEADER.unpack_from(data)
+    stats.update(realms=realm_count, subjects=subject_count, entries=entry_count)
+
+    return data
+
+
+def _write(data: bytes) -> None:
+    # readers keep the file they mapped until they notice the new one
+    temporary = f"{AUTHZ_INDEX_PATH}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(temporary, AUTHZ_INDEX_PATH)
+
+
+async def export() -> None:
+    started = time.perf_counter()
+    data = await build()
+    await asyncio.to_thread(_write, data)
+
+    stats["builds"] += 1
+    stats["bytes"] = len(data)
+    stats["build_seconds"] = time.perf_counter() - started
+
+
+async def _export_periodically() -> None:
+    last_export = -AUTHZ_INDEX_MIN_INTERVAL_SECONDS
+    while True:
+        try:
+            await asyncio.wait_for(_changed.wait(), AUTHZ_INDEX_INTERVAL_SECONDS)
+            await asyncio.sleep(
+                max(AUTHZ_INDEX_DEBOUNCE_SECONDS, last_export + AUTHZ_INDEX_MIN_INTERVAL_SECONDS - time.monotonic())
+            )
+        except asyncio.TimeoutError:
+            pass
+
+        _changed.clear()
+        last_export = time.monotonic()
+        try:
+            await export()
+        except Exception as e:
+            stats["errors"] += 1
+            print(f"failed to export authorization index: {e}, retrying in {RETRY_DELAY:.0f}s")
+            await asyncio.sleep(RETRY_DELAY)
+            _changed.set()
+
+
+def start() -> None:
+    """Writes the index now and after every change; with several workers, only the first one does."""
+    global _exporter
+
+    if not AUTHZ_INDEX_PATH or workers.WORKER_ID not in (None, "0") or _exporter is not None:
+        return
+
+    invalidation.register("authz_index", TABLES, _invalidate)
+    # the first export happens right away
+    _changed.set()
+    _exporter = asyncio.get_running_loop().create_task(_export_periodically())
+
+
+def authz_index_stats() -> dict[str, Any]:
+    return dict(stats)
+
+
+metrics.register_collector("authz_index", authz_index_stats)
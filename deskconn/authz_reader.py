@@ -0,0 +1,141 @@
+"""Reads the authorization index written by deskconn.authz_index.
+
+Only uses the standard library, so a process next to the router can answer cryptosign verification without a call
+to this service::
+
+    index = AuthzIndex("/var/lib/deskconn/authz.idx")
+    authrole = index.authorize(authid, public_key, realm)  # None: not allowed, ask the service
+"""
+
+import os
+import json
+import mmap
+import time
+import struct
+import hashlib
+
+MAGIC = b"DCAZ"
+VERSION = 1
+
+# magic, version, reserved, generation, built at (unix time), watermark xid, meta length,
+# realm, subject, posting and entry counts
+HEADER = struct.Struct("<4sHHQdQIIIII")
+# digest of the realm name
+REALM = struct.Struct("<16s")
+# role index into meta["roles"], first posting, posting count
+SUBJECT = struct.Struct("<III")
+# realm index; each subject's postings are sorted
+POSTING = struct.Struct("<I")
+# digest of authid and public key, subject index, expiry as unix time (0 never expires)
+ENTRY = struct.Struct("<16sIq")
+
+
+def key_digest(authid: str, public_key: str) -> bytes:
+    return hashlib.blake2b(f"{authid}\0{public_key}".encode(), digest_size=16, person=b"deskconn-key").digest()
+
+
+def realm_digest(realm: str) -> bytes:
+    return hashlib.blake2b(realm.encode(), digest_size=16, person=b"deskconn-realm").digest()
+
+
+class AuthzIndex:
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+        self._mapped: mmap.mmap | None = None
+        self._open()
+
+    def _open(self) -> None:
+        file = open(self.path, "rb")
+        try:
+            stat = os.fstat(file.fileno())
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            file.close()
+            raise
+
+        magic, version, _, generation, built_at, xid, meta_length, *counts = HEADER.unpack_from(mapped)
+        if magic != MAGIC or version != VERSION:
+            mapped.close()
+            file.close()
+            raise ValueError(f"'{self.path}' is not a version {VERSION} authorization index")
+
+        self.close()
+        self._file, self._mapped, self._inode = file, mapped, stat.st_ino
+        self.generation, self.built_at, self.watermark = generation, built_at, xid
+        self.realm_count, self.subject_count, self.posting_count, self.entry_count = counts
+
+        offset = HEADER.size
+        self.meta = json.loads(mapped[offset : offset + meta_length])
+        offset += meta_length
+        self._realms = offset
+        self._subjects = self._realms + REALM.size * self.realm_count
+        self._postings = self._subjects + SUBJECT.size * self.subject_count
+        self._entries = self._postings + POSTING.size * self.posting_count
+
+    def refresh(self) -> bool:
+        """Maps the file again if the exporter has replaced it; returns whether it had."""
+        if os.stat(self.path).st_ino == self._inode:
+            return False
+
+        self._open()
+        return True
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.built_at
+
+    def _find(self, digest: bytes, start: int, size: int, count: int) -> int | None:
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            offset = start + middle * size
+            probe = self._mapped[offset : offset + 16]
+            if probe < digest:
+                low = middle + 1
+            elif probe > digest:
+                high = middle
+            else:
+                return middle
+
+        return None
+
+    def _has_realm(self, first: int, count: int, realm: int) -> bool:
+        low, high = first, first + count
+        while low < high:
+            middle = (low + high) // 2
+            (value,) = POSTING.unpack_from(self._mapped, self._postings + middle * POSTING.size)
+            if value < realm:
+                low = middle + 1
+            elif value > realm:
+                high = middle
+            else:
+                return True
+
+        return False
+
+    def authorize(self, authid: str, public_key: str, realm: str, now: float | None = None) -> str | None:
+        """The authrole the key authenticates as on the realm, None when the index does not allow it."""
+        entry = self._find(key_digest(authid, public_key), self._entries, ENTRY.size, self.entry_count)
+        if entry is None:
+            return None
+
+        _, subject, expires_at = ENTRY.unpack_from(self._mapped, self._entries + entry * ENTRY.size)
+        if expires_at and expires_at <= (now if now is not None else time.time()):
+            return None
+
+        realm_index = self._find(realm_digest(realm), self._realms, REALM.size, self.realm_count)
+        if realm_index is None:
+            return None
+
+        role, first, count = SUBJECT.unpack_from(self._mapped, self._subjects + subject * SUBJECT.size)
+        if not self._has_realm(first, count, realm_index):
+            return None
+
+        return self.meta["roles"][role].format(authid=authid)
+
+    def close(self) -> None:
+        if self._mapped is not None:
+            self._mapped.close()
+            self._file.close()
+            self._mapped = self._file = None
@@ -0,0 +1,234 @@
+import time
+import asyncio
+import functools
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Any, Awaitable, Callable, Generic, Hashable, Iterable, TypeVar
+
+from deskconn import metrics, invalidation
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+# returned by AsyncCache.get for keys that are not cached; None is a cacheable (negative) result
+MISSING: Any = object()
+
+Tags = Iterable[str] | Callable[[Any], Iterable[str]]
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    negative_hits: int = 0
+    misses: int = 0
+    loads: int = 0
+    coalesced: int = 0
+    load_errors: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    invalidations: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def as_dict(self) -> dict[str, Any]:
+        return {**asdict(self), "hit_rate": self.hit_rate}
+
+
+@dataclass
+class _Entry:
+    value: Any
+    expires_at: float
+    tags: frozenset[str]
+
+
+class _LoadAbandoned(Exception):
+    """The caller loading a key was cancelled; whoever waited on it loads the key itself."""
+
+
+class AsyncCache(Generic[K, V]):
+    """An in-process TTL and LRU cache whose concurrent misses for a key share a single load.
+
+    Values are shared between callers, so cache plain data, not ORM instances bound to a session.
+    """
+
+    def __init__(self, name: str, ttl: float, max_size: int, negative_ttl: float | None = None):
+        self.name = name
+        self.ttl = ttl
+        self.max_size = max_size
+        # how long a None result is cached, None does not cache it at all
+        self.negative_ttl = negative_ttl
+        self.stats = CacheStats()
+
+        self._entries: OrderedDict[K, _Entry] = OrderedDict()
+        self._tags: dict[str, set[K]] = {}
+        self._loading: dict[K, asyncio.Future] = {}
+        # bumped by every invalidation, so a load that started before one is not stored
+        self._epoch = 0
+
+        caches[name] = self
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: K) -> V:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.stats.misses += 1
+            return MISSING
+
+        if entry.expires_at <= time.monotonic():
+            self.stats.expirations += 1
+            self.stats.misses += 1
+            self._remove(key)
+            return MISSING
+
+        self._entries.move_to_end(key)
+        self.stats.hits += 1
+        if entry.value is None:
+            self.stats.negative_hits += 1
+
+        return entry.value
+
+    def peek(self, key: K) -> V:
+        """Like get, without counting towards the stats or the LRU order."""
+        entry = self._entries.get(key)
+        return MISSING if entry is None else entry.value
+
+    def set(self, key: K, value: V, tags: Tags = (), ttl: float | None = None) -> None:
+        if value is None:
+            if self.negative_ttl is None:
+                return
+            ttl = self.negative_ttl
+
+        if key in self._entries:
+            self._remove(key)
+
+        tags = frozenset(tags(value) if callable(tags) else tags)
+        self._entries[key] = _Entry(value=value, expires_at=time.monotonic() + (ttl or self.ttl), tags=tags)
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(key)
+
+        while len(self._entries) > self.max_size:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.stats.evictions += 1
+
+    async def get_or_load(self, key: K, loader: Callable[[], Awaitable[V]], tags: Tags = ()) -> V:
+        value = self.get(key)
+        if value is not MISSING:
+            return value
+
+        while key in self._loading:
+            self.stats.coalesced += 1
+            try:
+                return await asyncio.shield(self._loading[key])
+            except _LoadAbandoned:
+                continue
+
+        future = asyncio.get_running_loop().create_future()
+        self._loading[key] = future
+        epoch = self._epoch
+        self.stats.loads += 1
+        try:
+            value = await loader()
+        except asyncio.CancelledError:
+            self._fail(future, _LoadAbandoned())
+            raise
+        except BaseException as e:
+            self.stats.load_errors += 1
+            self._fail(future, e)
+            raise
+        else:
+            future.set_result(value)
+            if epoch == self._epoch:
+                self.set(key, value, tags)
+
+            return value
+        finally:
+            if self._loading.get(key) is future:
+                del self._loading[key]
+
+    @staticmethod
+    def _fail(future: asyncio.Future, error: BaseException) -> None:
+        future.set_exception(error)
+        # marks the exception retrieved, so asyncio does not log it when no caller was waiting
+        future.exception()
+
+    def invalidate(self, key: K) -> None:
+        self._epoch += 1
+        self._loading.pop(key, None)
+        if key in self._entries:
+            self._remove(key)
+            self.stats.invalidations += 1
+
+    def invalidate_tag(self, tag: str) -> None:
+        self._epoch += 1
+        for key in list(self._tags.get(tag, ())):
+            self._loading.pop(key, None)
+            self._remove(key)
+            self.stats.invalidations += 1
+
+    def clear(self) -> None:
+        self._epoch += 1
+        self._loading.clear()
+        self.stats.invalidations += len(self._entries)
+        self._entries.clear()
+        self._tags.clear()
+
+    def invalidate_on(self, tables: Iterable[str], tags_for: Callable[[invalidation.Change], Iterable[str]]) -> None:
+        """Drops the entries tagged with ``tags_for(change)`` whenever one of the tables changes."""
+
+        def invalidate(change: invalidation.Change | None) -> None:
+            if change is None:
+                self.clear()
+                return
+
+            for tag in tags_for(change):
+                self.invalidate_tag(tag)
+
+        invalidation.register(f"cache:{self.name}", tables, invalidate)
+
+    def _remove(self, key: K) -> None:
+        entry = self._entries.pop(key)
+        for tag in entry.tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+def cached(cache: AsyncCache, key: Callable[..., Hashable], tags: Tags = ()):
+    """Serves an async function from the cache, keyed by ``key`` applied to its arguments.
+
+    ``key`` usually skips the database session argument, e.g. ``key=lambda db, email: email``.
+    """
+
+    def decorator(func: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            return await cache.get_or_load(key(*args, **kwargs), lambda: func(*args, **kwargs), tags)
+
+        wrapper.cache = cache
+        return wrapper
+
+    return decorator
+
+
+caches: dict[str, AsyncCache] = {}
+
+
+def cache_stats() -> dict[str, Any]:
+    collected = {}
+    for name, cache in caches.items():
+        for stat, value in cache.stats.as_dict().items():
+            collected[f"{name}.{stat}"] = value
+        collected[f"{name}.size"] = len(cache)
+
+    return collected
+
+
+metrics.register_collector("caches", cache_stats)
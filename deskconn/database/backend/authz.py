@@ -0,0 +1,49 @@
+from datetime import datetime
+from typing import AsyncIterator
+
+from sqlalchemy import select, union, union_all, Row, null, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from deskconn import models
+
+
+async def read_watermark(db: AsyncSession) -> int:
+    result = await db.execute(text("SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint"))
+
+    return result.scalar()
+
+
+async def stream_user_keys(db: AsyncSession, now: datetime, batch_size: int) -> AsyncIterator[Row]:
+    """Email, user id, public key and expiry of every key a verified user can authenticate with."""
+    principals = (
+        select(models.User.email, models.User.id, models.Principal.public_key, models.Principal.expires_at)
+        .join(models.Principal, models.Principal.user_id == models.User.id)
+        .where(models.User.is_verified.is_(True))
+        .where(models.Principal.expires_at > now)
+    )
+    devices = (
+        select(models.User.email, models.User.id, models.Device.public_key, null().label("expires_at"))
+        .join(models.Device, models.Device.user_id == models.User.id)
+        .where(models.User.is_verified.is_(True))
+    )
+    result = await db.stream(union_all(principals, devices).execution_options(yield_per=batch_size))
+    async for row in result:
+        yield row
+
+
+async def stream_user_realms(db: AsyncSession, batch_size: int) -> AsyncIterator[Row]:
+    """User id and desktop realm of every desktop a user has access to, directly or through an organization."""
+    direct = select(models.DesktopUserAccess.user_id, models.Desktop.realm).join(
+        models.Desktop, models.Desktop.id == models.DesktopUserAccess.desktop_id
+    )
+    via_org = (
+        select(models.OrganizationMember.user_id, models.Desktop.realm)
+        .join(
+            models.DesktopOrganizationAccess,
+            models.DesktopOrganizationAccess.organization_id == models.OrganizationMember.organization_id,
+        )
+        .join(models.Desktop, models.Desktop.id == models.DesktopOrganizationAccess.desktop_id)
+    )
+    result = await db.stream(union(direct, via_org).execution_options(yield_per=batch_size))
+    async for row in result:
+        yield row
@@ -0,0 +1,11 @@
+from datetime import datetime
+
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from deskconn import models
+
+
+async def delete_changes_before(db: AsyncSession, before: datetime) -> None:
+    await db.execute(delete(models.ChangeLog).where(models.ChangeLog.changed_at < before))
+    await db.commit()
@@ -1,10 +1,10 @@
 from uuid import UUID
-from typing import Any
+from typing import Any, AsyncIterator
 from datetime import timedelta
 
 from sqlalchemy.orm import joinedload
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, exists, Sequence, delete, union_all, func
+from sqlalchemy import select, exists, Sequence, delete, union_all, func, Row
 
 from deskconn import models, schemas, helpers
 
@@ -163,6 +163,38 @@ async def get_desktop_by_realm(db: AsyncSession, realm: str) -> models.Desktop |
     return result.scalar()
 
 
+async def stream_authids_and_realms(db: AsyncSession, batch_size: int) -> AsyncIterator[tuple[str, str]]:
+    stmt = select(models.Desktop.authid, models.Desktop.realm).execution_options(yield_per=batch_size)
+    result = await db.stream(stmt)
+    async for authid, realm in result:
+        yield authid, realm
+
+
+_CREDENTIALS = select(
+    models.Desktop.id, models.Desktop.authid, models.Desktop.public_key, models.Desktop.realm, models.Desktop.user_id
+)
+
+
+async def stream_credentials(db: AsyncSession, batch_size: int) -> AsyncIterator[Row]:
+    result = await db.stream(_CREDENTIALS.execution_options(yield_per=batch_size))
+    async for row in result:
+        yield row
+
+
+async def get_credentials(db: AsyncSession, desktop_id: UUID) -> Row | None:
+    result = await db.execute(_CREDENTIALS.where(models.Desktop.id == desktop_id))
+
+    return result.first()
+
+
+async def get_recent_desktops(db: AsyncSession, limit: int) -> Sequence[Row]:
+    """Authid and id of the most recently attached desktops."""
+    stmt = select(models.Desktop.authid, models.Desktop.id).order_by(models.Desktop.created_at.desc()).limit(limit)
+    result = await db.execute(stmt)
+
+    return result.all()
+
+
 async def user_access_exists(db: AsyncSession, desktop_id: UUID, user_id: UUID) -> bool:
     stmt = select(
         exists()
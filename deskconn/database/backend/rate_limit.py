@@ -0,0 +1,40 @@
+from datetime import datetime
+
+from sqlalchemy import text, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from deskconn import models
+
+# refills the bucket for the time since its last update and takes a token in one statement,
+# so concurrent instances cannot both spend the last token
+_TAKE_TOKEN = text(
+    """
+    INSERT INTO deskconn.rate_limit_buckets AS b (key, tokens, updated_at)
+    VALUES (:key, :burst - 1, now())
+    ON CONFLICT (key) DO UPDATE
+    SET tokens = LEAST(:burst, b.tokens + EXTRACT(EPOCH FROM now() - b.updated_at) * :rate) - 1,
+        updated_at = now()
+    WHERE LEAST(:burst, b.tokens + EXTRACT(EPOCH FROM now() - b.updated_at) * :rate) >= 1
+    RETURNING tokens
+    """
+)
+
+
+async def take_tokens(db: AsyncSession, buckets: list[tuple[str, float, int]]) -> bool:
+    """Takes a token from every (key, rate, burst) bucket in one transaction, or from none of them."""
+    # a fixed order keeps two instances taking the same buckets from deadlocking on their rows
+    for key, rate, burst in sorted(buckets):
+        result = await db.execute(_TAKE_TOKEN, {"key": key, "rate": rate, "burst": burst})
+        if result.first() is None:
+            await db.rollback()
+            return False
+
+    await db.commit()
+
+    return True
+
+
+async def delete_full_buckets(db: AsyncSession, updated_before: datetime) -> None:
+    """Buckets untouched long enough to have refilled completely behave like missing ones."""
+    await db.execute(delete(models.RateLimitBucket).where(models.RateLimitBucket.updated_at < updated_before))
+    await db.commit()
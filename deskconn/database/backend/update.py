@@ -1,7 +1,9 @@
 from uuid import UUID
+from typing import Any
+from datetime import datetime
 
 from sqlalchemy.orm import joinedload
-from sqlalchemy import exists, select
+from sqlalchemy import exists, or_, select, Sequence
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from deskconn import models, schemas
@@ -35,8 +37,14 @@ async def create_app_version(db: AsyncSession, app: models.App, data: schemas.Ap
         app_id=app.id,
         version=data.version,
         checksum=data.checksum,
+        size=data.size,
+        rollout_percentage=data.rollout_percentage,
+        rollout_starts_at=data.rollout_starts_at,
+        rollout_ends_at=data.rollout_ends_at,
     )
 
+    app_version.deltas = [models.AppVersionDelta(**delta.model_dump()) for delta in data.deltas]
+
     app.last_updated = app_version.released_at
 
     db.add(app_version)
@@ -55,3 +63,59 @@ async def get_latest_app_version(db: AsyncSession, app_id) -> models.AppVersion
     result = await db.execute(stmt)
 
     return result.scalar()
+
+
+async def get_previous_app_versions(
+    db: AsyncSession, app_id: UUID, released_before: datetime, including_version: str
+) -> Sequence[models.AppVersion]:
+    """Versions released before ``released_before`` that are rolled out, and ``including_version`` in any case."""
+    stmt = (
+        select(models.AppVersion)
+        .where(
+            models.AppVersion.app_id == app_id,
+            models.AppVersion.released_at < released_before,
+            or_(models.AppVersion.rollout_percentage > 0, models.AppVersion.version == including_version),
+        )
+        .order_by(models.AppVersion.released_at.desc())
+    )
+    result = await db.execute(stmt)
+
+    return result.scalars().all()
+
+
+async def get_app_version(db: AsyncSession, app_id: UUID, version: str) -> models.AppVersion | None:
+    stmt = select(models.AppVersion).where(models.AppVersion.app_id == app_id, models.AppVersion.version == version)
+    result = await db.execute(stmt)
+
+    return result.scalar()
+
+
+async def update_app_version_rollout(
+    db: AsyncSession, app_version: models.AppVersion, data: dict[str, Any]
+) -> models.AppVersion:
+    for field, value in data.items():
+        if hasattr(app_version, field):
+            setattr(app_version, field, value)
+
+    await db.commit()
+    await db.refresh(app_version)
+
+    return app_version
+
+
+async def get_app_version_deltas(
+    db: AsyncSession, app_id: UUID, os_name: str, arch: str, released_until: datetime
+) -> Sequence[tuple[models.AppVersionDelta, str]]:
+    stmt = (
+        select(models.AppVersionDelta, models.AppVersion.version)
+        .join(models.AppVersion, models.AppVersion.id == models.AppVersionDelta.app_version_id)
+        .where(
+            models.AppVersion.app_id == app_id,
+            models.AppVersion.released_at <= released_until,
+            models.AppVersionDelta.os == os_name,
+            models.AppVersionDelta.cpu_architecture == arch,
+        )
+    )
+    result = await db.execute(stmt)
+
+    return result.tuples().all()
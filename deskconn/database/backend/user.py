@@ -1,7 +1,7 @@
 from uuid import UUID
-from typing import Any
+from typing import Any, AsyncIterator
 
-from sqlalchemy import select, exists, union_all
+from sqlalchemy import select, exists, union_all, func, Row, Sequence
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from deskconn import models, schemas, helpers
@@ -58,6 +58,12 @@ async def get_user_by_email(db: AsyncSession, email: str) -> models.User | None:
     return result.scalar()
 
 
+async def stream_emails(db: AsyncSession, batch_size: int) -> AsyncIterator[str]:
+    result = await db.stream_scalars(select(models.User.email).execution_options(yield_per=batch_size))
+    async for email in result:
+        yield email
+
+
 async def verify_user(db: AsyncSession, db_user: models.User) -> None:
     db_user.is_verified = True
     await db.commit()
@@ -85,6 +91,20 @@ async def user_exists(db: AsyncSession, email: str) -> bool:
     return bool(result.scalar())
 
 
+async def get_recently_active_users(db: AsyncSession, limit: int) -> Sequence[Row]:
+    """Email and id of the users who most recently logged in, i.e. created a principal."""
+    stmt = (
+        select(models.User.email, models.User.id)
+        .join(models.Principal, models.Principal.user_id == models.User.id)
+        .group_by(models.User.id)
+        .order_by(func.max(models.Principal.created_at).desc())
+        .limit(limit)
+    )
+    result = await db.execute(stmt)
+
+    return result.all()
+
+
 async def get_user_public_keys(db: AsyncSession, user_id: UUID) -> dict[str, list[str]]:
     principal_query = (
         select(models.User.email.label("authid"), models.Principal.public_key.label("public_key"))
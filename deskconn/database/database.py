@@ -1,8 +1,18 @@
 import os
+import time
+import random
+import asyncio
+from collections import deque
+from dataclasses import dataclass, asdict
+from typing import Any, Callable
 
 from dotenv import load_dotenv
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 
+from deskconn import metrics
+
 load_dotenv()
 
 DATABASE_URL = os.getenv("DESKCONN_DATABASE_URL", None)
@@ -10,11 +20,187 @@ DATABASE_URL = os.getenv("DESKCONN_DATABASE_URL", None)
 if DATABASE_URL is None or DATABASE_URL == "":
     raise ValueError("'DESKCONN_DATABASE_URL' missing in environment variables.")
 
-engine = create_async_engine(DATABASE_URL, echo=True)
+DB_POOL_SIZE = int(os.getenv("DESKCONN_DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DESKCONN_DB_MAX_OVERFLOW", "10"))
+
+# statements slower than this are kept in the slow query log
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("DESKCONN_SLOW_QUERY_THRESHOLD_MS", "250"))
+SLOW_QUERY_LOG_SIZE = int(os.getenv("DESKCONN_SLOW_QUERY_LOG_SIZE", "200"))
+# fraction of slow statements that are EXPLAINed (planned, not run again) on a separate connection, 0 disables
+SLOW_QUERY_EXPLAIN_RATE = float(os.getenv("DESKCONN_SLOW_QUERY_EXPLAIN_RATE", "0"))
+
+if not 0 <= SLOW_QUERY_EXPLAIN_RATE <= 1:
+    raise ValueError("'DESKCONN_SLOW_QUERY_EXPLAIN_RATE' must be between 0 and 1.")
+
+# how long recent checkouts waited for a connection, including connecting when the pool grew
+pool_waits: deque[float] = deque(maxlen=256)
+
+
+class TimedPool(AsyncAdaptedQueuePool):
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_waits.append(time.perf_counter() - started)
+
+
+engine = create_async_engine(
+    DATABASE_URL, echo=True, poolclass=TimedPool, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW
+)
 
 AsyncSessionLocal = async_sessionmaker(engine, expire_on_commit=False, autoflush=False, autocommit=False)
 
+# a single connection of its own, so EXPLAINs never compete with procedures for the main pool
+side_engine = create_async_engine(DATABASE_URL, pool_size=1, max_overflow=0)
+# and one for health pings, which must not queue behind a slow EXPLAIN
+health_engine = create_async_engine(DATABASE_URL, pool_size=1, max_overflow=0)
+
 
 async def get_database() -> AsyncSession:
     async with AsyncSessionLocal() as session:
         yield session
+
+
+@dataclass
+class SlowQuery:
+    statement: str
+    parameters: list[str]
+    procedure: str | None
+    duration_ms: float
+    recorded_at: float
+    plan: str | None = None
+
+    def as_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+
+slow_queries: deque[SlowQuery] = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+slow_query_count = 0
+# at most one EXPLAIN in flight; also keeps the task referenced until it finishes
+_explain_task: asyncio.Task | None = None
+
+
+def parameter_shape(parameters: Any) -> list[str]:
+    """Types of the bound parameters; their values can hold credentials or personal data."""
+    if isinstance(parameters, dict):
+        return [f"{key}:{type(value).__name__}" for key, value in parameters.items()]
+
+    if isinstance(parameters, (list, tuple)):
+        return [type(value).__name__ for value in parameters]
+
+    return []
+
+
+async def _explain(entry: SlowQuery, parameters: Any) -> None:
+    try:
+        async with side_engine.connect() as conn:
+            result = await conn.exec_driver_sql(f"EXPLAIN {entry.statement}", parameters)
+            entry.plan = "\n".join(row[0] for row in result)
+    except Exception as e:
+        entry.plan = f"EXPLAIN failed: {e}"
+
+
+def _maybe_explain(entry: SlowQuery, parameters: Any, executemany: bool) -> None:
+    global _explain_task
+
+    if (_explain_task is not None and not _explain_task.done()) or executemany or SLOW_QUERY_EXPLAIN_RATE == 0:
+        return
+
+    if random.random() >= SLOW_QUERY_EXPLAIN_RATE:
+        return
+
+    _explain_task = asyncio.get_running_loop().create_task(_explain(entry, parameters))
+
+
+# (statement, parameters, executemany, duration in seconds, error or None), called after every statement on the
+# main engine from inside its execution, so observers must be quick and must not block
+StatementObserver = Callable[[str, Any, bool, float, BaseException | None], None]
+
+statement_observers: list[StatementObserver] = []
+
+
+def observe_statements(observer: StatementObserver) -> None:
+    """Times statements once for everything that needs their duration, instead of a listener pair each."""
+    statement_observers.append(observer)
+
+
+def _notify(statement: str, parameters: Any, executemany: bool, duration: float, error: BaseException | None) -> None:
+    for observer in statement_observers:
+        observer(statement, parameters, executemany, duration, error)
+
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    context._deskconn_query_started = time.perf_counter()
+
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    _notify(statement, parameters, executemany, time.perf_counter() - context._deskconn_query_started, None)
+
+
+@event.listens_for(engine.sync_engine, "handle_error")
+def _handle_error(exception_context) -> None:
+    context = exception_context.execution_context
+    started = getattr(context, "_deskconn_query_started", None)
+    if started is None:
+        return
+
+    context._deskconn_query_started = None
+    _notify(
+        exception_context.statement,
+        exception_context.parameters,
+        context.executemany,
+        time.perf_counter() - started,
+        exception_context.original_exception,
+    )
+
+
+def _record_slow_query(
+    statement: str, parameters: Any, executemany: bool, duration: float, error: BaseException | None
+) -> None:
+    global slow_query_count
+
+    duration_ms = duration * 1000
+    if error is not None or duration_ms < SLOW_QUERY_THRESHOLD_MS:
+        return
+
+    entry = SlowQuery(
+        statement=statement,
+        parameters=parameter_shape(parameters),
+        procedure=metrics.current_procedure.get(),
+        duration_ms=duration_ms,
+        recorded_at=time.time(),
+    )
+    slow_queries.append(entry)
+    slow_query_count += 1
+
+    _maybe_explain(entry, parameters, executemany)
+
+
+observe_statements(_record_slow_query)
+
+
+def slow_query_stats() -> dict[str, Any]:
+    return {"recorded": slow_query_count, "buffered": len(slow_queries)}
+
+
+metrics.register_collector("slow_queries", slow_query_stats)
+
+
+def pool_stats() -> dict[str, Any]:
+    waits = sorted(pool_waits)
+    capacity = DB_POOL_SIZE + DB_MAX_OVERFLOW
+
+    return {
+        "size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "checked_out": engine.pool.checkedout(),
+        "utilization": engine.pool.checkedout() / capacity if capacity else 0.0,
+        "wait_p95_ms": waits[min(len(waits) - 1, int(0.95 * len(waits)))] * 1000 if waits else 0.0,
+        "wait_max_ms": waits[-1] * 1000 if waits else 0.0,
+    }
+
+
+metrics.register_collector("db_pool", pool_stats)
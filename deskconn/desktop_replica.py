@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import asyncio
+from uuid import UUID
+from typing import Any, Callable, NamedTuple
+
+from deskconn import models, metrics, invalidation, snapshots
+from deskconn.database.database import AsyncSessionLocal
+from deskconn.database.backend import desktop as desktop_backend
+
+# answer desktop cryptosign verification from memory; costs a few hundred bytes per desktop
+DESKTOP_REPLICA = os.getenv("DESKCONN_DESKTOP_REPLICA", "false").lower() in ("true", "1", "yes", "on")
+
+SCAN_BATCH_SIZE = 5000
+RETRY_DELAY = 10.0
+
+
+class DesktopCredentials(NamedTuple):
+    public_key: str
+    realm: str
+    user_id: UUID
+
+
+_desktops: dict[str, DesktopCredentials] = {}
+_authid_by_id: dict[UUID, str] = {}
+
+# bumped whenever changes may have been missed; a load only makes the replica ready if none happened meanwhile
+_generation = 0
+_ready = False
+_loaded = asyncio.Event()
+
+# None asks for a full load, a desktop id for that row to be read again; applied in order by one task
+_pending: asyncio.Queue[UUID | None] = asyncio.Queue()
+_applier: asyncio.Task | None = None
+
+stats = {"verified": 0, "rejected": 0, "loads": 0, "reloads": 0, "errors": 0, "load_seconds": 0.0}
+
+
+def ready() -> bool:
+    # without the listener, changes made by other instances would be missed; pending ones are not applied yet
+    return _ready and invalidation.stats["connected"] and _pending.empty()
+
+
+def verify(authid: str, public_key: str) -> str | None:
+    """The realm of the desktop with this authid and public key, None if there is none; only when ready()."""
+    creds = _desktops.get(authid)
+    if creds is None or creds.public_key != public_key:
+        stats["rejected"] += 1
+        return None
+
+    stats["verified"] += 1
+    return creds.realm
+
+
+def _set(desktop_id: UUID, authid: str, public_key: str, realm: str, user_id: UUID) -> None:
+    _discard(desktop_id)
+    _desktops[authid] = DesktopCredentials(public_key=public_key, realm=realm, user_id=user_id)
+    _authid_by_id[desktop_id] = authid
+
+
+def _discard(desktop_id: UUID) -> None:
+    authid = _authid_by_id.pop(desktop_id, None)
+    if authid is not None:
+        _desktops.pop(authid, None)
+
+
+def put(desktop: models.Desktop) -> None:
+    """Applies a desktop this process created or updated, before its notification arrives."""
+    if DESKTOP_REPLICA:
+        _set(desktop.id, desktop.authid, desktop.public_key, desktop.realm, desktop.user_id)
+
+
+def remove(desktop: models.Desktop) -> None:
+    if DESKTOP_REPLICA:
+        _discard(desktop.id)
+
+
+def _invalidate(change: invalidation.Change | None) -> None:
+    global _generation, _ready
+
+    if change is None:
+        _generation += 1
+        _ready = False
+        _pending.put_nowait(None)
+        return
+
+    # public keys are not in the notification, so the row is read again
+    for desktop_id in change.values("id"):
+        _pending.put_nowait(UUID(desktop_id))
+
+
+async def _load() -> None:
+    global _desktops, _authid_by_id, _ready
+
+    started = time.perf_counter()
+    generation = _generation
+    desktops, authid_by_id = {}, {}
+    async with AsyncSessionLocal() as db:
+        async for row in desktop_backend.stream_credentials(db, SCAN_BATCH_SIZE):
+            desktops[row.authid] = DesktopCredentials(public_key=row.public_key, realm=row.realm, user_id=row.user_id)
+            authid_by_id[row.id] = row.authid
+
+    _desktops, _authid_by_id = desktops, authid_by_id
+    _ready = generation == _generation
+    if _ready:
+        _loaded.set()
+
+    stats["loads"] += 1
+    stats["load_seconds"] = time.perf_counter() - started
+
+
+async def _reload(desktop_id: UUID) -> None:
+    async with AsyncSessionLocal() as db:
+        row = await desktop_backend.get_credentials(db, desktop_id)
+
+    if row is None:
+        _discard(desktop_id)
+    else:
+        _set(row.id, row.authid, row.public_key, row.realm, row.user_id)
+
+    stats["reloads"] += 1
+
+
+async def _apply() -> None:
+    global _generation, _ready
+
+    while True:
+        desktop_id = await _pending.get()
+        try:
+            if desktop_id is None:
+                await _load()
+            else:
+                await _reload(desktop_id)
+        except Exception as e:
+            stats["errors"] += 1
+            print(f"failed to update desktop replica: {e}, reloading in {RETRY_DELAY:.0f}s")
+            _generation += 1
+            _ready = False
+            await asyncio.sleep(RETRY_DELAY)
+            _pending.put_nowait(None)
+
+
+def start() -> None:
+    """Loads the replica when the invalidation listener (re)connects and applies desktop changes after that."""
+    global _applier
+
+    if not DESKTOP_REPLICA or not invalidation.INVALIDATION_LISTEN or _applier is not None:
+        return
+
+    invalidation.register("desktop_replica", ("desktops",), _invalidate)
+    snapshots.register("desktop_replica", dump, load)
+    _applier = asyncio.get_running_loop().create_task(_apply())
+
+
+def dump() -> bytes | None:
+    if not _ready or not _pending.empty():
+        return None
+
+    rows = []
+    for desktop_id, authid in _authid_by_id.items():
+        creds = _desktops[authid]
+        rows.append([str(desktop_id), authid, creds.public_key, creds.realm, str(creds.user_id)])
+
+    return json.dumps(rows, separators=(",", ":")).encode()
+
+
+def load(data: memoryview) -> Callable[[], None]:
+    desktops, authid_by_id = {}, {}
+    for desktop_id, authid, public_key, realm, user_id in json.loads(bytes(data)):
+        desktops[authid] = DesktopCredentials(public_key=public_key, realm=realm, user_id=UUID(user_id))
+        authid_by_id[UUID(desktop_id)] = authid
+
+    def install() -> None:
+        global _desktops, _authid_by_id, _ready
+
+        _desktops, _authid_by_id = desktops, authid_by_id
+        # trusted once the listener has caught up with the changes since the snapshot
+        _ready = True
+        _loaded.set()
+
+    return install
+
+
+async def wait_loaded() -> None:
+    """Returns once the first load has completed, or at once when the replica is not in use."""
+    if _applier is not None:
+        await _loaded.wait()
+
+
+def replica_stats() -> dict[str, Any]:
+    return {**stats, "ready": ready(), "desktops": len(_desktops), "pending": _pending.qsize()}
+
+
+metrics.register_collector("desktop_replica", replica_stats)
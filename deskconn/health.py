@@ -0,0 +1,123 @@
+import os
+import json
+import time
+import asyncio
+from typing import Any
+
+from aiohttp import web
+from sqlalchemy import text
+from xconn.async_session import AsyncSession
+
+from deskconn import helpers, loop_monitor, metrics
+from deskconn.database import database
+
+# a probe within this many seconds of the last check gets its result instead of checking again
+HEALTH_CACHE_SECONDS = float(os.getenv("DESKCONN_HEALTH_CACHE_SECONDS", "2"))
+HEALTH_PING_TIMEOUT = float(os.getenv("DESKCONN_HEALTH_PING_TIMEOUT", "1"))
+HEALTH_MAX_POOL_UTILIZATION = float(os.getenv("DESKCONN_HEALTH_MAX_POOL_UTILIZATION", "0.9"))
+HEALTH_MAX_POOL_WAIT_MS = float(os.getenv("DESKCONN_HEALTH_MAX_POOL_WAIT_MS", "100"))
+HEALTH_MAX_EMAIL_QUEUE = int(os.getenv("DESKCONN_HEALTH_MAX_EMAIL_QUEUE", "100"))
+
+STATUS_READY = "ready"
+STATUS_DEGRADED = "degraded"
+
+router_session: AsyncSession | None = None
+
+_last: tuple[float, dict[str, Any]] | None = None
+_checking: asyncio.Task | None = None
+
+
+async def ping_database() -> dict[str, Any]:
+    # a connection of its own, so a saturated pool shows up as saturation, not as a failed ping
+    started = time.perf_counter()
+    try:
+        async with asyncio.timeout(HEALTH_PING_TIMEOUT):
+            async with database.health_engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+    except Exception as e:
+        return {"ok": False, "error": str(e) or type(e).__name__}
+
+    return {"ok": True, "rtt_ms": (time.perf_counter() - started) * 1000}
+
+
+async def ping_router(session: AsyncSession | None) -> dict[str, Any]:
+    if session is None or session.wait_task.done():
+        return {"ok": False, "error": "not connected"}
+
+    try:
+        rtt = await session.ping(HEALTH_PING_TIMEOUT)
+    except Exception as e:
+        return {"ok": False, "error": str(e) or type(e).__name__}
+
+    return {"ok": True, "rtt_ms": rtt}
+
+
+def cache_hit_ratios() -> dict[str, float]:
+    ratios = {}
+    for name, collector in metrics.collectors.items():
+        for key, value in collector().items():
+            if key.endswith("hit_rate"):
+                ratios[f"{name}.{key}"] = value
+
+    return ratios
+
+
+async def check(session: AsyncSession | None) -> dict[str, Any]:
+    db_ping, router_ping = await asyncio.gather(ping_database(), ping_router(session))
+    pool = database.pool_stats()
+    email = helpers.email_queue_stats()
+    loop = {"lag_ms": loop_monitor.stats.last_lag_ms, "tasks": loop_monitor.stats.tasks}
+
+    reasons = []
+    if not db_ping["ok"]:
+        reasons.append(f"database ping failed: {db_ping['error']}")
+    if not router_ping["ok"]:
+        reasons.append(f"router ping failed: {router_ping['error']}")
+    if pool["utilization"] >= HEALTH_MAX_POOL_UTILIZATION and pool["wait_p95_ms"] >= HEALTH_MAX_POOL_WAIT_MS:
+        reasons.append(f"database pool saturated, p95 wait {pool['wait_p95_ms']:.0f}ms")
+    if email["pending"] > HEALTH_MAX_EMAIL_QUEUE:
+        reasons.append(f"{email['pending']} emails queued")
+    if loop["lag_ms"] >= loop_monitor.LOOP_LAG_ALERT_MS:
+        reasons.append(f"event loop lagging {loop['lag_ms']:.0f}ms")
+
+    return {
+        "status": STATUS_DEGRADED if reasons else STATUS_READY,
+        "reasons": reasons,
+        "checked_at": time.time(),
+        "database": {**db_ping, "pool": pool},
+        "router": router_ping,
+        "email": email,
+        "caches": cache_hit_ratios(),
+        "loop": loop,
+    }
+
+
+async def get(session: AsyncSession | None) -> dict[str, Any]:
+    """The last check if it is recent enough, otherwise a new one shared by concurrent probes."""
+    global _last, _checking
+
+    if _last is not None and time.monotonic() - _last[0] < HEALTH_CACHE_SECONDS:
+        return _last[1]
+
+    if _checking is None or _checking.done():
+        _checking = asyncio.get_running_loop().create_task(check(session))
+
+    result = await asyncio.shield(_checking)
+    _last = (time.monotonic(), result)
+
+    return result
+
+
+async def serve_health(_: web.Request) -> web.Response:
+    result = await get(router_session)
+    status = 200 if result["status"] == STATUS_READY else 503
+
+    return web.Response(text=json.dumps(result), status=status, content_type="application/json")
+
+
+def start(session: AsyncSession) -> None:
+    global router_session
+    router_session = session
+
+
+metrics.register_endpoint("/health", serve_health)
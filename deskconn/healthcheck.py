@@ -0,0 +1,66 @@
+"""Container healthcheck against the ``/health`` probe of this instance.
+
+    python -m deskconn.healthcheck
+
+Exits 0 when ``/health`` on ``DESKCONN_METRICS_PORT`` reports ready, 1 when it is degraded or does not answer. With
+``DESKCONN_WORKERS`` set, as for the supervisor, every worker has to answer ready on one of the two ports the supervisor
+alternates it between, and none may answer degraded. Only the standard library is imported, so a probe stays cheap
+next to the service; the supervisor it shares the port scheme with does the same.
+"""
+
+import os
+import sys
+import urllib.error
+import urllib.request
+
+from deskconn.supervisor import metrics_port
+
+PROBE_TIMEOUT = float(os.getenv("DESKCONN_HEALTHCHECK_TIMEOUT", "3"))
+
+
+def probe(host: str, port: int) -> tuple[bool | None, str]:
+    """Whether /health on the port reports ready, None when nothing answers, with what it answered."""
+    try:
+        with urllib.request.urlopen(f"http://{host}:{port}/health", timeout=PROBE_TIMEOUT):
+            return True, f"port {port} is ready"
+    except urllib.error.HTTPError as e:
+        return False, f"port {port} answered {e.code}: {e.read().decode(errors='replace')}"
+    except OSError as e:
+        return None, f"port {port} did not answer: {e}"
+
+
+def check_workers(host: str, port: int, workers: int) -> list[str]:
+    problems = []
+    for slot in range(workers):
+        # a replacement runs next to the worker it replaces on the other port
+        answers = [probe(host, metrics_port(port, slot, generation, workers)) for generation in (0, 1)]
+        ready = [state for state, _ in answers if state is not None]
+        if not ready or not all(ready):
+            problems.append(f"worker {slot}: " + "; ".join(detail for _, detail in answers))
+
+    return problems
+
+
+def main():
+    port = os.getenv("DESKCONN_METRICS_PORT", "")
+    if port == "":
+        sys.exit("'DESKCONN_METRICS_PORT' must be set, /health is served on the metrics port")
+
+    host = os.getenv("DESKCONN_METRICS_HOST", "127.0.0.1")
+    # a probe from inside the container cannot reach the wildcard address itself
+    if host in ("0.0.0.0", "::"):
+        host = "127.0.0.1"
+
+    workers = int(os.getenv("DESKCONN_WORKERS", "0"))
+    if workers > 0:
+        problems = check_workers(host, int(port), workers)
+    else:
+        ready, detail = probe(host, int(port))
+        problems = [] if ready else [detail]
+
+    if problems:
+        sys.exit("\n".join(problems))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,7 @@ import hmac
 import time
 import base64
 import secrets
+import heapq
 import hashlib
 import threading
 from uuid import UUID
@@ -16,7 +17,7 @@ from xconn.exception import ApplicationError
 from xconn.async_session import AsyncSession
 from wampproto.auth.wampcra import derive_cra_key
 
-from deskconn import uris
+from deskconn import metrics, uris, tracing
 
 load_dotenv()
 
@@ -25,6 +26,7 @@ KEY_LENGTH = 32
 TURN_CREDS_TTL = 3600
 
 ROLE_USER = "user"
+ROLE_ADMIN = "admin"
 ROLE_DESKTOP = "xconnio:deskconn:desktop:{authid}"
 OTP_LENGTH = 6
 OTP_EXPIRY_MINUTES = 5
@@ -32,6 +34,7 @@ OTP_PURPOSE_VERIFY = "verify"
 OTP_PURPOSE_LOGIN = "login"
 OTP_PURPOSE_PASSWORD_RESET = "password_reset"
 DEFAULT_DESKCONN_RELEASE_BASE_URL = "https://github.com/xconnio/deskconn/releases/download"
+ROLLOUT_BUCKETS = 100
 
 CLOUD_REALM = "io.xconn.deskconn"
 TOPIC_DESKTOP_DETACH = "io.xconn.deskconn.desktop.{machine_id}.detach"
@@ -51,6 +54,18 @@ COTURN_SECRET = os.getenv("COTURN_SECRET", None)
 if COTURN_SECRET is None or COTURN_SECRET == "":
     raise ValueError("'COTURN_SECRET' missing in environment variables.")
 
+# issued TURN credentials are handed out again until this fraction of TURN_CREDS_TTL has elapsed
+TURN_CREDS_REUSE_FRACTION = float(os.getenv("TURN_CREDS_REUSE_FRACTION", "0.5"))
+# 0 would serve every request fresh credentials, which the cache is there to avoid
+if not 0 < TURN_CREDS_REUSE_FRACTION < 1:
+    raise ValueError("'TURN_CREDS_REUSE_FRACTION' must be between 0 and 1.")
+
+TURN_CREDS_CACHE_SIZE = int(os.getenv("TURN_CREDS_CACHE_SIZE", "10000"))
+
+# each email is sent on a thread of its own; pending counts the sends still in flight
+_email_lock = threading.Lock()
+email_stats = {"pending": 0, "sent": 0, "failed": 0}
+
 
 def utcnow():
     return datetime.now(timezone.utc)
@@ -66,6 +81,86 @@ def release_download_url(base_url: str, version: str, application_name: str, os_
     return f"{base_url.rstrip('/')}/v{version}/{asset_name}"
 
 
+def release_delta_asset_name(application_name: str, from_version: str, to_version: str, os_name: str, arch: str) -> str:
+    return f"{application_name}_{from_version.lstrip('v')}_to_{to_version.lstrip('v')}_{os_name}_{arch}.delta"
+
+
+def release_delta_download_url(
+    base_url: str, from_version: str, to_version: str, application_name: str, os_name: str, arch: str
+) -> str:
+    asset_name = release_delta_asset_name(application_name, from_version, to_version, os_name, arch)
+
+    return f"{base_url.rstrip('/')}/v{to_version}/{asset_name}"
+
+
+def cheapest_delta_path(
+    deltas: list[tuple[str, str, int, Any]], from_version: str, to_version: str
+) -> tuple[int, list[Any]] | None:
+    """Finds the chain of (from_version, to_version, size, item) deltas with the fewest total bytes."""
+    edges: dict[str, list[tuple[str, int, Any]]] = {}
+    for source, target, size, item in deltas:
+        edges.setdefault(source, []).append((target, size, item))
+
+    best = {from_version: 0}
+    # the counter keeps heap entries comparable when sizes tie
+    queue = [(0, 0, from_version, [])]
+    counter = 0
+    while queue:
+        total, _, version, path = heapq.heappop(queue)
+        if version == to_version:
+            return total, path
+
+        if total > best.get(version, total):
+            continue
+
+        for target, size, item in edges.get(version, []):
+            cost = total + size
+            if cost < best.get(target, cost + 1):
+                best[target] = cost
+                counter += 1
+                heapq.heappush(queue, (cost, counter, target, path + [item]))
+
+    return None
+
+
+def rollout_bucket(application_name: str, authid: str) -> int:
+    digest = hashlib.sha256(f"{application_name}:{authid}".encode()).digest()
+
+    return int.from_bytes(digest[:8], "big") % ROLLOUT_BUCKETS
+
+
+def rollout_percentage(
+    percentage: int,
+    starts_at: datetime | None,
+    ends_at: datetime | None,
+    now: datetime | None = None,
+) -> float:
+    if now is None:
+        now = utcnow()
+
+    if starts_at is not None and starts_at.tzinfo is None:
+        starts_at = starts_at.replace(tzinfo=timezone.utc)
+
+    if ends_at is not None and ends_at.tzinfo is None:
+        ends_at = ends_at.replace(tzinfo=timezone.utc)
+
+    if starts_at is not None and now < starts_at:
+        return 0
+
+    if starts_at is None or ends_at is None or now >= ends_at:
+        return percentage
+
+    # ramp linearly from 0 at starts_at up to the configured percentage at ends_at
+    elapsed = (now - starts_at).total_seconds()
+    duration = (ends_at - starts_at).total_seconds()
+
+    return percentage * elapsed / duration
+
+
+def in_rollout_cohort(bucket: int, percentage: int, starts_at: datetime | None, ends_at: datetime | None) -> bool:
+    return bucket < rollout_percentage(percentage, starts_at, ends_at) * ROLLOUT_BUCKETS / 100
+
+
 def hash_password_and_generate_salt(password: str) -> Tuple[str, str]:
     salt = generate_salt()
 
@@ -137,20 +232,45 @@ def send_user_verification_email(user_email: str, code: str) -> None:
         "text": f"Your verification code is: {code}",
     }
 
-    thread = threading.Thread(target=send_email, args=(params,))
+    queue_email(params)
+
+
+def queue_email(params: resend.Emails.SendParams) -> None:
+    with _email_lock:
+        email_stats["pending"] += 1
+
+    thread = threading.Thread(target=_send_queued_email, args=(params,))
     thread.start()
 
 
-def send_email(params: resend.Emails.SendParams) -> None:
+def _send_queued_email(params: resend.Emails.SendParams) -> None:
+    sent = send_email(params)
+    with _email_lock:
+        email_stats["pending"] -= 1
+        email_stats["sent" if sent else "failed"] += 1
+
+
+def send_email(params: resend.Emails.SendParams) -> bool:
     if X_DEBUG:
         print("-------------------------------------")
         print(f"[X_DEBUG] OTP email to {params['to']}: {params['text']}")
         print("-------------------------------------")
-        return
+        return True
     try:
         resend.Emails.send(params)
     except Exception as e:
         print("Failed to send email, reason:", e)
+        return False
+
+    return True
+
+
+def email_queue_stats() -> dict[str, Any]:
+    with _email_lock:
+        return dict(email_stats)
+
+
+metrics.register_collector("email", email_queue_stats)
 
 
 def send_desktop_invite_email(inviter: str, invitee: str):
@@ -161,8 +281,7 @@ def send_desktop_invite_email(inviter: str, invitee: str):
         "text": f"You have been invited by {inviter} to access a desktop.",
     }
 
-    thread = threading.Thread(target=send_email, args=(params,))
-    thread.start()
+    queue_email(params)
 
 
 def send_organization_invite_email(inviter: str, invitee: str):
@@ -173,17 +292,26 @@ def send_organization_invite_email(inviter: str, invitee: str):
         "text": f"You have been invited to join the {inviter}'s organization.",
     }
 
-    thread = threading.Thread(target=send_email, args=(params,))
-    thread.start()
+    queue_email(params)
 
 
 async def call_cloud_router_rpc(session: AsyncSession, uri: str, args: list[Any], error_message: str) -> None:
-    try:
-        await session.call(uri, args)
-    except ApplicationError as app_err:
-        raise ApplicationError(uris.ERROR_INTERNAL_ERROR, f"{error_message}. Error is: {app_err.args}")
-    except Exception as err:
-        raise ApplicationError(uris.ERROR_INTERNAL_ERROR, str(err))
+    with tracing.span(uri, tracing.KIND_CLIENT, {"rpc.system": "wamp", "rpc.method": uri}) as span:
+        try:
+            await session.call(uri, args, options=tracing.inject(None, span))
+        except ApplicationError as app_err:
+            raise ApplicationError(uris.ERROR_INTERNAL_ERROR, f"{error_message}. Error is: {app_err.args}")
+        except Exception as err:
+            raise ApplicationError(uris.ERROR_INTERNAL_ERROR, str(err))
+
+
+async def publish(
+    session: AsyncSession, topic: str, args: list[Any] | None = None, options: dict[str, Any] | None = None
+) -> None:
+    with tracing.span(
+        topic, tracing.KIND_PRODUCER, {"messaging.system": "wamp", "messaging.destination": topic}
+    ) as span:
+        await session.publish(topic, args, options=tracing.inject(options, span))
 
 
 @dataclass
@@ -0,0 +1,229 @@
+import os
+import json
+import asyncio
+from datetime import datetime, timedelta
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable
+
+import asyncpg
+
+from deskconn import helpers, metrics
+from deskconn.database.database import AsyncSessionLocal
+from deskconn.database.backend import change_log as change_log_backend
+
+# must match the channel of the notify triggers in the b5e0c7d3a912 migration
+CHANNEL = "deskconn_invalidate"
+
+INVALIDATION_LISTEN = os.getenv("DESKCONN_INVALIDATION_LISTEN", "true").lower() in ("true", "1", "yes", "on")
+# how long changes stay in the change log; a process away for longer flushes its caches instead of catching up
+CHANGE_LOG_RETENTION_SECONDS = float(os.getenv("DESKCONN_CHANGE_LOG_RETENTION_SECONDS", "86400"))
+
+OP_TRUNCATE = "truncate"
+# sent by hand or by bulk loads that bypass the triggers: every cache drops everything
+OP_FLUSH = "flush"
+
+INITIAL_RECONNECT_DELAY = 1.0
+MAX_RECONNECT_DELAY = 30.0
+KEEPALIVE_INTERVAL = 30.0
+CLEANUP_INTERVAL = 600
+
+# transactions older than the oldest one still running, per the database clock
+_READ_WATERMARK = "SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint AS xid, now() AS at"
+_READ_CHANGES = "SELECT payload FROM deskconn.change_log WHERE xid >= $1 ORDER BY id"
+
+
+@dataclass
+class Change:
+    table: str
+    op: str
+    old: dict[str, Any] | None
+    new: dict[str, Any] | None
+
+    def values(self, column: str) -> set[Any]:
+        """The column's value before and after the change, e.g. both emails of a renamed user."""
+        return {row[column] for row in (self.old, self.new) if row is not None and row.get(column) is not None}
+
+
+@dataclass(frozen=True)
+class Watermark:
+    # every transaction with a smaller id had finished, and its changes were applied
+    xid: int
+    at: datetime
+
+    def as_dict(self) -> dict[str, Any]:
+        return {"xid": self.xid, "at": self.at.isoformat()}
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "Watermark":
+        return cls(xid=int(data["xid"]), at=datetime.fromisoformat(data["at"]))
+
+
+@dataclass
+class Invalidator:
+    tables: frozenset[str]
+    # called for row changes of the tables, with None when the whole cache has to go
+    invalidate: Callable[[Change | None], None]
+
+
+invalidators: dict[str, Invalidator] = {}
+stats = {"connected": False, "notifications": 0, "replayed": 0, "flushes": 0, "reconnects": 0, "errors": 0}
+
+_listener: asyncio.Task | None = None
+_cleanup: asyncio.Task | None = None
+_connected = asyncio.Event()
+
+# where a (re)connecting listener catches up from, None flushes every cache instead
+_synced: Watermark | None = None
+# the latest watermark, not yet synced: notifications of the transactions before it may still be on their way
+_reading: Watermark | None = None
+
+
+def register(name: str, tables: Iterable[str], invalidate: Callable[[Change | None], None]) -> None:
+    invalidators[name] = Invalidator(tables=frozenset(tables), invalidate=invalidate)
+
+
+def flush() -> None:
+    stats["flushes"] += 1
+    for name, invalidator in invalidators.items():
+        _call(name, invalidator, None)
+
+
+def _call(name: str, invalidator: Invalidator, change: Change | None) -> None:
+    try:
+        invalidator.invalidate(change)
+    except Exception as e:
+        stats["errors"] += 1
+        print(f"invalidator {name} failed: {e}")
+
+
+def synced() -> Watermark | None:
+    """The watermark the caches are in sync with, while the listener is connected."""
+    return _synced if stats["connected"] else None
+
+
+def resume_from(watermark: Watermark) -> None:
+    """Catches up from the watermark on connect instead of flushing, for caches restored from a snapshot."""
+    global _synced
+    _synced = watermark
+
+
+def dispatch(payload: str) -> None:
+    try:
+        message = json.loads(payload)
+    except ValueError:
+        print(f"ignoring malformed invalidation payload {payload!r}")
+        return
+
+    if message.get("op") == OP_FLUSH:
+        flush()
+        return
+
+    change = Change(table=message.get("t"), op=message.get("op"), old=message.get("old"), new=message.get("new"))
+    for name, invalidator in invalidators.items():
+        if change.table in invalidator.tables:
+            _call(name, invalidator, None if change.op == OP_TRUNCATE else change)
+
+
+def _notified(payload: str) -> None:
+    stats["notifications"] += 1
+    dispatch(payload)
+
+
+async def _read_watermark(conn: asyncpg.Connection) -> Watermark:
+    row = await conn.fetchrow(_READ_WATERMARK)
+    return Watermark(xid=row["xid"], at=row["at"])
+
+
+async def _catch_up(conn: asyncpg.Connection) -> None:
+    now = await conn.fetchval("SELECT now()")
+    # changes of transactions that started well before the watermark may already be deleted
+    if _synced is None or now - _synced.at > timedelta(seconds=CHANGE_LOG_RETENTION_SECONDS / 2):
+        flush()
+        return
+
+    for row in await conn.fetch(_READ_CHANGES, _synced.xid):
+        stats["replayed"] += 1
+        dispatch(row["payload"])
+
+
+async def _listen(dsn: str) -> None:
+    global _synced, _reading
+
+    delay = INITIAL_RECONNECT_DELAY
+    while True:
+        lost = asyncio.Event()
+        try:
+            conn = await asyncpg.connect(dsn)
+        except Exception as e:
+            print(f"invalidation listener failed to connect: {e}, retrying in {delay:.0f}s")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, MAX_RECONNECT_DELAY)
+            continue
+
+        try:
+            conn.add_termination_listener(lambda _: lost.set())
+            await conn.add_listener(CHANNEL, lambda _conn, _pid, _channel, payload: _notified(payload))
+
+            # changes made while the listener was away were never seen, they are replayed or everything is flushed
+            await _catch_up(conn)
+            _reading = await _read_watermark(conn)
+
+            stats["connected"] = True
+            _connected.set()
+            delay = INITIAL_RECONNECT_DELAY
+            while not lost.is_set():
+                try:
+                    await asyncio.wait_for(lost.wait(), KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    # also notices a dead peer whose socket was never closed
+                    reading = await asyncio.wait_for(_read_watermark(conn), KEEPALIVE_INTERVAL)
+                    # an interval later, the notifications from before the previous reading have arrived
+                    _synced, _reading = _reading, reading
+        except Exception as e:
+            print(f"invalidation listener failed: {e}")
+        finally:
+            stats["connected"] = False
+            _reading = None
+            stats["reconnects"] += 1
+            if not conn.is_closed():
+                conn.terminate()
+
+        print("invalidation listener disconnected, reconnecting")
+        await asyncio.sleep(delay)
+
+
+async def _delete_old_changes() -> None:
+    while True:
+        await asyncio.sleep(CLEANUP_INTERVAL)
+        try:
+            async with AsyncSessionLocal() as db:
+                before = helpers.utcnow() - timedelta(seconds=CHANGE_LOG_RETENTION_SECONDS)
+                await change_log_backend.delete_changes_before(db, before)
+        except Exception as e:
+            print(f"failed to delete old changes: {e}")
+
+
+def start(database_url: str) -> None:
+    """Opens the listener connection; it is kept open, and reopened, for the life of the process."""
+    global _listener, _cleanup
+
+    if not INVALIDATION_LISTEN or _listener is not None:
+        return
+
+    dsn = database_url.replace("postgresql+asyncpg://", "postgresql://", 1)
+    loop = asyncio.get_running_loop()
+    _listener = loop.create_task(_listen(dsn))
+    _cleanup = loop.create_task(_delete_old_changes())
+
+
+async def wait_connected() -> None:
+    """Returns once the listener has connected for the first time, or at once when it is not in use."""
+    if _listener is not None:
+        await _connected.wait()
+
+
+def invalidation_stats() -> dict[str, Any]:
+    return {**stats, "invalidators": len(invalidators), "synced_xid": _synced.xid if _synced is not None else None}
+
+
+metrics.register_collector("invalidation", invalidation_stats)
@@ -0,0 +1,229 @@
+import os
+import math
+import time
+import asyncio
+import struct
+import hashlib
+from typing import Any, Callable
+
+from deskconn import metrics, invalidation, snapshots
+from deskconn.database.database import AsyncSessionLocal
+from deskconn.database.backend import user as user_backend
+from deskconn.database.backend import desktop as desktop_backend
+
+LOOKUP_FILTER = os.getenv("DESKCONN_LOOKUP_FILTER", "true").lower() in ("true", "1", "yes", "on")
+# entries the filter is sized for at LOOKUP_FILTER_ERROR_RATE; rebuilds grow it when the tables outgrow it
+LOOKUP_FILTER_CAPACITY = int(os.getenv("DESKCONN_LOOKUP_FILTER_CAPACITY", "1000000"))
+LOOKUP_FILTER_ERROR_RATE = float(os.getenv("DESKCONN_LOOKUP_FILTER_ERROR_RATE", "0.01"))
+# deleted users and desktops stay in the filter until it is rebuilt
+LOOKUP_FILTER_REBUILD_SECONDS = float(os.getenv("DESKCONN_LOOKUP_FILTER_REBUILD_SECONDS", "3600"))
+
+if LOOKUP_FILTER_CAPACITY < 1:
+    raise ValueError("'DESKCONN_LOOKUP_FILTER_CAPACITY' must be at least 1.")
+
+if not 0 < LOOKUP_FILTER_ERROR_RATE < 1:
+    raise ValueError("'DESKCONN_LOOKUP_FILTER_ERROR_RATE' must be between 0 and 1.")
+
+KIND_EMAIL = "email"
+KIND_AUTHID = "authid"
+KIND_REALM = "realm"
+
+SCAN_BATCH_SIZE = 5000
+RETRY_DELAY = 10.0
+
+
+class BloomFilter:
+    """A set that may answer "maybe" for values never added, but never "no" for one that was."""
+
+    _HEADER = struct.Struct("<QQQ")
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.size = max(64, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def to_bytes(self) -> bytes:
+        return self._HEADER.pack(self.size, self.hashes, self.count) + self._bits
+
+    @classmethod
+    def from_bytes(cls, data: memoryview) -> "BloomFilter":
+        bloom = cls.__new__(cls)
+        bloom.size, bloom.hashes, bloom.count = cls._HEADER.unpack_from(data)
+        bloom._bits = bytearray(data[cls._HEADER.size :])
+        if len(bloom._bits) != (bloom.size + 7) // 8:
+            raise ValueError("truncated bloom filter")
+
+        return bloom
+
+    def _positions(self, value: str) -> list[int]:
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        # two independent hashes combined give as many as needed (Kirsch-Mitzenmacher)
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, value: str) -> None:
+        for position in self._positions(value):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+    @property
+    def error_rate(self) -> float:
+        return (1 - math.exp(-self.hashes * self.count / self.size)) ** self.hashes
+
+
+# None until the first scan completes, and after changes may have been missed: then every value might exist
+_filter: BloomFilter | None = None
+# the filter being scanned into; changes seen meanwhile go to both
+_building: BloomFilter | None = None
+_rebuild_requested = asyncio.Event()
+_built = asyncio.Event()
+_maintainer: asyncio.Task | None = None
+
+stats = {"checks": 0, "rejected": 0, "unfiltered": 0, "rebuilds": 0, "errors": 0, "build_seconds": 0.0}
+
+
+def _key(kind: str, value: str) -> str:
+    return f"{kind}:{value}"
+
+
+def add(kind: str, value: str) -> None:
+    for bloom in (_filter, _building):
+        if bloom is not None:
+            bloom.add(_key(kind, value))
+
+
+def might_exist(kind: str, value: str) -> bool:
+    """False only when no user or desktop has the value, so the database need not be asked.
+
+    Values created here are added when they are created and those created elsewhere when their notification arrives,
+    so a miss is only let through while the filter may have missed changes: before a scan, after a flush, or while
+    the listener is disconnected or catching up on reconnect.
+    """
+    stats["checks"] += 1
+
+    # without the listener, values created by other instances would be missed
+    if _filter is None or not invalidation.stats["connected"]:
+        stats["unfiltered"] += 1
+        return True
+
+    if _key(kind, value) in _filter:
+        return True
+
+    stats["rejected"] += 1
+    return False
+
+
+def _invalidate(change: invalidation.Change | None) -> None:
+    global _filter
+
+    if change is None:
+        _filter = None
+        _rebuild_requested.set()
+        return
+
+    if change.op == "delete":
+        return
+
+    if change.table == "users":
+        for email in change.values("email"):
+            add(KIND_EMAIL, email)
+    else:
+        for authid in change.values("authid"):
+            add(KIND_AUTHID, authid)
+        for realm in change.values("realm"):
+            add(KIND_REALM, realm)
+
+
+invalidation.register("lookup_filter", ("users", "desktops"), _invalidate)
+
+
+async def _rebuild() -> None:
+    global _filter, _building
+
+    started = time.perf_counter()
+    capacity = max(LOOKUP_FILTER_CAPACITY, 2 * (_filter.count if _filter is not None else 0))
+    # set before the scan's snapshot is taken, so no change falls between the two
+    _building = BloomFilter(capacity, LOOKUP_FILTER_ERROR_RATE)
+    try:
+        async with AsyncSessionLocal() as db:
+            async for email in user_backend.stream_emails(db, SCAN_BATCH_SIZE):
+                _building.add(_key(KIND_EMAIL, email))
+
+            async for authid, realm in desktop_backend.stream_authids_and_realms(db, SCAN_BATCH_SIZE):
+                _building.add(_key(KIND_AUTHID, authid))
+                _building.add(_key(KIND_REALM, realm))
+
+        # a flush during the scan means changes may have been missed, the next rebuild replaces this one
+        if not _rebuild_requested.is_set():
+            _filter = _building
+            _built.set()
+    finally:
+        _building = None
+
+    stats["rebuilds"] += 1
+    stats["build_seconds"] = time.perf_counter() - started
+
+
+async def _maintain() -> None:
+    while True:
+        try:
+            await asyncio.wait_for(_rebuild_requested.wait(), LOOKUP_FILTER_REBUILD_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+        _rebuild_requested.clear()
+        try:
+            await _rebuild()
+        except Exception as e:
+            stats["errors"] += 1
+            print(f"failed to build lookup filter: {e}, retrying in {RETRY_DELAY:.0f}s")
+            await asyncio.sleep(RETRY_DELAY)
+            _rebuild_requested.set()
+
+
+def start() -> None:
+    """Builds the filter when the invalidation listener (re)connects, and rebuilds it periodically."""
+    global _maintainer
+
+    if not LOOKUP_FILTER or not invalidation.INVALIDATION_LISTEN or _maintainer is not None:
+        return
+
+    snapshots.register("lookup_filter", dump, load)
+    _maintainer = asyncio.get_running_loop().create_task(_maintain())
+
+
+def dump() -> bytes | None:
+    return _filter.to_bytes() if _filter is not None else None
+
+
+def load(data: memoryview) -> Callable[[], None]:
+    bloom = BloomFilter.from_bytes(data)
+
+    def install() -> None:
+        global _filter
+        _filter = bloom
+        _built.set()
+
+    return install
+
+
+async def wait_built() -> None:
+    """Returns once the first scan has completed, or at once when the filter is not in use."""
+    if _maintainer is not None:
+        await _built.wait()
+
+
+def lookup_filter_stats() -> dict[str, Any]:
+    collected = {**stats, "ready": _filter is not None and invalidation.stats["connected"]}
+    if _filter is not None:
+        collected.update(entries=_filter.count, bits=_filter.size, hashes=_filter.hashes, error_rate=_filter.error_rate)
+
+    return collected
+
+
+metrics.register_collector("lookup_filter", lookup_filter_stats)
@@ -0,0 +1,215 @@
+import os
+import sys
+import time
+import asyncio
+import threading
+from collections import deque
+from dataclasses import dataclass, asdict
+from types import FrameType
+from typing import Any
+
+from deskconn import metrics
+
+# how often the loop is probed; lag is how late the probe wakes up
+LOOP_LAG_INTERVAL_MS = float(os.getenv("DESKCONN_LOOP_LAG_INTERVAL_MS", "100"))
+LOOP_LAG_ALERT_MS = float(os.getenv("DESKCONN_LOOP_LAG_ALERT_MS", "100"))
+# a loop blocked longer than this has its stack sampled and reported, 0 disables the sampling
+SLOW_CALLBACK_MS = float(os.getenv("DESKCONN_SLOW_CALLBACK_MS", "50"))
+SLOW_CALLBACK_LOG_SIZE = int(os.getenv("DESKCONN_SLOW_CALLBACK_LOG_SIZE", "100"))
+
+# at most one lag alert is printed per this many seconds
+ALERT_INTERVAL = 10.0
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+API_DIR = os.path.join(PACKAGE_DIR, "api")
+
+
+@dataclass
+class SlowCallback:
+    # the innermost deskconn frame the loop was blocked in, and the procedure handler running it
+    callback: str
+    handler: str | None
+    # from the unanswered ping to its answer, so at most the threshold short of the whole stall
+    duration_ms: float
+    recorded_at: float
+
+    def as_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+
+@dataclass
+class LoopStats:
+    lag: metrics.Histogram
+    last_lag_ms: float = 0.0
+    max_lag_ms: float = 0.0
+    tasks: int = 0
+    max_tasks: int = 0
+    alerts: int = 0
+    slow_callbacks: int = 0
+
+
+stats = LoopStats(lag=metrics.Histogram())
+slow_callbacks: deque[SlowCallback] = deque(maxlen=SLOW_CALLBACK_LOG_SIZE)
+
+_monitor: asyncio.Task | None = None
+_last_alert = 0.0
+
+
+def _label(frame: FrameType) -> str:
+    code = frame.f_code
+    if code.co_filename.startswith(PACKAGE_DIR):
+        path = os.path.relpath(code.co_filename, os.path.dirname(PACKAGE_DIR))
+    else:
+        path = code.co_filename.rsplit("site-packages/", 1)[-1]
+    path = path.removesuffix(".py")
+
+    return f"{path}:{code.co_qualname}"
+
+
+def describe(frames: list[FrameType]) -> tuple[str, str | None]:
+    """Where a stack, innermost frame first, blocks: its innermost deskconn frame and its procedure handler."""
+    ours = [frame for frame in frames if frame.f_code.co_filename.startswith(PACKAGE_DIR)]
+    handlers = [frame for frame in ours if frame.f_code.co_filename.startswith(API_DIR)]
+
+    callback = _label(ours[0] if ours else frames[0]) if frames else "unknown"
+    handler = _label(handlers[-1]) if handlers else None
+
+    return callback, handler
+
+
+class Watchdog:
+    """Pings the loop from a thread of its own and samples the loop thread's stack when a ping goes unanswered.
+
+    A ping is an event set by a callback scheduled with call_soon_threadsafe; while it waits longer than the threshold,
+    whatever runs on the loop thread is what blocks it, and the stall lasts until the ping is answered.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, loop_thread: int, threshold: float):
+        self.loop = loop
+        self.loop_thread = loop_thread
+        self.threshold = threshold
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="deskconn-loop-watchdog", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def sample(self) -> tuple[str, str | None]:
+        frames = []
+        frame = sys._current_frames().get(self.loop_thread)
+        while frame is not None:
+            frames.append(frame)
+            frame = frame.f_back
+
+        return describe(frames)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.threshold):
+            answered = threading.Event()
+            posted = time.monotonic()
+            try:
+                self.loop.call_soon_threadsafe(answered.set)
+            except RuntimeError:
+                # the loop is closed
+                return
+
+            if answered.wait(self.threshold):
+                continue
+
+            callback, handler = self.sample()
+            while not answered.wait(self.threshold):
+                if self._stop.is_set():
+                    return
+
+            stats.slow_callbacks += 1
+            slow_callbacks.append(
+                SlowCallback(
+                    callback=callback,
+                    handler=handler,
+                    duration_ms=(time.monotonic() - posted) * 1000,
+                    recorded_at=time.time(),
+                )
+            )
+
+
+_watchdog: Watchdog | None = None
+
+
+def _alert(lag_ms: float) -> None:
+    global _last_alert
+
+    stats.alerts += 1
+    now = time.monotonic()
+    if now - _last_alert < ALERT_INTERVAL:
+        return
+
+    _last_alert = now
+    recent = slow_callbacks[-1] if slow_callbacks else None
+    hint = f", last slow callback {recent.callback} ({recent.duration_ms:.1f}ms)" if recent is not None else ""
+    print(f"event loop lagged {lag_ms:.1f}ms (threshold {LOOP_LAG_ALERT_MS:.0f}ms), {stats.tasks} tasks{hint}")
+
+
+async def _probe() -> None:
+    loop = asyncio.get_running_loop()
+    interval = LOOP_LAG_INTERVAL_MS / 1000
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lag_ms = max(0.0, (loop.time() - expected) * 1000)
+
+        stats.lag.observe(lag_ms / 1000)
+        stats.last_lag_ms = lag_ms
+        stats.max_lag_ms = max(stats.max_lag_ms, lag_ms)
+        stats.tasks = len(asyncio.all_tasks(loop))
+        stats.max_tasks = max(stats.max_tasks, stats.tasks)
+
+        if lag_ms >= LOOP_LAG_ALERT_MS:
+            _alert(lag_ms)
+
+
+def start() -> None:
+    """Starts probing the running loop and, unless disabled, sampling what blocks it."""
+    global _monitor, _watchdog
+
+    if _monitor is not None:
+        return
+
+    if SLOW_CALLBACK_MS > 0:
+        _watchdog = Watchdog(asyncio.get_running_loop(), threading.get_ident(), SLOW_CALLBACK_MS / 1000)
+        _watchdog.start()
+
+    _monitor = asyncio.get_running_loop().create_task(_probe())
+
+
+def slowest(limit: int = 10) -> list[dict[str, Any]]:
+    """Slow callbacks in the log grouped by callback and handler, worst total first."""
+    grouped: dict[tuple[str, str | None], dict[str, Any]] = {}
+    for entry in slow_callbacks:
+        group = grouped.setdefault(
+            (entry.callback, entry.handler),
+            {"callback": entry.callback, "handler": entry.handler, "count": 0, "total_ms": 0.0, "max_ms": 0.0},
+        )
+        group["count"] += 1
+        group["total_ms"] += entry.duration_ms
+        group["max_ms"] = max(group["max_ms"], entry.duration_ms)
+
+    return sorted(grouped.values(), key=lambda group: group["total_ms"], reverse=True)[:limit]
+
+
+def loop_stats() -> dict[str, Any]:
+    return {
+        "lag_ms": stats.last_lag_ms,
+        "lag_max_ms": stats.max_lag_ms,
+        "lag_p99_ms": stats.lag.quantile(0.99) * 1000,
+        "tasks": stats.tasks,
+        "tasks_max": stats.max_tasks,
+        "lag_alerts": stats.alerts,
+        "slow_callbacks": stats.slow_callbacks,
+        "slowest_callbacks": slowest(),
+    }
+
+
+metrics.register_collector("loop", loop_stats)
@@ -0,0 +1,116 @@
+import os
+import time
+import asyncio
+import tracemalloc
+from dataclasses import dataclass, field
+from typing import Any
+
+# older snapshots are discarded beyond this; each holds every traced allocation
+MAX_SNAPSHOTS = 5
+KEY_TYPES = ("lineno", "filename", "traceback")
+
+# allocations made by tracemalloc and the import machinery are not the service's
+_IGNORED = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+@dataclass
+class Snapshots:
+    taken: dict[int, tuple[float, tracemalloc.Snapshot]] = field(default_factory=dict)
+    next_id: int = 1
+
+    def add(self, snapshot: tracemalloc.Snapshot) -> int:
+        snapshot_id = self.next_id
+        self.next_id += 1
+        self.taken[snapshot_id] = (time.time(), snapshot)
+        while len(self.taken) > MAX_SNAPSHOTS:
+            del self.taken[min(self.taken)]
+
+        return snapshot_id
+
+
+snapshots = Snapshots()
+
+
+def rss_bytes() -> int | None:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def status() -> dict[str, Any]:
+    current, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+
+    return {
+        "tracing": tracemalloc.is_tracing(),
+        "frames": tracemalloc.get_traceback_limit(),
+        "traced_bytes": current,
+        "traced_peak_bytes": peak,
+        "overhead_bytes": tracemalloc.get_tracemalloc_memory(),
+        "rss_bytes": rss_bytes(),
+        "snapshots": [{"id": i, "taken_at": taken_at} for i, (taken_at, _) in snapshots.taken.items()],
+    }
+
+
+def start(frames: int) -> None:
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+    snapshots.taken.clear()
+    tracemalloc.start(frames)
+
+
+def stop() -> None:
+    tracemalloc.stop()
+    snapshots.taken.clear()
+
+
+def _filters(module: str | None) -> list[tracemalloc.Filter]:
+    filters = list(_IGNORED)
+    if module is not None:
+        filters.append(tracemalloc.Filter(True, f"*{module}*"))
+
+    return filters
+
+
+def _location(stat: tracemalloc.Statistic | tracemalloc.StatisticDiff, key_type: str) -> str:
+    if key_type == "filename":
+        return stat.traceback[0].filename
+
+    # the caller first, like a Python traceback
+    return " -> ".join(f"{frame.filename}:{frame.lineno}" for frame in stat.traceback)
+
+
+def top(snapshot: tracemalloc.Snapshot, key_type: str, limit: int, module: str | None) -> list[dict[str, Any]]:
+    stats = snapshot.filter_traces(_filters(module)).statistics(key_type)
+
+    return [{"location": _location(stat, key_type), "size": stat.size, "count": stat.count} for stat in stats[:limit]]
+
+
+def diff(
+    old: tracemalloc.Snapshot, new: tracemalloc.Snapshot, key_type: str, limit: int, module: str | None
+) -> list[dict[str, Any]]:
+    filters = _filters(module)
+    stats = new.filter_traces(filters).compare_to(old.filter_traces(filters), key_type)
+
+    return [
+        {
+            "location": _location(stat, key_type),
+            "size": stat.size,
+            "size_diff": stat.size_diff,
+            "count": stat.count,
+            "count_diff": stat.count_diff,
+        }
+        for stat in stats[:limit]
+    ]
+
+
+async def take_snapshot() -> int:
+    # walking every traced block takes a while on a large heap, keep it off the event loop
+    return snapshots.add(await asyncio.to_thread(tracemalloc.take_snapshot))
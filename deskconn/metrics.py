@@ -0,0 +1,236 @@
+import os
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable
+
+from aiohttp import web
+from xconn.exception import ApplicationError
+
+from deskconn.middleware import ProcedureCall, Handler
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# serve Prometheus text format on this port when set
+METRICS_PORT = os.getenv("DESKCONN_METRICS_PORT", None)
+METRICS_HOST = os.getenv("DESKCONN_METRICS_HOST", "127.0.0.1")
+
+
+@dataclass
+class Histogram:
+    buckets: tuple[float, ...] = LATENCY_BUCKETS
+    counts: list[int] = field(default_factory=lambda: [0] * (len(LATENCY_BUCKETS) + 1))
+    sum: float = 0.0
+    count: int = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th observation."""
+        if self.count == 0:
+            return 0.0
+
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+
+        return float("inf")
+
+    def as_dict(self) -> dict[str, Any]:
+        cumulative, buckets = 0, {}
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+
+        buckets["+Inf"] = self.count
+
+        return {"buckets": buckets, "sum": self.sum, "count": self.count}
+
+
+@dataclass
+class CallStats:
+    """DB usage of a single procedure invocation."""
+
+    statements: int = 0
+    db_time: float = 0.0
+
+
+@dataclass
+class ProcedureStats:
+    calls: int = 0
+    errors: int = 0
+    errors_by_uri: dict[str, int] = field(default_factory=dict)
+    db_statements: int = 0
+    db_time: float = 0.0
+    max_db_statements: int = 0
+    latency: Histogram = field(default_factory=Histogram)
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "errors_by_uri": dict(self.errors_by_uri),
+            "db_statements": self.db_statements,
+            "db_statements_per_call": self.db_statements / self.calls if self.calls else 0.0,
+            "max_db_statements": self.max_db_statements,
+            "db_time": self.db_time,
+            "latency": {
+                **self.latency.as_dict(),
+                "p50": self.latency.quantile(0.5),
+                "p95": self.latency.quantile(0.95),
+                "p99": self.latency.quantile(0.99),
+            },
+        }
+
+
+current_call: ContextVar[CallStats | None] = ContextVar("deskconn_current_call", default=None)
+current_procedure: ContextVar[str | None] = ContextVar("deskconn_current_procedure", default=None)
+
+procedures: dict[str, ProcedureStats] = {}
+db_totals = CallStats()
+
+# name -> callable returning a flat dict of numbers, merged into the metrics output
+collectors: dict[str, Callable[[], dict[str, Any]]] = {}
+
+
+# extra HTTP routes served next to /metrics by the exporter
+endpoints: dict[str, Callable[[web.Request], Awaitable[web.Response]]] = {}
+
+
+def register_collector(name: str, collector: Callable[[], dict[str, Any]]) -> None:
+    collectors[name] = collector
+
+
+def register_endpoint(path: str, handler: Callable[[web.Request], Awaitable[web.Response]]) -> None:
+    endpoints[path] = handler
+
+
+def record(uri: str, duration: float, call_stats: CallStats, error: BaseException | None = None) -> None:
+    stats = procedures.get(uri)
+    if stats is None:
+        stats = procedures[uri] = ProcedureStats()
+
+    stats.calls += 1
+    stats.latency.observe(duration)
+    stats.db_statements += call_stats.statements
+    stats.db_time += call_stats.db_time
+    stats.max_db_statements = max(stats.max_db_statements, call_stats.statements)
+
+    if error is not None:
+        stats.errors += 1
+        error_uri = error.message if isinstance(error, ApplicationError) else type(error).__name__
+        stats.errors_by_uri[error_uri] = stats.errors_by_uri.get(error_uri, 0) + 1
+
+
+async def middleware(call: ProcedureCall, call_next: Handler) -> Any:
+    call_stats = CallStats()
+    stats_token = current_call.set(call_stats)
+    procedure_token = current_procedure.set(call.uri)
+    started = time.perf_counter()
+    try:
+        result = await call_next()
+    except BaseException as e:
+        record(call.uri, time.perf_counter() - started, call_stats, e)
+        raise
+    else:
+        record(call.uri, time.perf_counter() - started, call_stats)
+        return result
+    finally:
+        current_procedure.reset(procedure_token)
+        current_call.reset(stats_token)
+
+
+def record_statement(
+    statement: str, parameters: Any, executemany: bool, duration: float, error: BaseException | None
+) -> None:
+    """Statement observer, see deskconn.database.database.observe_statements."""
+    db_totals.statements += 1
+    db_totals.db_time += duration
+
+    call_stats = current_call.get()
+    if call_stats is not None:
+        call_stats.statements += 1
+        call_stats.db_time += duration
+
+
+def snapshot() -> dict[str, Any]:
+    return {
+        "procedures": {uri: stats.as_dict() for uri, stats in sorted(procedures.items())},
+        "db": {"statements": db_totals.statements, "db_time": db_totals.db_time},
+        **{name: collector() for name, collector in collectors.items()},
+    }
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_prometheus() -> str:
+    lines = [
+        "# HELP deskconn_procedure_latency_seconds Procedure invocation latency.",
+        "# TYPE deskconn_procedure_latency_seconds histogram",
+    ]
+    for uri, stats in sorted(procedures.items()):
+        label = f'procedure="{_escape(uri)}"'
+        for bound, count in stats.latency.as_dict()["buckets"].items():
+            lines.append(f'deskconn_procedure_latency_seconds_bucket{{{label},le="{bound}"}} {count}')
+        lines.append(f"deskconn_procedure_latency_seconds_sum{{{label}}} {stats.latency.sum}")
+        lines.append(f"deskconn_procedure_latency_seconds_count{{{label}}} {stats.latency.count}")
+
+    counters = (
+        ("deskconn_procedure_calls_total", "Procedure invocations.", lambda s: s.calls),
+        ("deskconn_procedure_errors_total", "Procedure invocations that raised.", lambda s: s.errors),
+        ("deskconn_procedure_db_statements_total", "SQL statements run by procedures.", lambda s: s.db_statements),
+        ("deskconn_procedure_db_seconds_total", "Time spent in SQL statements by procedures.", lambda s: s.db_time),
+    )
+    for name, help_text, value in counters:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} counter")
+        for uri, stats in sorted(procedures.items()):
+            lines.append(f'{name}{{procedure="{_escape(uri)}"}} {value(stats)}')
+
+    lines.append("# TYPE deskconn_db_statements_total counter")
+    lines.append(f"deskconn_db_statements_total {db_totals.statements}")
+    lines.append("# TYPE deskconn_db_seconds_total counter")
+    lines.append(f"deskconn_db_seconds_total {db_totals.db_time}")
+
+    for collector_name, collector in collectors.items():
+        for key, value in collector().items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+
+            name = f"deskconn_{collector_name}_{key}".replace(".", "_")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+
+    return "\n".join(lines) + "\n"
+
+
+_exporter: web.AppRunner | None = None
+
+
+async def start_exporter() -> None:
+    global _exporter
+
+    if METRICS_PORT is None or METRICS_PORT == "" or _exporter is not None:
+        return
+
+    async def serve_metrics(_: web.Request) -> web.Response:
+        return web.Response(text=render_prometheus(), content_type="text/plain", charset="utf-8")
+
+    exporter_app = web.Application()
+    exporter_app.router.add_get("/metrics", serve_metrics)
+    for path, handler in endpoints.items():
+        exporter_app.router.add_get(path, handler)
+
+    _exporter = web.AppRunner(exporter_app)
+    await _exporter.setup()
+    await web.TCPSite(_exporter, METRICS_HOST, int(METRICS_PORT)).start()
+    print(f"serving metrics at http://{METRICS_HOST}:{METRICS_PORT}/metrics")
@@ -0,0 +1,51 @@
+import functools
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+
+from xconn import App
+from xconn.types import CallDetails
+
+
+@dataclass
+class ProcedureCall:
+    uri: str
+    kwargs: dict[str, Any]
+
+    @property
+    def details(self) -> CallDetails | None:
+        for value in self.kwargs.values():
+            if isinstance(value, CallDetails):
+                return value
+
+        return None
+
+
+Handler = Callable[[], Awaitable[Any]]
+Middleware = Callable[[ProcedureCall, Handler], Awaitable[Any]]
+
+
+def install(app: App, middlewares: list[Middleware]) -> None:
+    """Routes every procedure of the app through the middlewares, outermost first.
+
+    Must be called after all components are included and before the app connects.
+    """
+    for uri, func in list(app.procedures.items()):
+        app.procedures[uri] = wrap(uri, func, middlewares)
+
+
+def wrap(uri: str, func: Callable[..., Awaitable[Any]], middlewares: list[Middleware]) -> Callable[..., Awaitable[Any]]:
+    # functools.wraps keeps the signature, type hints and xconn attributes of the
+    # handler visible, so xconn still resolves arguments and dependencies from it
+    @functools.wraps(func)
+    async def wrapper(**kwargs):
+        call = ProcedureCall(uri=uri, kwargs=kwargs)
+
+        async def dispatch(index: int):
+            if index == len(middlewares):
+                return await func(**kwargs)
+
+            return await middlewares[index](call, lambda: dispatch(index + 1))
+
+        return await dispatch(0)
+
+    return wrapper
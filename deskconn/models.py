@@ -1,7 +1,21 @@
 import enum
 import uuid
 
-from sqlalchemy import Enum, ForeignKey, Text, DateTime, Boolean, UUID, UniqueConstraint, MetaData
+from sqlalchemy import (
+    Enum,
+    ForeignKey,
+    Text,
+    DateTime,
+    Boolean,
+    UUID,
+    UniqueConstraint,
+    MetaData,
+    Integer,
+    BigInteger,
+    Float,
+    text,
+    func,
+)
 from sqlalchemy.orm import relationship, declarative_base, mapped_column
 
 from deskconn import helpers
@@ -361,8 +375,15 @@ class AppVersion(Base):
     id = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     version = mapped_column(Text, nullable=False)
     checksum = mapped_column(Text)
+    size = mapped_column(BigInteger)
     released_at = mapped_column(DateTime(timezone=True), nullable=False, default=helpers.utcnow)
 
+    # staged rollout: percentage of desktops (by authid cohort) that are offered this version,
+    # optionally ramped linearly between rollout_starts_at and rollout_ends_at
+    rollout_percentage = mapped_column(Integer, nullable=False, default=100, server_default="100")
+    rollout_starts_at = mapped_column(DateTime(timezone=True))
+    rollout_ends_at = mapped_column(DateTime(timezone=True))
+
     app_id = mapped_column(
         UUID(as_uuid=True),
         ForeignKey("apps.id", ondelete="CASCADE"),
@@ -370,3 +391,62 @@ class AppVersion(Base):
         index=True,
     )
     app = relationship("App", back_populates="versions", passive_deletes=True)
+
+    deltas = relationship(
+        "AppVersionDelta",
+        back_populates="app_version",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
+
+
+class AppVersionDelta(Base):
+    __tablename__ = "app_version_deltas"
+
+    __table_args__ = (
+        UniqueConstraint(
+            "app_version_id", "from_version", "os", "cpu_architecture", name="uq_app_version_deltas_from_version"
+        ),
+    )
+
+    id = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    from_version = mapped_column(Text, nullable=False)
+    os = mapped_column(Text, nullable=False)
+    cpu_architecture = mapped_column(Text, nullable=False)
+    size = mapped_column(BigInteger, nullable=False)
+    checksum = mapped_column(Text, nullable=False)
+
+    created_at = mapped_column(DateTime(timezone=True), default=helpers.utcnow)
+
+    # the delta upgrades from_version to this version
+    app_version_id = mapped_column(
+        UUID(as_uuid=True),
+        ForeignKey("app_versions.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    app_version = relationship("AppVersion", back_populates="deltas", passive_deletes=True)
+
+
+class RateLimitBucket(Base):
+    """Token bucket shared by all instances when DESKCONN_RATE_LIMIT_BACKEND is postgres."""
+
+    __tablename__ = "rate_limit_buckets"
+
+    key = mapped_column(Text, primary_key=True)
+    tokens = mapped_column(Float, nullable=False)
+    updated_at = mapped_column(DateTime(timezone=True), nullable=False, index=True)
+
+
+class ChangeLog(Base):
+    """Row changes written by the notify triggers, replayed by processes that missed the notifications."""
+
+    __tablename__ = "change_log"
+
+    id = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+    # the changing transaction, compared against the watermarks of deskconn.invalidation
+    xid = mapped_column(
+        BigInteger, nullable=False, index=True, server_default=text("pg_current_xact_id()::text::bigint")
+    )
+    payload = mapped_column(Text, nullable=False)
+    changed_at = mapped_column(DateTime(timezone=True), nullable=False, index=True, server_default=func.now())
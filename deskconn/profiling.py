@@ -0,0 +1,181 @@
+import os
+import sys
+import time
+import asyncio
+import tempfile
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from types import FrameType
+from typing import Any
+
+import greenlet
+
+from deskconn.middleware import ProcedureCall, Handler
+
+# leaf marker of samples taken while the invocation was suspended, e.g. waiting for Postgres
+AWAIT_MARKER = "[await]"
+
+
+def _label(frame: FrameType) -> str:
+    code = frame.f_code
+    path = code.co_filename.rsplit("site-packages/", 1)[-1].removesuffix(".py")
+
+    return f"{path}:{code.co_qualname}".replace(" ", "_").replace(";", ":")
+
+
+@dataclass
+class ProfileSession:
+    """Stack sampling of one procedure, attributing loop-thread samples to its invocations."""
+
+    procedure: str
+    interval: float
+    max_calls: int | None
+    deadline: float
+    loop_thread: int
+    loop_greenlet: greenlet.greenlet
+    calls: int = 0
+    samples: Counter[str] = field(default_factory=Counter)
+    started_at: float = field(default_factory=time.time)
+    stopped_at: float | None = None
+    # the _profiled frame of every running invocation, with its task
+    active: dict[FrameType, asyncio.Task] = field(default_factory=dict)
+    _stop: threading.Event = field(default_factory=threading.Event)
+    # samples are written by the sampler thread and read by procedures on the loop thread
+    _lock: threading.Lock = field(default_factory=threading.Lock)
+
+    @property
+    def running(self) -> bool:
+        return self.stopped_at is None
+
+    def stop(self) -> None:
+        if self.stopped_at is None:
+            self.stopped_at = time.time()
+            self._stop.set()
+
+    def accepts_calls(self) -> bool:
+        return self.running and (self.max_calls is None or self.calls < self.max_calls)
+
+    def _loop_stack(self) -> list[FrameType]:
+        """Frames running on the loop thread, innermost first, across SQLAlchemy's greenlets."""
+        frames = []
+        frame = sys._current_frames().get(self.loop_thread)
+        while frame is not None:
+            frames.append(frame)
+            frame = frame.f_back
+
+        # a greenlet's stack ends at its first frame; the loop's own stack is parked in its main greenlet
+        frame = self.loop_greenlet.gr_frame
+        while frame is not None:
+            frames.append(frame)
+            frame = frame.f_back
+
+        return frames
+
+    def _record(self, frames: list[FrameType], suffix: str = "") -> None:
+        stack = ";".join([self.procedure, *(_label(frame) for frame in frames)])
+        with self._lock:
+            self.samples[stack + suffix] += 1
+
+    def sample(self) -> None:
+        running = None
+        stack = self._loop_stack()
+        for index, frame in enumerate(stack):
+            if frame in self.active:
+                running = frame
+                self._record(list(reversed(stack[:index])))
+                break
+
+        for profiled, task in list(self.active.items()):
+            if profiled is running:
+                continue
+
+            try:
+                suspended = task.get_stack()
+            except Exception:
+                continue
+
+            for index, frame in enumerate(suspended):
+                if frame is profiled:
+                    self._record(suspended[index + 1 :], f";{AWAIT_MARKER}")
+                    break
+
+    def run(self) -> None:
+        while not self._stop.wait(self.interval):
+            if time.monotonic() > self.deadline:
+                self.stop()
+                return
+
+            if self.active:
+                self.sample()
+
+    def collapsed(self) -> str:
+        with self._lock:
+            return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common())
+
+    def total_samples(self) -> int:
+        with self._lock:
+            return sum(self.samples.values())
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "procedure": self.procedure,
+            "running": self.running,
+            "calls": self.calls,
+            "samples": self.total_samples(),
+            "interval_ms": self.interval * 1000,
+            "started_at": self.started_at,
+            "stopped_at": self.stopped_at,
+            "collapsed": self.collapsed(),
+        }
+
+
+session: ProfileSession | None = None
+
+
+def start(procedure: str, interval: float, max_calls: int | None, duration: float) -> ProfileSession:
+    """Starts sampling; must be called on the event loop thread."""
+    global session
+
+    if session is not None:
+        session.stop()
+
+    session = ProfileSession(
+        procedure=procedure,
+        interval=interval,
+        max_calls=max_calls,
+        deadline=time.monotonic() + duration,
+        loop_thread=threading.get_ident(),
+        loop_greenlet=greenlet.getcurrent(),
+    )
+    threading.Thread(target=session.run, name="deskconn-profiler", daemon=True).start()
+
+    return session
+
+
+def dump(profile: ProfileSession) -> str:
+    name = f"deskconn-{profile.procedure}-{int(profile.started_at)}.collapsed"
+    path = os.path.join(tempfile.gettempdir(), name)
+    with open(path, "w") as f:
+        f.write(profile.collapsed() + "\n")
+
+    return path
+
+
+async def _profiled(profile: ProfileSession, call_next: Handler) -> Any:
+    profile.calls += 1
+    profile.active[sys._getframe()] = asyncio.current_task()
+    try:
+        return await call_next()
+    finally:
+        profile.active.pop(sys._getframe(), None)
+        if profile.max_calls is not None and profile.calls >= profile.max_calls and not profile.active:
+            profile.stop()
+
+
+async def middleware(call: ProcedureCall, call_next: Handler) -> Any:
+    profile = session
+    if profile is None or call.uri != profile.procedure or not profile.accepts_calls():
+        return await call_next()
+
+    return await _profiled(profile, call_next)
@@ -0,0 +1,45 @@
+"""pytest fixtures shared by the test suite, loaded by ``tests/conftest.py`` through ``pytest_plugins``."""
+
+import pytest
+
+from deskconn.query_budget import QueryRecorder
+
+_recorder_key = pytest.StashKey[QueryRecorder]()
+
+
+def pytest_configure(config: pytest.Config) -> None:
+    config.addinivalue_line(
+        "markers", "query_budget(uri, limit): override the statement budget of a procedure for one test"
+    )
+
+
+@pytest.fixture
+def query_counter(request: pytest.FixtureRequest):
+    """Counts SQL statements per procedure invocation and fails the test on budget overruns or N+1 patterns."""
+    # imported lazily so loading the plugin does not require database settings
+    from deskconn.database.database import engine
+
+    recorder = QueryRecorder(engine)
+    # iter_markers yields the closest marker first, apply it last so it wins
+    for marker in reversed(list(request.node.iter_markers("query_budget"))):
+        uri, limit = marker.args
+        recorder.budgets[uri] = limit
+
+    recorder.start()
+    request.node.stash[_recorder_key] = recorder
+    try:
+        yield recorder
+    finally:
+        recorder.stop()
+
+
+@pytest.hookimpl(wrapper=True)
+def pytest_runtest_call(item: pytest.Item):
+    # checked when the test body returns, so an overrun fails the test instead of erroring its teardown
+    result = yield
+
+    recorder = item.stash.get(_recorder_key, None)
+    if recorder is not None:
+        recorder.assert_within_budgets()
+
+    return result
@@ -0,0 +1,135 @@
+import re
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterator
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from deskconn import metrics
+
+# Maximum number of SQL statements a single invocation may issue on its most expensive
+# successful path. Raise a budget deliberately, in the same change that adds the query.
+QUERY_BUDGETS: dict[str, int] = {
+    "io.xconn.deskconn.account.cra.verify": 4,
+    "io.xconn.deskconn.account.cryptosign.verify": 6,
+    "io.xconn.deskconn.account.login": 2,
+    "io.xconn.deskconn.account.login.verify": 7,
+    "io.xconn.deskconn.account.create": 3,
+    "io.xconn.deskconn.account.get": 1,
+    "io.xconn.deskconn.account.otp.resend": 2,
+    "io.xconn.deskconn.account.password.forget": 2,
+    "io.xconn.deskconn.desktop.access": 4,
+    "io.xconn.deskconn.desktop.access.key.list": 2,
+    "io.xconn.deskconn.desktop.attach": 8,
+    "io.xconn.deskconn.desktop.detach": 4,
+    "io.xconn.deskconn.desktop.list": 2,
+    "io.xconn.deskconn.desktop.invitation.user.create": 8,
+    "io.xconn.deskconn.desktop.invitation.inbox.list": 3,
+    "io.xconn.deskconn.organization.get": 2,
+    "io.xconn.deskconn.app.update.check": 4,
+    "io.xconn.deskconn.coturn.credentials.create": 2,
+}
+
+# identical statement shapes repeated this often within one invocation are reported as N+1 queries
+N_PLUS_ONE_THRESHOLD = 3
+
+_WHITESPACE = re.compile(r"\s+")
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_PARAMETER = re.compile(r"\$\d+(?:::[A-Z0-9_\[\]]+)?|%\(\w+\)s|\?|\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bIN \((?:\?, )*\?\)", re.IGNORECASE)
+
+
+def statement_shape(statement: str) -> str:
+    """Reduces a statement to its structure, dropping parameters, literals and IN-list lengths."""
+    shape = _WHITESPACE.sub(" ", statement).strip()
+    shape = _STRING_LITERAL.sub("?", shape)
+    shape = _PARAMETER.sub("?", shape)
+
+    return _IN_LIST.sub("IN (?)", shape)
+
+
+def repeated_shapes(statements: list[str], threshold: int = N_PLUS_ONE_THRESHOLD) -> dict[str, int]:
+    counts = Counter(statement_shape(statement) for statement in statements)
+
+    return {shape: count for shape, count in counts.items() if count >= threshold}
+
+
+@dataclass
+class RecordedCall:
+    uri: str | None
+    statements: list[str] = field(default_factory=list)
+
+
+class QueryRecorder:
+    """Collects the SQL statements of every procedure invocation while started.
+
+    Statements are grouped by the invocation that issued them, as tracked by the metrics
+    middleware, or by an explicit ``call()`` block when a handler is awaited directly.
+    """
+
+    def __init__(self, engine: AsyncEngine, budgets: dict[str, int] | None = None):
+        self._engine = engine
+        self.budgets = dict(QUERY_BUDGETS if budgets is None else budgets)
+        self.calls: list[RecordedCall] = []
+        # keyed by id() of the invocation's CallStats, which is kept alive so ids are never reused
+        self._by_invocation: dict[int, tuple[metrics.CallStats, RecordedCall]] = {}
+
+    def start(self) -> None:
+        event.listen(self._engine.sync_engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def stop(self) -> None:
+        event.remove(self._engine.sync_engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        invocation = metrics.current_call.get()
+        if invocation is None:
+            return
+
+        entry = self._by_invocation.get(id(invocation))
+        if entry is None:
+            entry = self._track(invocation, metrics.current_procedure.get())
+
+        entry[1].statements.append(statement)
+
+    def _track(self, invocation: metrics.CallStats, uri: str | None) -> tuple[metrics.CallStats, RecordedCall]:
+        entry = self._by_invocation[id(invocation)] = (invocation, RecordedCall(uri=uri))
+        self.calls.append(entry[1])
+
+        return entry
+
+    @contextmanager
+    def call(self, uri: str) -> Iterator[RecordedCall]:
+        """Attributes statements to ``uri`` for a handler awaited without the middleware."""
+        invocation = metrics.CallStats()
+        stats_token = metrics.current_call.set(invocation)
+        procedure_token = metrics.current_procedure.set(uri)
+        try:
+            yield self._track(invocation, uri)[1]
+        finally:
+            metrics.current_procedure.reset(procedure_token)
+            metrics.current_call.reset(stats_token)
+
+    def statement_count(self, uri: str) -> list[int]:
+        return [len(call.statements) for call in self.calls if call.uri == uri]
+
+    def violations(self) -> list[str]:
+        problems = []
+        for call in self.calls:
+            budget = self.budgets.get(call.uri)
+            if budget is not None and len(call.statements) > budget:
+                listing = "\n".join(f"  {statement_shape(statement)}" for statement in call.statements)
+                problems.append(
+                    f"'{call.uri}' issued {len(call.statements)} statements, budget is {budget}:\n{listing}"
+                )
+
+            for shape, count in repeated_shapes(call.statements).items():
+                problems.append(f"'{call.uri}' repeated the same statement {count} times (N+1?):\n  {shape}")
+
+        return problems
+
+    def assert_within_budgets(self) -> None:
+        problems = self.violations()
+        if problems:
+            raise AssertionError("\n\n".join(problems))
@@ -0,0 +1,152 @@
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Any
+
+from xconn.types import CallDetails
+from xconn.exception import ApplicationError
+
+from deskconn import helpers, metrics, uris
+from deskconn.database.database import AsyncSessionLocal
+from deskconn.database.backend import rate_limit as rate_limit_backend
+
+BACKEND_MEMORY = "memory"
+BACKEND_POSTGRES = "postgres"
+
+# "memory" limits each process on its own, "postgres" also enforces the limits across instances
+RATE_LIMIT_BACKEND = os.getenv("DESKCONN_RATE_LIMIT_BACKEND", BACKEND_MEMORY)
+# "<calls>/<seconds>": a burst of that many calls, refilled evenly over that many seconds
+RATE_LIMIT_EMAIL = os.getenv("DESKCONN_RATE_LIMIT_EMAIL", "5/600")
+RATE_LIMIT_SESSION = os.getenv("DESKCONN_RATE_LIMIT_SESSION", "20/600")
+# buckets kept in memory, the least recently used are forgotten first
+RATE_LIMIT_KEYS = int(os.getenv("DESKCONN_RATE_LIMIT_KEYS", "100000"))
+
+if RATE_LIMIT_BACKEND not in (BACKEND_MEMORY, BACKEND_POSTGRES):
+    raise ValueError("'DESKCONN_RATE_LIMIT_BACKEND' must be 'memory' or 'postgres'.")
+
+# how often the postgres backend deletes buckets that have refilled completely
+CLEANUP_INTERVAL = 600
+
+
+@dataclass(frozen=True)
+class Limit:
+    burst: int
+    rate: float
+
+    @classmethod
+    def parse(cls, name: str, value: str) -> "Limit":
+        try:
+            calls, seconds = (float(part) for part in value.split("/"))
+        except ValueError:
+            raise ValueError(f"'{name}' must look like '<calls>/<seconds>', got '{value}'.")
+
+        if calls < 1 or seconds <= 0:
+            raise ValueError(f"'{name}' must allow at least one call over a positive number of seconds.")
+
+        return cls(burst=int(calls), rate=calls / seconds)
+
+    @property
+    def refill_seconds(self) -> float:
+        return self.burst / self.rate
+
+
+EMAIL_LIMIT = Limit.parse("DESKCONN_RATE_LIMIT_EMAIL", RATE_LIMIT_EMAIL)
+SESSION_LIMIT = Limit.parse("DESKCONN_RATE_LIMIT_SESSION", RATE_LIMIT_SESSION)
+
+# key -> (tokens, monotonic time of the last update)
+_buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+stats = {"allowed": 0, "rejected": 0, "shared_rejected": 0}
+
+_cleanup: asyncio.Task | None = None
+
+
+def _tokens(key: str, limit: Limit, now: float) -> float:
+    bucket = _buckets.get(key)
+    if bucket is None:
+        return float(limit.burst)
+
+    tokens, updated_at = bucket
+    return min(float(limit.burst), tokens + (now - updated_at) * limit.rate)
+
+
+def _take_local(keys: list[tuple[str, Limit]]) -> float:
+    """Takes a token from every bucket, or none; returns 0 or the seconds until all have one."""
+    now = time.monotonic()
+    available = [(key, limit, _tokens(key, limit, now)) for key, limit in keys]
+
+    wait = max(((1 - tokens) / limit.rate for _, limit, tokens in available if tokens < 1), default=0.0)
+    if wait > 0:
+        return wait
+
+    for key, _, tokens in available:
+        _buckets[key] = (tokens - 1, now)
+        _buckets.move_to_end(key)
+
+    while len(_buckets) > RATE_LIMIT_KEYS:
+        _buckets.popitem(last=False)
+
+    return 0.0
+
+
+async def _take_shared(keys: list[tuple[str, Limit]]) -> bool:
+    """Takes a token from every shared bucket, or none; an empty session bucket leaves the email bucket alone."""
+    async with AsyncSessionLocal() as db:
+        return await rate_limit_backend.take_tokens(db, [(key, limit.rate, limit.burst) for key, limit in keys])
+
+
+def _reject(procedure: str, retry_after: float | None) -> ApplicationError:
+    stats["rejected"] += 1
+    hint = f", retry in {retry_after:.0f}s" if retry_after is not None else ""
+
+    return ApplicationError(uris.ERROR_RATE_LIMITED, f"Too many '{procedure}' requests{hint}")
+
+
+async def check(procedure: str, email: str | None, details: CallDetails | None) -> None:
+    """Spends a token for the email address and the calling session; call before touching the database."""
+    keys = []
+    if email is not None:
+        keys.append((f"email:{email.strip().lower()}", EMAIL_LIMIT))
+    if details is not None and details.session_id is not None:
+        keys.append((f"session:{details.session_id}", SESSION_LIMIT))
+
+    if not keys:
+        return
+
+    # the local buckets reject most abuse without a round trip; the shared ones only see what they let through
+    wait = _take_local(keys)
+    if wait > 0:
+        raise _reject(procedure, wait)
+
+    if RATE_LIMIT_BACKEND == BACKEND_POSTGRES and not await _take_shared(keys):
+        stats["shared_rejected"] += 1
+        raise _reject(procedure, None)
+
+    stats["allowed"] += 1
+
+
+async def _delete_full_buckets() -> None:
+    longest = max(EMAIL_LIMIT.refill_seconds, SESSION_LIMIT.refill_seconds)
+    while True:
+        await asyncio.sleep(CLEANUP_INTERVAL)
+        try:
+            async with AsyncSessionLocal() as db:
+                await rate_limit_backend.delete_full_buckets(db, helpers.utcnow() - timedelta(seconds=longest))
+        except Exception as e:
+            print(f"failed to delete rate limit buckets: {e}")
+
+
+def start() -> None:
+    global _cleanup
+
+    if RATE_LIMIT_BACKEND == BACKEND_POSTGRES and _cleanup is None:
+        _cleanup = asyncio.get_running_loop().create_task(_delete_full_buckets())
+
+
+def rate_limit_stats() -> dict[str, Any]:
+    return {**stats, "buckets": len(_buckets)}
+
+
+metrics.register_collector("rate_limit", rate_limit_stats)
@@ -287,10 +287,33 @@ class PrincipalGet(PrincipalCreate):
     expires_at: DateTimeStr
 
 
+class AppVersionDeltaUpload(BaseModel):
+    model_config = ConfigDict(use_enum_values=True)
+
+    from_version: str
+    os: models.OS
+    cpu_architecture: models.CPUArchitecture
+    size: int = Field(gt=0)
+    checksum: str
+
+
 class AppVersionUpload(BaseModel):
     name: str
     version: str
     checksum: str
+    size: int | None = Field(default=None, gt=0)
+    deltas: list[AppVersionDeltaUpload] = []
+    rollout_percentage: int = Field(default=100, ge=0, le=100)
+    rollout_starts_at: datetime | None = None
+    rollout_ends_at: datetime | None = None
+
+
+class AppVersionRolloutUpdate(BaseModel):
+    name: str
+    version: str
+    rollout_percentage: int = Field(ge=0, le=100)
+    rollout_starts_at: datetime | None = None
+    rollout_ends_at: datetime | None = None
 
 
 class AppVersionCheck(BaseModel):
@@ -302,6 +325,15 @@ class AppVersionCheck(BaseModel):
     cpu_architecture: models.CPUArchitecture
 
 
+class AppVersionDeltaAsset(BaseModel):
+    from_version: str
+    to_version: str
+    download_url: str
+    asset_name: str
+    size: int
+    checksum: str
+
+
 class AppVersionCheckResult(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
@@ -314,6 +346,9 @@ class AppVersionCheckResult(BaseModel):
     asset_name: str
     checksum: str
     released_at: DateTimeStr
+    size: int | None = None
+    # chain of deltas from current_version to latest_version, empty when the full archive is smaller
+    deltas: list[AppVersionDeltaAsset] = []
 
 
 class AppVersionGet(BaseModel):
@@ -322,7 +357,11 @@ class AppVersionGet(BaseModel):
     id: UUIDStr
     version: str
     checksum: str
+    size: int | None = None
     released_at: DateTimeStr
+    rollout_percentage: int
+    rollout_starts_at: DateTimeStr | None = None
+    rollout_ends_at: DateTimeStr | None = None
 
 
 class CoturnCredentials(BaseModel):
@@ -365,3 +404,26 @@ class DesktopInviteOutboxGet(DesktopInviteGet):
 
 class InviteCancel(BaseModel):
     invitation_id: UUID4
+
+
+class SlowQueryList(BaseModel):
+    limit: int = 50
+    procedure: str | None = None
+
+
+class ProfileStart(BaseModel):
+    procedure: str
+    calls: int | None = None
+    seconds: float = 60
+    interval_ms: float = 5
+
+
+class MemorySnapshotTake(BaseModel):
+    limit: int = 20
+    key_type: str = "lineno"
+    module: str | None = None
+
+
+class MemorySnapshotDiff(MemorySnapshotTake):
+    old: int
+    new: int | None = None
@@ -0,0 +1,179 @@
+import os
+import json
+import mmap
+import time
+import asyncio
+from pathlib import Path
+from dataclasses import dataclass
+from typing import Any, Callable
+
+from deskconn import metrics, invalidation, workers
+
+# where caches are saved between restarts, empty disables snapshots
+SNAPSHOT_DIR = os.getenv("DESKCONN_SNAPSHOT_DIR", "")
+SNAPSHOT_INTERVAL_SECONDS = float(os.getenv("DESKCONN_SNAPSHOT_INTERVAL_SECONDS", "300"))
+
+if SNAPSHOT_INTERVAL_SECONDS <= 0:
+    raise ValueError("'DESKCONN_SNAPSHOT_INTERVAL_SECONDS' must be positive.")
+
+SNAPSHOT_FILE = "caches.snap"
+# bumped whenever a cache changes what it dumps
+VERSION = 1
+
+
+@dataclass
+class Snapshotter:
+    # None when the cache is not in sync with the invalidation watermark, which skips the snapshot
+    dump: Callable[[], bytes | None]
+    # parses a section without touching the cache and returns what installs it, so that one bad section leaves
+    # every cache as it was
+    load: Callable[[memoryview], Callable[[], None]]
+
+
+snapshotters: dict[str, Snapshotter] = {}
+stats = {"restored": False, "saved": 0, "skipped": 0, "errors": 0, "bytes": 0, "save_seconds": 0.0}
+
+_saver: asyncio.Task | None = None
+
+
+def register(name: str, dump: Callable[[], bytes | None], load: Callable[[memoryview], Callable[[], None]]) -> None:
+    snapshotters[name] = Snapshotter(dump=dump, load=load)
+
+
+def _path() -> Path:
+    return Path(SNAPSHOT_DIR) / SNAPSHOT_FILE
+
+
+def _collect() -> tuple[invalidation.Watermark, dict[str, bytes]] | None:
+    # taken together without yielding, so every dump matches the watermark
+    watermark = invalidation.synced()
+    if watermark is None or not snapshotters:
+        return None
+
+    payloads = {}
+    for name, snapshotter in snapshotters.items():
+        data = snapshotter.dump()
+        if data is None:
+            return None
+        payloads[name] = data
+
+    return watermark, payloads
+
+
+def _write(watermark: invalidation.Watermark, payloads: dict[str, bytes]) -> None:
+    sections, offset = {}, 0
+    for name, data in payloads.items():
+        sections[name] = [offset, len(data)]
+        offset += len(data)
+
+    header = json.dumps({"version": VERSION, "watermark": watermark.as_dict(), "sections": sections}).encode()
+
+    path = _path()
+    # workers of one host share the file; each writes its own and swaps it in whole
+    temporary = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(temporary, "wb") as f:
+        f.write(header + b"\n")
+        for data in payloads.values():
+            f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(temporary, path)
+    stats["bytes"] = len(header) + 1 + offset
+
+
+def _store(watermark: invalidation.Watermark, payloads: dict[str, bytes]) -> None:
+    started = time.perf_counter()
+    try:
+        _write(watermark, payloads)
+    except OSError as e:
+        stats["errors"] += 1
+        print(f"failed to save cache snapshot: {e}")
+        return
+
+    stats["saved"] += 1
+    stats["save_seconds"] = time.perf_counter() - started
+
+
+def save() -> None:
+    """Writes the snapshot right away, e.g. while the process is stopping."""
+    collected = _collect()
+    if collected is None:
+        stats["skipped"] += 1
+        return
+
+    _store(*collected)
+
+
+def restore() -> bool:
+    """Loads every registered cache from the snapshot, or none of them."""
+    path = _path()
+    if not path.exists():
+        return False
+
+    try:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            end = mapped.find(b"\n")
+            header = json.loads(mapped[:end])
+            if header["version"] != VERSION or set(header["sections"]) != set(snapshotters):
+                print(f"ignoring cache snapshot {path}, it was written for other caches")
+                return False
+
+            watermark = invalidation.Watermark.from_dict(header["watermark"])
+            installs = []
+            with memoryview(mapped)[end + 1 :] as body:
+                for name, (offset, length) in header["sections"].items():
+                    with body[offset : offset + length] as section:
+                        if len(section) != length:
+                            raise ValueError(f"section {name} is truncated")
+                        installs.append(snapshotters[name].load(section))
+    except Exception as e:
+        stats["errors"] += 1
+        print(f"failed to restore cache snapshot {path}: {e}")
+        return False
+
+    # every section parsed, only now are the caches replaced
+    for install in installs:
+        install()
+
+    invalidation.resume_from(watermark)
+    stats["restored"] = True
+    print(f"restored {', '.join(snapshotters)} from cache snapshot at xid {watermark.xid}")
+
+    return True
+
+
+async def _save_periodically() -> None:
+    while True:
+        await asyncio.sleep(SNAPSHOT_INTERVAL_SECONDS)
+        collected = _collect()
+        if collected is None:
+            stats["skipped"] += 1
+            continue
+
+        # the dumps are taken on the loop, only writing them out happens on a thread
+        await asyncio.to_thread(_store, *collected)
+
+
+def start() -> None:
+    """Restores the caches registered so far and saves them periodically and on drain.
+
+    Must be called after the caches register and before the invalidation listener starts.
+    """
+    global _saver
+
+    if not SNAPSHOT_DIR or _saver is not None:
+        return
+
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    restore()
+
+    workers.drain_hooks.append(save)
+    _saver = asyncio.get_running_loop().create_task(_save_periodically())
+
+
+def snapshot_stats() -> dict[str, Any]:
+    return {**stats, "caches": len(snapshotters)}
+
+
+metrics.register_collector("snapshots", snapshot_stats)
@@ -0,0 +1,231 @@
+"""Runs several ``xcorn`` workers of the service.
+
+    python -m deskconn.supervisor --workers 4 main:app --realm ... --url ... --authid ... --private-key ...
+
+Arguments after the options are passed to every worker's ``xcorn``. Each worker has its own WAMP session and
+database pool, and registers every procedure with round-robin invocation, so the router spreads calls across them.
+``DESKCONN_DB_POOL_SIZE`` and ``DESKCONN_DB_MAX_OVERFLOW`` are the totals for all workers and are split between them.
+
+SIGHUP restarts the workers one at a time: a replacement has to register its procedures before the worker it
+replaces is drained. SIGTERM or SIGINT drains and stops all of them.
+"""
+
+import os
+import sys
+import time
+import shutil
+import signal
+import asyncio
+import argparse
+from dataclasses import dataclass, field
+from pathlib import Path
+
+# xcorn prints this after registering every procedure, which makes the worker ready
+READY_MARKER = "serving schema at procedure"
+
+START_TIMEOUT = 60.0
+# a worker that lived shorter than this before exiting is restarted with a growing delay
+STABLE_AFTER = 60.0
+MAX_RESTART_DELAY = 30.0
+
+
+@dataclass
+class Worker:
+    slot: int
+    generation: int
+    process: asyncio.subprocess.Process
+    ready: asyncio.Event = field(default_factory=asyncio.Event)
+    started_at: float = field(default_factory=time.monotonic)
+    retiring: bool = False
+
+
+def pool_share(total: int, workers: int, minimum: int) -> int:
+    return max(minimum, total // workers)
+
+
+def metrics_port(base: int, slot: int, generation: int, workers: int) -> int:
+    # a replacement runs next to the worker it replaces, so alternate generations use separate ports
+    return base + slot + workers * (generation % 2)
+
+
+def xcorn_executable() -> str:
+    # prefer the xcorn installed next to this interpreter, e.g. in .venv/bin
+    local = Path(sys.executable).parent / "xcorn"
+    if local.exists():
+        return str(local)
+
+    found = shutil.which("xcorn")
+    if found is None:
+        raise SystemExit("xcorn not found, install the service first")
+
+    return found
+
+
+class Supervisor:
+    def __init__(self, workers: int, xcorn_args: list[str], drain_timeout: float):
+        self.count = workers
+        self.xcorn_args = xcorn_args
+        self.drain_timeout = drain_timeout
+        self.slots: dict[int, Worker] = {}
+        self.generations = [0] * workers
+        self.restart_delays = [1.0] * workers
+        self.stopping = False
+        self._restarting = False
+        self._tasks: set[asyncio.Task] = set()
+        self._stopped = asyncio.Event()
+
+    def _environment(self, slot: int, generation: int) -> dict[str, str]:
+        env = dict(os.environ)
+        # the supervisor reads the worker's output to tell when it is ready
+        env["PYTHONUNBUFFERED"] = "1"
+        env["DESKCONN_WORKER_ID"] = str(slot)
+        env["DESKCONN_DRAIN_TIMEOUT"] = str(self.drain_timeout)
+        env["DESKCONN_DB_POOL_SIZE"] = str(
+            pool_share(int(os.getenv("DESKCONN_DB_POOL_SIZE", "5")), self.count, minimum=1)
+        )
+        env["DESKCONN_DB_MAX_OVERFLOW"] = str(
+            pool_share(int(os.getenv("DESKCONN_DB_MAX_OVERFLOW", "10")), self.count, minimum=0)
+        )
+
+        base_port = os.getenv("DESKCONN_METRICS_PORT", "")
+        if base_port != "":
+            env["DESKCONN_METRICS_PORT"] = str(metrics_port(int(base_port), slot, generation, self.count))
+
+        return env
+
+    def _spawn_task(self, coro) -> None:
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def spawn(self, slot: int) -> Worker:
+        self.generations[slot] += 1
+        generation = self.generations[slot]
+        process = await asyncio.create_subprocess_exec(
+            xcorn_executable(),
+            *self.xcorn_args,
+            env=self._environment(slot, generation),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            # signals from the terminal go to the supervisor only, which drains the workers
+            start_new_session=True,
+        )
+        worker = Worker(slot=slot, generation=generation, process=process)
+        print(f"started worker {slot} (pid {process.pid})")
+
+        self._spawn_task(self._pump_output(worker))
+        self._spawn_task(self._watch(worker))
+
+        return worker
+
+    async def _pump_output(self, worker: Worker) -> None:
+        prefix = f"[worker {worker.slot}:{worker.process.pid}]"
+        async for line in worker.process.stdout:
+            text = line.decode(errors="replace").rstrip()
+            print(f"{prefix} {text}", flush=True)
+            if READY_MARKER in text:
+                worker.ready.set()
+
+    async def _watch(self, worker: Worker) -> None:
+        code = await worker.process.wait()
+        if worker.retiring or self.stopping or self.slots.get(worker.slot) is not worker:
+            return
+
+        if time.monotonic() - worker.started_at >= STABLE_AFTER:
+            self.restart_delays[worker.slot] = 1.0
+
+        delay = self.restart_delays[worker.slot]
+        self.restart_delays[worker.slot] = min(delay * 2, MAX_RESTART_DELAY)
+        print(f"worker {worker.slot} exited with {code}, restarting in {delay:.0f}s")
+
+        await asyncio.sleep(delay)
+        if not self.stopping and self.slots.get(worker.slot) is worker:
+            self.slots[worker.slot] = await self.spawn(worker.slot)
+
+    async def wait_ready(self, worker: Worker) -> bool:
+        ready = asyncio.create_task(worker.ready.wait())
+        exited = asyncio.create_task(worker.process.wait())
+        _, pending = await asyncio.wait({ready, exited}, timeout=START_TIMEOUT, return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+
+        return worker.ready.is_set()
+
+    async def retire(self, worker: Worker) -> None:
+        worker.retiring = True
+        if worker.process.returncode is not None:
+            return
+
+        worker.process.terminate()
+        try:
+            # the worker drains for up to drain_timeout, give it a little longer to close its session
+            await asyncio.wait_for(worker.process.wait(), self.drain_timeout + 10)
+        except asyncio.TimeoutError:
+            print(f"worker {worker.slot} did not stop, killing it")
+            worker.process.kill()
+            await worker.process.wait()
+
+    async def start(self) -> None:
+        for slot in range(self.count):
+            self.slots[slot] = await self.spawn(slot)
+
+        for worker in list(self.slots.values()):
+            if not await self.wait_ready(worker):
+                print(f"worker {worker.slot} did not become ready within {START_TIMEOUT:.0f}s")
+
+    async def rolling_restart(self) -> None:
+        if self._restarting or self.stopping:
+            return
+
+        self._restarting = True
+        try:
+            for slot in range(self.count):
+                old = self.slots[slot]
+                new = await self.spawn(slot)
+                if not await self.wait_ready(new):
+                    print(f"replacement for worker {slot} did not become ready, keeping the running workers")
+                    await self.retire(new)
+                    return
+
+                self.slots[slot] = new
+                await self.retire(old)
+                print(f"restarted worker {slot}")
+        finally:
+            self._restarting = False
+
+    async def stop(self) -> None:
+        if self.stopping:
+            return
+
+        self.stopping = True
+        await asyncio.gather(*(self.retire(worker) for worker in self.slots.values()))
+        self._stopped.set()
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGHUP, lambda: self._spawn_task(self.rolling_restart()))
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, lambda: self._spawn_task(self.stop()))
+
+        await self.start()
+        await self._stopped.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="run several deskconn account service workers")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--drain-timeout", type=float, default=30.0)
+    parser.add_argument("xcorn_args", nargs=argparse.REMAINDER, help="arguments passed to xcorn, e.g. main:app ...")
+    args = parser.parse_args()
+
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    if not args.xcorn_args:
+        parser.error("pass the xcorn arguments, e.g. main:app --realm ... --url ...")
+
+    asyncio.run(Supervisor(args.workers, args.xcorn_args, args.drain_timeout).run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+import os
+import json
+import time
+import random
+import asyncio
+import secrets
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Iterator, Protocol
+
+import aiohttp
+from xconn.exception import ApplicationError
+
+from deskconn import metrics
+from deskconn.middleware import ProcedureCall, Handler
+
+# "file" appends OTLP/JSON lines to DESKCONN_TRACE_FILE, "otlp" posts them to DESKCONN_TRACE_OTLP_ENDPOINT
+TRACE_EXPORTER = os.getenv("DESKCONN_TRACE_EXPORTER", "")
+TRACE_FILE = os.getenv("DESKCONN_TRACE_FILE", "deskconn-traces.jsonl")
+TRACE_OTLP_ENDPOINT = os.getenv("DESKCONN_TRACE_OTLP_ENDPOINT", "http://127.0.0.1:4318/v1/traces")
+# fraction of traces started here that are recorded; traces continued from a caller follow its decision
+TRACE_SAMPLE_RATE = float(os.getenv("DESKCONN_TRACE_SAMPLE_RATE", "1"))
+TRACE_FLUSH_INTERVAL = float(os.getenv("DESKCONN_TRACE_FLUSH_INTERVAL", "5"))
+# finished spans kept for the exporter; the oldest are dropped when it falls behind
+TRACE_BUFFER_SIZE = int(os.getenv("DESKCONN_TRACE_BUFFER_SIZE", "10000"))
+
+if TRACE_EXPORTER not in ("", "file", "otlp"):
+    raise ValueError("'DESKCONN_TRACE_EXPORTER' must be 'file' or 'otlp'.")
+
+if not 0 <= TRACE_SAMPLE_RATE <= 1:
+    raise ValueError("'DESKCONN_TRACE_SAMPLE_RATE' must be between 0 and 1.")
+
+# W3C trace context, carried in WAMP call/publish options and call details; WAMP reserves
+# underscore-prefixed keys for implementation-specific attributes
+TRACEPARENT = "_traceparent"
+
+SERVICE_NAME = "deskconn-account-service"
+
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+KIND_PRODUCER = 4
+
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+
+@dataclass
+class Span:
+    name: str
+    kind: int
+    trace_id: str
+    span_id: str = field(default_factory=lambda: secrets.token_hex(8))
+    parent_id: str | None = None
+    attributes: dict[str, Any] = field(default_factory=dict)
+    started_ns: int = field(default_factory=time.time_ns)
+    ended_ns: int | None = None
+    status: int = STATUS_OK
+    status_message: str = ""
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def child(self, name: str, kind: int, attributes: dict[str, Any] | None = None) -> "Span":
+        return Span(name=name, kind=kind, trace_id=self.trace_id, parent_id=self.span_id, attributes=attributes or {})
+
+    def fail(self, error: BaseException) -> None:
+        self.status = STATUS_ERROR
+        self.status_message = error.message if isinstance(error, ApplicationError) else type(error).__name__
+
+    def end(self) -> None:
+        self.ended_ns = time.time_ns()
+        if len(finished) == finished.maxlen:
+            stats["dropped"] += 1
+        finished.append(self)
+
+    def as_otlp(self) -> dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.started_ns),
+            "endTimeUnixNano": str(self.ended_ns),
+            "attributes": _otlp_attributes(self.attributes),
+            "status": {"code": self.status, "message": self.status_message},
+        }
+        if self.parent_id is not None:
+            span["parentSpanId"] = self.parent_id
+
+        return span
+
+
+def _otlp_attributes(attributes: dict[str, Any]) -> list[dict[str, Any]]:
+    encoded = []
+    for key, value in attributes.items():
+        if isinstance(value, bool):
+            encoded.append({"key": key, "value": {"boolValue": value}})
+        elif isinstance(value, int):
+            encoded.append({"key": key, "value": {"intValue": str(value)}})
+        elif isinstance(value, float):
+            encoded.append({"key": key, "value": {"doubleValue": value}})
+        else:
+            encoded.append({"key": key, "value": {"stringValue": str(value)}})
+
+    return encoded
+
+
+def otlp_request(spans: list[Span]) -> dict[str, Any]:
+    """An OTLP/JSON ExportTraceServiceRequest holding the spans."""
+    return {
+        "resourceSpans": [
+            {
+                "resource": {"attributes": _otlp_attributes({"service.name": SERVICE_NAME})},
+                "scopeSpans": [{"scope": {"name": "deskconn.tracing"}, "spans": [s.as_otlp() for s in spans]}],
+            }
+        ]
+    }
+
+
+class Exporter(Protocol):
+    async def export(self, spans: list[Span]) -> None: ...
+
+    async def close(self) -> None: ...
+
+
+class FileExporter:
+    """Appends one OTLP/JSON request per batch, readable by the collector's otlpjsonfile receiver."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _write(self, line: str) -> None:
+        with open(self.path, "a") as f:
+            f.write(line + "\n")
+
+    async def export(self, spans: list[Span]) -> None:
+        await asyncio.to_thread(self._write, json.dumps(otlp_request(spans)))
+
+    async def close(self) -> None:
+        pass
+
+
+class OTLPHttpExporter:
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self._session: aiohttp.ClientSession | None = None
+
+    async def export(self, spans: list[Span]) -> None:
+        if self._session is None:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10))
+
+        async with self._session.post(self.endpoint, json=otlp_request(spans)) as response:
+            response.raise_for_status()
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+
+
+current_span: ContextVar[Span | None] = ContextVar("deskconn_current_span", default=None)
+
+finished: deque[Span] = deque(maxlen=TRACE_BUFFER_SIZE)
+stats = {"exported": 0, "dropped": 0, "export_errors": 0}
+
+exporter: Exporter | None = None
+_flusher: asyncio.Task | None = None
+
+
+def set_exporter(new_exporter: Exporter | None) -> None:
+    """Replaces the exporter, e.g. with one of a tracing SDK; None disables tracing."""
+    global exporter
+    exporter = new_exporter
+
+
+def parse_traceparent(value: Any) -> tuple[str, str, bool] | None:
+    if not isinstance(value, str):
+        return None
+
+    parts = value.split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16 or len(parts[3]) != 2:
+        return None
+
+    try:
+        sampled = bool(int(parts[3], 16) & 1)
+    except ValueError:
+        return None
+
+    return parts[1], parts[2], sampled
+
+
+def start_root(name: str, traceparent: Any, attributes: dict[str, Any]) -> Span | None:
+    """A span continuing the caller's trace, or a new trace; None when the trace is not sampled."""
+    parent = parse_traceparent(traceparent)
+    if parent is not None:
+        trace_id, parent_id, sampled = parent
+        if not sampled:
+            return None
+
+        return Span(name=name, kind=KIND_SERVER, trace_id=trace_id, parent_id=parent_id, attributes=attributes)
+
+    if random.random() >= TRACE_SAMPLE_RATE:
+        return None
+
+    return Span(name=name, kind=KIND_SERVER, trace_id=secrets.token_hex(16), attributes=attributes)
+
+
+@contextmanager
+def span(name: str, kind: int = KIND_INTERNAL, attributes: dict[str, Any] | None = None) -> Iterator[Span | None]:
+    """A child of the current span; a no-op outside of a traced invocation."""
+    parent = current_span.get()
+    if parent is None:
+        yield None
+        return
+
+    child = parent.child(name, kind, attributes)
+    token = current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.fail(e)
+        raise
+    finally:
+        current_span.reset(token)
+        child.end()
+
+
+def inject(options: dict[str, Any] | None, active: Span | None) -> dict[str, Any] | None:
+    """Options of an outgoing call or publish, carrying the trace context of the span."""
+    if active is None:
+        return options
+
+    return {**(options or {}), TRACEPARENT: active.traceparent}
+
+
+async def middleware(call: ProcedureCall, call_next: Handler) -> Any:
+    if exporter is None:
+        return await call_next()
+
+    details = call.details
+    attributes = {"rpc.system": "wamp", "rpc.method": call.uri}
+    if details is not None and details.authrole is not None:
+        attributes["wamp.caller_authrole"] = details.authrole
+
+    root = start_root(call.uri, details.get(TRACEPARENT) if details is not None else None, attributes)
+    if root is None:
+        return await call_next()
+
+    token = current_span.set(root)
+    try:
+        return await call_next()
+    except BaseException as e:
+        root.fail(e)
+        raise
+    finally:
+        current_span.reset(token)
+        root.end()
+
+
+def record_statement(
+    statement: str, parameters: Any, executemany: bool, duration: float, error: BaseException | None
+) -> None:
+    """Statement observer, see deskconn.database.database.observe_statements."""
+    parent = current_span.get()
+    if parent is None:
+        return
+
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "SQL"
+    statement_span = parent.child(operation, KIND_CLIENT, {"db.system": "postgresql", "db.statement": statement})
+    statement_span.started_ns = time.time_ns() - int(duration * 1e9)
+    if error is not None:
+        statement_span.fail(error)
+    statement_span.end()
+
+
+async def flush() -> None:
+    if exporter is None or not finished:
+        return
+
+    spans = list(finished)
+    finished.clear()
+    try:
+        await exporter.export(spans)
+    except Exception as e:
+        stats["export_errors"] += 1
+        stats["dropped"] += len(spans)
+        print(f"failed to export {len(spans)} spans: {e}")
+    else:
+        stats["exported"] += len(spans)
+
+
+async def _flush_periodically() -> None:
+    while True:
+        await asyncio.sleep(TRACE_FLUSH_INTERVAL)
+        await flush()
+
+
+def start() -> None:
+    global _flusher
+
+    if _flusher is not None:
+        return
+
+    if exporter is None and TRACE_EXPORTER == "file":
+        set_exporter(FileExporter(TRACE_FILE))
+    elif exporter is None and TRACE_EXPORTER == "otlp":
+        set_exporter(OTLPHttpExporter(TRACE_OTLP_ENDPOINT))
+
+    if exporter is not None:
+        _flusher = asyncio.get_running_loop().create_task(_flush_periodically())
+
+
+def tracing_stats() -> dict[str, Any]:
+    return {**stats, "buffered": len(finished)}
+
+
+metrics.register_collector("tracing", tracing_stats)
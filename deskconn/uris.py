@@ -20,3 +20,5 @@ ERROR_PRINCIPAL_EXISTS = "io.xconn.error.principal_exists"
 ERROR_NOT_FOUND = "io.xconn.error.not_found"
 ERROR_APP_VERSION_EXISTS = "io.xconn.error.app_version_exists"
 ERROR_DESKTOP_ACCESS_NOT_FOUND = "io.xconn.error.desktop_access_not_found"
+ERROR_SERVICE_OVERLOADED = "io.xconn.error.service_overloaded"
+ERROR_RATE_LIMITED = "io.xconn.error.rate_limited"
@@ -0,0 +1,144 @@
+import os
+import time
+import uuid
+import asyncio
+import contextlib
+from typing import Any, Awaitable, Callable
+
+from xconn import App
+from sqlalchemy.ext.asyncio import AsyncSession, AsyncConnection
+
+from deskconn import models, metrics, invalidation, lookup_filter, desktop_replica
+from deskconn.api import coturn
+from deskconn.database import database
+from deskconn.database.backend import user as user_backend
+from deskconn.database.backend import device as device_backend
+from deskconn.database.backend import update as update_backend
+from deskconn.database.backend import desktop as desktop_backend
+from deskconn.database.backend import principal as principal_backend
+
+# how long registration with the router may wait for the warm-up, 0 registers at once without one
+WARMUP_SECONDS = float(os.getenv("DESKCONN_WARMUP_SECONDS", "20"))
+# users and desktops whose principal ids are cached before the first call
+WARMUP_RECENT = int(os.getenv("DESKCONN_WARMUP_RECENT", "1000"))
+
+if WARMUP_SECONDS < 0:
+    raise ValueError("'DESKCONN_WARMUP_SECONDS' must not be negative.")
+
+NIL = uuid.UUID(int=0)
+
+# the statements of the auth and update check paths; matching nothing, they only prepare each connection's cache
+HOT_STATEMENTS: list[Callable[[AsyncSession], Awaitable[Any]]] = [
+    lambda db: user_backend.get_user_by_email(db, ""),
+    lambda db: principal_backend.user_principal_exists(db, "", models.User(id=NIL)),
+    lambda db: device_backend.get_device_by_public_key(db, "", NIL),
+    lambda db: desktop_backend.get_desktop_by_public_key(db, "", ""),
+    lambda db: desktop_backend.get_desktop_by_authid(db, ""),
+    lambda db: desktop_backend.get_desktop_by_realm(db, ""),
+    lambda db: desktop_backend.has_desktop_access(db, NIL, NIL),
+    lambda db: update_backend.get_app_by_name(db, ""),
+    lambda db: update_backend.get_latest_app_version(db, NIL),
+]
+
+_done = asyncio.Event()
+stats = {"done": False, "timed_out": False, "seconds": 0.0, "connections": 0, "statements": 0, "principals": 0}
+
+
+async def _prepare(connection: AsyncConnection) -> None:
+    async with AsyncSession(bind=connection) as db:
+        for statement in HOT_STATEMENTS:
+            await statement(db)
+            stats["statements"] += 1
+
+
+async def _warm_pool() -> None:
+    # held together, so the pool really opens this many instead of reusing the first
+    async with contextlib.AsyncExitStack() as stack:
+        connections = [await stack.enter_async_context(database.engine.connect()) for _ in range(database.DB_POOL_SIZE)]
+        stats["connections"] = len(connections)
+        await asyncio.gather(*(_prepare(connection) for connection in connections))
+
+
+async def _prefill_principals() -> None:
+    async with database.AsyncSessionLocal() as db:
+        users = await user_backend.get_recently_active_users(db, WARMUP_RECENT)
+        desktops = await desktop_backend.get_recent_desktops(db, WARMUP_RECENT)
+
+    for authid, principal_id in [*users, *desktops]:
+        coturn.principal_ids.set(authid, principal_id)
+
+    stats["principals"] = len(users) + len(desktops)
+
+
+STEPS: list[tuple[str, Callable[[], Awaitable[None]]]] = [
+    ("database pool", _warm_pool),
+    # connecting flushes every cache, so nothing is prefilled before it
+    ("invalidation listener", invalidation.wait_connected),
+    ("lookup filter", lookup_filter.wait_built),
+    ("desktop replica", desktop_replica.wait_loaded),
+    ("recent principals", _prefill_principals),
+]
+
+
+async def _run_steps() -> None:
+    for name, step in STEPS:
+        started = time.perf_counter()
+        await step()
+        print(f"warm-up: {name} ready in {time.perf_counter() - started:.2f}s")
+
+
+async def run() -> None:
+    """Warms the process up within WARMUP_SECONDS, then lets the procedures register."""
+    if _done.is_set() or WARMUP_SECONDS <= 0:
+        return
+
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(_run_steps(), WARMUP_SECONDS)
+    except asyncio.TimeoutError:
+        stats["timed_out"] = True
+        print(f"warm-up: not finished within {WARMUP_SECONDS:.0f}s, registering anyway")
+    except Exception as e:
+        print(f"warm-up failed: {e}, registering anyway")
+    finally:
+        stats["done"] = True
+        stats["seconds"] = time.perf_counter() - started
+        _done.set()
+
+    print(f"warm-up finished in {stats['seconds']:.2f}s")
+
+
+def gate_registrations(app: App) -> None:
+    """Holds back the app's registrations with the router until run() has finished.
+
+    The startup handler runs alongside the registrations, so they are delayed on the session itself.
+    """
+    if WARMUP_SECONDS <= 0:
+        return
+
+    set_session = app.set_session
+
+    def set_session_after_warmup(session) -> None:
+        register = session.register
+
+        async def register_when_warm(*args, **kwargs):
+            if not _done.is_set():
+                try:
+                    # run() is bounded by the same budget; this only guards against it never being started
+                    await asyncio.wait_for(_done.wait(), WARMUP_SECONDS)
+                except asyncio.TimeoutError:
+                    _done.set()
+
+            return await register(*args, **kwargs)
+
+        session.register = register_when_warm
+        set_session(session)
+
+    app.set_session = set_session_after_warmup
+
+
+def warmup_stats() -> dict[str, Any]:
+    return dict(stats)
+
+
+metrics.register_collector("warmup", warmup_stats)
@@ -0,0 +1,110 @@
+import os
+import signal
+import asyncio
+from typing import Any, Callable
+
+from xconn import App
+from xconn.async_session import Registration
+from xconn.types import InvokeOptions
+
+from deskconn.middleware import ProcedureCall, Handler
+
+# set by the supervisor for each worker it starts
+WORKER_ID = os.getenv("DESKCONN_WORKER_ID", None)
+# how long a worker asked to stop keeps serving invocations it already accepted
+DRAIN_TIMEOUT = float(os.getenv("DESKCONN_DRAIN_TIMEOUT", "30"))
+
+# unregistering stops waiting for a router that does not answer after this many seconds
+UNREGISTER_TIMEOUT = 5.0
+
+in_flight = 0
+_idle = asyncio.Event()
+_idle.set()
+_drain_task: asyncio.Task | None = None
+# run once the invocations have finished, right before the process stops
+drain_hooks: list[Callable[[], None]] = []
+# every procedure this process registered, unregistered when it drains
+registrations: list[Registration] = []
+
+
+def share_registrations(app: App) -> None:
+    """Registers every procedure with round-robin invocation so several workers, or an old and a new
+    process during a restart, can serve it at the same time.
+
+    Must be called after middleware.install, so the wrappers carry the option.
+    """
+    for func in app.procedures.values():
+        options = getattr(func, "__xconn_register_options__", None) or {}
+        func.__xconn_register_options__ = {**options, "invoke": InvokeOptions.ROUNDROBIN.value}
+
+
+def track_registrations(app: App) -> None:
+    """Keeps the registration of every procedure the app registers, so drain() can unregister them."""
+    set_session = app.set_session
+
+    def set_session_tracking(session) -> None:
+        register = session.register
+
+        async def register_tracked(*args, **kwargs):
+            registration = await register(*args, **kwargs)
+            registrations.append(registration)
+            return registration
+
+        session.register = register_tracked
+        set_session(session)
+
+    app.set_session = set_session_tracking
+
+
+async def _unregister(registration: Registration) -> None:
+    try:
+        await asyncio.wait_for(registration.unregister(), UNREGISTER_TIMEOUT)
+    except Exception as e:
+        print(f"failed to unregister {registration.registration_id}: {e or type(e).__name__}")
+
+
+async def middleware(call: ProcedureCall, call_next: Handler) -> Any:
+    global in_flight
+
+    in_flight += 1
+    _idle.clear()
+    try:
+        return await call_next()
+    finally:
+        in_flight -= 1
+        if in_flight == 0:
+            _idle.set()
+
+
+async def drain() -> None:
+    """Stops receiving invocations, waits for the running ones and then stops the process."""
+    print(f"draining, {in_flight} invocations in flight")
+
+    await asyncio.gather(*(_unregister(registration) for registration in registrations))
+    registrations.clear()
+
+    try:
+        await asyncio.wait_for(_idle.wait(), DRAIN_TIMEOUT)
+    except asyncio.TimeoutError:
+        print(f"drain timed out with {in_flight} invocations in flight")
+
+    for hook in drain_hooks:
+        try:
+            hook()
+        except Exception as e:
+            print(f"drain hook failed: {e}")
+
+    # xconn's own SIGINT handler closes the session and exits
+    signal.raise_signal(signal.SIGINT)
+
+
+def install_drain() -> None:
+    """Makes SIGTERM drain the worker instead of cancelling in-flight invocations."""
+    loop = asyncio.get_running_loop()
+
+    def on_sigterm() -> None:
+        global _drain_task
+        if _drain_task is None:
+            _drain_task = loop.create_task(drain())
+
+    loop.add_signal_handler(signal.SIGTERM, on_sigterm)
@@ -1,6 +1,24 @@
 from xconn import App
 from xconn.app import ExecutionMode
 
+from deskconn import (
+    admission,
+    authz_index,
+    desktop_replica,
+    health,
+    invalidation,
+    loop_monitor,
+    lookup_filter,
+    metrics,
+    middleware,
+    profiling,
+    rate_limit,
+    snapshots,
+    tracing,
+    warmup,
+    workers,
+)
+from deskconn.database.database import observe_statements, DATABASE_URL
 from deskconn.api.auth import component as auth_component
 from deskconn.api.user import component as user_component
 from deskconn.api.coturn import component as coturn_component
@@ -9,6 +27,7 @@ from deskconn.api.desktop import component as desktop_component
 from deskconn.api.principal import component as principal_component
 from deskconn.api.organization import component as organization_component
 from deskconn.api.update import component as update_component
+from deskconn.api.management import component as management_component
 
 
 app = App()
@@ -23,4 +42,32 @@ app.include_component(desktop_component)
 app.include_component(principal_component)
 app.include_component(organization_component)
 app.include_component(update_component)
+app.include_component(management_component)
 app.set_schema_procedure("io.xconn.deskconn.account.schema.get")
+
+observe_statements(metrics.record_statement)
+observe_statements(tracing.record_statement)
+middleware.install(
+    app, [workers.middleware, tracing.middleware, metrics.middleware, admission.middleware, profiling.middleware]
+)
+workers.share_registrations(app)
+workers.track_registrations(app)
+warmup.gate_registrations(app)
+
+
+async def startup():
+    health.start(app.session)
+    workers.install_drain()
+    await metrics.start_exporter()
+    tracing.start()
+    loop_monitor.start()
+    rate_limit.start()
+    lookup_filter.start()
+    desktop_replica.start()
+    snapshots.start()
+    authz_index.start()
+    invalidation.start(DATABASE_URL)
+    await warmup.run()
+
+
+app.add_event_handler("startup", startup)
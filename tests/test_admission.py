@@ -0,0 +1,121 @@
+import asyncio
+
+import pytest
+from xconn.exception import ApplicationError
+
+from deskconn import admission, uris
+from deskconn.middleware import ProcedureCall
+
+AUTH = "io.xconn.deskconn.account.cra.verify"
+DEFAULT = "io.xconn.deskconn.account.get"
+BULK = "io.xconn.deskconn.desktop.list"
+EXEMPT = "io.xconn.deskconn.account.health"
+
+
+@pytest.fixture
+def lanes(monkeypatch):
+    """A capacity of 4: one slot reserved for auth, bulk capped at one."""
+    monkeypatch.setattr(admission, "ADMISSION_CAPACITY", 4)
+    monkeypatch.setattr(admission, "ADMISSION_AUTH_RESERVED", 1)
+    monkeypatch.setattr(admission, "ADMISSION_WAIT_MS", 20)
+    monkeypatch.setattr(admission, "shared_limit", 3)
+    monkeypatch.setattr(admission, "_released", asyncio.Condition())
+    monkeypatch.setattr(
+        admission,
+        "lanes",
+        {
+            admission.LANE_AUTH: admission.LaneStats(limit=4),
+            admission.LANE_DEFAULT: admission.LaneStats(limit=3),
+            admission.LANE_BULK: admission.LaneStats(limit=1),
+        },
+    )
+
+    return admission.lanes
+
+
+class Calls:
+    """Invocations that stay in flight until released."""
+
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.tasks = []
+
+    async def start(self, uri: str, count: int = 1) -> None:
+        for _ in range(count):
+            call = ProcedureCall(uri=uri, kwargs={})
+            self.tasks.append(asyncio.create_task(admission.middleware(call, self.release.wait)))
+
+        await asyncio.sleep(0)
+
+    async def finish(self) -> None:
+        self.release.set()
+        await asyncio.gather(*self.tasks)
+
+
+async def invoke(uri: str) -> str:
+    async def handler():
+        return uri
+
+    return await admission.middleware(ProcedureCall(uri=uri, kwargs={}), handler)
+
+
+@pytest.mark.asyncio
+async def test_auth_is_admitted_while_the_default_and_bulk_lanes_are_saturated(lanes):
+    calls = Calls()
+    await calls.start(BULK)
+    await calls.start(DEFAULT, count=2)
+    assert lanes[admission.LANE_DEFAULT].in_flight + lanes[admission.LANE_BULK].in_flight == admission.shared_limit
+
+    for uri in (DEFAULT, BULK):
+        with pytest.raises(ApplicationError) as rejected:
+            await invoke(uri)
+        assert rejected.value.message == uris.ERROR_SERVICE_OVERLOADED
+
+    assert await invoke(AUTH) == AUTH
+    assert lanes[admission.LANE_AUTH].admitted == 1
+    assert lanes[admission.LANE_DEFAULT].rejected == 1
+    assert lanes[admission.LANE_BULK].rejected == 1
+
+    await calls.finish()
+
+
+@pytest.mark.asyncio
+async def test_bulk_calls_cannot_take_the_capacity_of_the_default_lane(lanes):
+    calls = Calls()
+    await calls.start(BULK)
+
+    with pytest.raises(ApplicationError):
+        await invoke(BULK)
+
+    assert await invoke(DEFAULT) == DEFAULT
+
+    await calls.finish()
+
+
+@pytest.mark.asyncio
+async def test_auth_can_use_all_capacity_and_then_waits_too(lanes):
+    calls = Calls()
+    await calls.start(AUTH, count=4)
+
+    with pytest.raises(ApplicationError):
+        await invoke(AUTH)
+
+    # operational procedures are never limited
+    assert await invoke(EXEMPT) == EXEMPT
+
+    await calls.finish()
+
+
+@pytest.mark.asyncio
+async def test_a_waiting_call_is_admitted_when_a_slot_frees_in_time(lanes, monkeypatch):
+    monkeypatch.setattr(admission, "ADMISSION_WAIT_MS", 1000)
+    calls = Calls()
+    await calls.start(BULK)
+
+    waiting = asyncio.create_task(invoke(BULK))
+    await asyncio.sleep(0.01)
+    assert not waiting.done()
+
+    await calls.finish()
+    assert await waiting == BULK
+    assert lanes[admission.LANE_BULK].in_flight == 0
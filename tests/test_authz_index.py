@@ -0,0 +1,157 @@
+import asyncio
+import secrets
+from datetime import timedelta
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import delete, text
+from xconn.exception import ApplicationError
+
+from deskconn import authz_index, helpers, invalidation, models
+from deskconn.api import auth
+from deskconn.authz_reader import AuthzIndex
+from deskconn.database.database import AsyncSessionLocal, engine
+
+verify_cryptosign = auth.component.procedures["io.xconn.deskconn.account.cryptosign.verify"]
+
+OTHER_REALM = "io.xconn.deskconn.nowhere"
+
+
+def new_key() -> str:
+    return secrets.token_hex(32)
+
+
+async def database_available() -> bool:
+    try:
+        async with asyncio.timeout(2):
+            async with engine.connect() as conn:
+                await conn.execute(text("SELECT 1 FROM deskconn.users LIMIT 1"))
+    except Exception:
+        return False
+
+    return True
+
+
+@pytest_asyncio.fixture
+async def accounts():
+    if not await database_available():
+        await engine.dispose()
+        pytest.skip("needs a migrated database at DESKCONN_DATABASE_URL")
+
+    tag = secrets.token_hex(4)
+    now = helpers.utcnow()
+
+    def user(name: str, verified: bool) -> models.User:
+        return models.User(email=f"{name}-{tag}@example.com", password="x", name=name, is_verified=verified)
+
+    alice, bob, carol = user("alice", True), user("bob", False), user("carol", True)
+    desktop = models.Desktop(
+        authid=f"desktop-{tag}", name="desktop", public_key=new_key(), realm=f"realm-{tag}", user=alice
+    )
+    other_desktop = models.Desktop(
+        authid=f"other-{tag}", name="other", public_key=new_key(), realm=f"other-realm-{tag}", user=bob
+    )
+    organization = models.Organization(name=f"org-{tag}", owner=alice)
+
+    keys = {name: new_key() for name in ("alice", "alice_expired", "alice_device", "bob", "carol")}
+
+    rows = [
+        alice,
+        bob,
+        carol,
+        desktop,
+        other_desktop,
+        organization,
+        models.Principal(public_key=keys["alice"], expires_at=now + timedelta(days=1), user=alice),
+        models.Principal(public_key=keys["alice_expired"], expires_at=now - timedelta(minutes=1), user=alice),
+        models.Device(device_id=f"device-{tag}", public_key=keys["alice_device"], user=alice),
+        models.Principal(public_key=keys["bob"], expires_at=now + timedelta(days=1), user=bob),
+        models.Principal(public_key=keys["carol"], expires_at=now + timedelta(days=1), user=carol),
+        models.DesktopUserAccess(desktop=desktop, user=alice, role=models.DesktopAccessRole.owner),
+        models.OrganizationMember(organization=organization, user=carol, role=models.OrganizationMemberRole.member),
+        models.DesktopOrganizationAccess(
+            desktop=desktop, organization=organization, role=models.DesktopAccessRole.member
+        ),
+    ]
+
+    async with AsyncSessionLocal() as db:
+        db.add_all(rows)
+        await db.commit()
+
+    try:
+        yield {"alice": alice, "bob": bob, "carol": carol, "desktop": desktop, "other_desktop": other_desktop}, keys
+    finally:
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(models.User).where(models.User.id.in_([alice.id, bob.id, carol.id])))
+            await db.commit()
+
+        await engine.dispose()
+
+
+async def verify(authid: str, public_key: str, realm: str) -> str | None:
+    async with AsyncSessionLocal() as db:
+        try:
+            result = await verify_cryptosign(authid, public_key, realm, db=db)
+        except ApplicationError:
+            return None
+
+    return result.args[0]["authrole"]
+
+
+@pytest.mark.asyncio
+async def test_index_answers_like_cryptosign_verification(accounts, tmp_path):
+    subjects, keys = accounts
+    alice, bob, carol = subjects["alice"], subjects["bob"], subjects["carol"]
+    desktop, other_desktop = subjects["desktop"], subjects["other_desktop"]
+    desktop_role = helpers.ROLE_DESKTOP.format(authid=desktop.authid)
+
+    path = tmp_path / "authz.idx"
+    path.write_bytes(await authz_index.build())
+    index = AuthzIndex(str(path))
+
+    cases = [
+        (alice.email, keys["alice"], helpers.CLOUD_REALM, helpers.ROLE_USER),
+        (alice.email, keys["alice"], desktop.realm, helpers.ROLE_USER),
+        (alice.email, keys["alice_device"], desktop.realm, helpers.ROLE_USER),
+        (alice.email, keys["alice"], other_desktop.realm, None),
+        # expired principal
+        (alice.email, keys["alice_expired"], helpers.CLOUD_REALM, None),
+        # unverified user
+        (bob.email, keys["bob"], helpers.CLOUD_REALM, None),
+        # desktop realm through an organization
+        (carol.email, keys["carol"], desktop.realm, helpers.ROLE_USER),
+        (carol.email, keys["carol"], OTHER_REALM, None),
+        # the desktop itself, on its own realm and the cloud realm
+        (desktop.authid, desktop.public_key, desktop.realm, desktop_role),
+        (desktop.authid, desktop.public_key, helpers.CLOUD_REALM, desktop_role),
+        (desktop.authid, desktop.public_key, other_desktop.realm, None),
+        (desktop.authid, keys["alice"], desktop.realm, None),
+    ]
+    try:
+        for authid, public_key, realm, expected in cases:
+            assert index.authorize(authid, public_key, realm) == expected, (authid, realm)
+            assert await verify(authid, public_key, realm) == expected, (authid, realm)
+    finally:
+        index.close()
+
+
+def change(table: str, op: str, old: dict | None, new: dict | None) -> invalidation.Change:
+    return invalidation.Change(table=table, op=op, old=old, new=new)
+
+
+def test_only_changes_that_can_alter_the_index_rebuild_it():
+    user = {"id": "1", "email": "a@example.com", "is_verified": False}
+
+    assert authz_index.affects_index(change("users", "insert", None, user))
+    assert authz_index.affects_index(change("users", "update", user, {**user, "is_verified": True}))
+    assert authz_index.affects_index(change("users", "update", user, {**user, "email": "b@example.com"}))
+    # a name or password update notifies with the same columns
+    assert not authz_index.affects_index(change("users", "update", user, dict(user)))
+
+    access = {"desktop_id": "1", "user_id": "2"}
+    assert authz_index.affects_index(change("desktop_user_access", "delete", access, None))
+    assert not authz_index.affects_index(change("desktop_user_access", "update", access, dict(access)))
+
+    # a new public key is not in the notification
+    desktop = {"id": "1", "authid": "d", "user_id": "2", "realm": "r"}
+    assert authz_index.affects_index(change("desktops", "update", desktop, dict(desktop)))
@@ -0,0 +1,146 @@
+import asyncio
+import itertools
+
+import pytest
+
+from deskconn.cache import MISSING, AsyncCache
+
+_names = itertools.count()
+
+
+def new_cache(**kwargs) -> AsyncCache:
+    # caches register themselves by name for the metrics collector
+    return AsyncCache(f"test-{next(_names)}", **{"ttl": 60, "max_size": 100, **kwargs})
+
+
+class Loader:
+    def __init__(self, value="value"):
+        self.value = value
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        await self.release.wait()
+        return self.value
+
+
+def _returning(value):
+    async def load():
+        return value
+
+    return load
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_share_one_load():
+    cache = new_cache()
+    loader = Loader()
+
+    callers = [asyncio.create_task(cache.get_or_load("key", loader)) for _ in range(5)]
+    await asyncio.sleep(0)
+    loader.release.set()
+
+    assert await asyncio.gather(*callers) == ["value"] * 5
+    assert loader.calls == 1
+    assert cache.stats.loads == 1
+    assert cache.stats.coalesced == 4
+    assert cache.get("key") == "value"
+
+
+@pytest.mark.asyncio
+async def test_waiters_take_over_from_a_cancelled_leader():
+    cache = new_cache()
+    loader = Loader()
+
+    leader = asyncio.create_task(cache.get_or_load("key", loader))
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(cache.get_or_load("key", loader))
+    await asyncio.sleep(0)
+
+    leader.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await leader
+
+    await asyncio.sleep(0)
+    loader.release.set()
+
+    assert await waiter == "value"
+    assert loader.calls == 2
+    assert cache.get("key") == "value"
+
+
+@pytest.mark.asyncio
+async def test_load_errors_reach_every_waiter_and_are_not_cached():
+    cache = new_cache()
+    release = asyncio.Event()
+
+    async def failing():
+        await release.wait()
+        raise ValueError("boom")
+
+    callers = [asyncio.create_task(cache.get_or_load("key", failing)) for _ in range(3)]
+    await asyncio.sleep(0)
+    release.set()
+
+    results = await asyncio.gather(*callers, return_exceptions=True)
+
+    assert all(isinstance(result, ValueError) for result in results)
+    assert cache.stats.load_errors == 1
+    assert cache.get("key") is MISSING
+
+
+@pytest.mark.asyncio
+async def test_invalidation_during_a_load_does_not_store_the_stale_value():
+    cache = new_cache()
+    loader = Loader("stale")
+
+    load = asyncio.create_task(cache.get_or_load("key", loader))
+    await asyncio.sleep(0)
+    cache.invalidate("key")
+    loader.release.set()
+
+    # the caller still gets what it loaded, later callers load again
+    assert await load == "stale"
+    assert cache.peek("key") is MISSING
+
+    assert await cache.get_or_load("key", _returning("fresh")) == "fresh"
+    assert cache.peek("key") == "fresh"
+
+
+@pytest.mark.asyncio
+async def test_tag_invalidation_during_a_load_does_not_store_the_stale_value():
+    cache = new_cache()
+    loader = Loader("stale")
+
+    load = asyncio.create_task(cache.get_or_load("key", loader, tags=["user:1"]))
+    await asyncio.sleep(0)
+    cache.invalidate_tag("user:1")
+    loader.release.set()
+
+    assert await load == "stale"
+    assert cache.peek("key") is MISSING
+
+
+@pytest.mark.asyncio
+async def test_none_is_only_cached_with_a_negative_ttl():
+    uncached = new_cache()
+    await uncached.get_or_load("key", _returning(None))
+    assert uncached.peek("key") is MISSING
+
+    cached = new_cache(negative_ttl=60)
+    await cached.get_or_load("key", _returning(None))
+    assert cached.get("key") is None
+    assert cached.stats.negative_hits == 1
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = new_cache(max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.peek("b") is MISSING
+    assert cache.peek("a") == 1
+    assert cache.stats.evictions == 1
@@ -0,0 +1,17 @@
+import uuid
+
+from deskconn.api import coturn
+
+
+def test_credentials_are_reused_and_issued_ones_counted():
+    principal_id = uuid.uuid4()
+    issued = coturn.issued_stats["issued"]
+
+    first = coturn.issue_credentials(principal_id)
+    assert coturn.issue_credentials(principal_id) == first
+    assert coturn.issued_stats["issued"] == issued + 1
+
+    coturn.credentials.invalidate(principal_id)
+    assert coturn.issue_credentials(principal_id) is not first
+    assert coturn.issued_stats["issued"] == issued + 2
+    assert coturn.collect_stats()["issued"] == issued + 2
@@ -0,0 +1,194 @@
+import asyncio
+import contextlib
+import json
+import uuid
+from typing import NamedTuple
+
+import pytest
+import pytest_asyncio
+
+from deskconn import desktop_replica, invalidation
+from deskconn.database.backend import desktop as desktop_backend
+
+OWNER = uuid.uuid4()
+
+
+class Row(NamedTuple):
+    id: uuid.UUID
+    authid: str
+    public_key: str
+    realm: str
+    user_id: uuid.UUID
+
+
+class Desktops:
+    """The desktops table, read by the replica's loads and reloads."""
+
+    def __init__(self):
+        self.rows: dict[uuid.UUID, Row] = {}
+        # reloads wait for this, holding the row they read
+        self.gate = asyncio.Event()
+        self.gate.set()
+        self.failing = False
+
+    def insert(self, authid: str, public_key: str) -> Row:
+        row = Row(uuid.uuid4(), authid, public_key, f"realm-{authid}", OWNER)
+        self.rows[row.id] = row
+        notify("insert", new=row)
+        return row
+
+    def update(self, row: Row, **values) -> Row:
+        self.rows[row.id] = updated = row._replace(**values)
+        notify("update", old=row, new=updated)
+        return updated
+
+    def delete(self, row: Row) -> None:
+        del self.rows[row.id]
+        notify("delete", old=row)
+
+    async def stream_credentials(self, db, batch_size):
+        for row in list(self.rows.values()):
+            yield row
+
+    async def get_credentials(self, db, desktop_id):
+        if self.failing:
+            raise ConnectionError("database went away")
+
+        row = self.rows.get(desktop_id)
+        await self.gate.wait()
+        return row
+
+
+def notify(op: str, old: Row | None = None, new: Row | None = None) -> None:
+    # the trigger sends the keys, not the public key
+    def keys(row: Row | None):
+        return None if row is None else {"id": str(row.id), "authid": row.authid, "realm": row.realm}
+
+    invalidation.dispatch(json.dumps({"t": "desktops", "op": op, "old": keys(old), "new": keys(new)}))
+
+
+async def settle() -> None:
+    """Lets the applier work through the queue; the table above never waits on I/O."""
+    for _ in range(50):
+        await asyncio.sleep(0)
+
+
+@contextlib.asynccontextmanager
+async def session():
+    yield None
+
+
+@pytest_asyncio.fixture
+async def table(monkeypatch):
+    for name, value in {
+        "_desktops": {},
+        "_authid_by_id": {},
+        "_generation": 0,
+        "_ready": False,
+        "_loaded": asyncio.Event(),
+        "_pending": asyncio.Queue(),
+        "stats": dict.fromkeys(desktop_replica.stats, 0),
+        "RETRY_DELAY": 0,
+        "AsyncSessionLocal": session,
+    }.items():
+        monkeypatch.setattr(desktop_replica, name, value)
+
+    desktops = Desktops()
+    monkeypatch.setattr(desktop_backend, "stream_credentials", desktops.stream_credentials)
+    monkeypatch.setattr(desktop_backend, "get_credentials", desktops.get_credentials)
+    monkeypatch.setattr(invalidation, "invalidators", {})
+    monkeypatch.setitem(invalidation.stats, "connected", True)
+    invalidation.register("desktop_replica", ("desktops",), desktop_replica._invalidate)
+
+    applier = asyncio.create_task(desktop_replica._apply())
+    # what the listener does on connect
+    invalidation.flush()
+    await settle()
+
+    yield desktops
+
+    applier.cancel()
+
+
+@pytest.mark.asyncio
+async def test_inserts_updates_and_deletes_are_applied_from_notifications(table):
+    assert desktop_replica.ready()
+
+    laptop = table.insert("laptop", "key-1")
+    assert not desktop_replica.ready()
+    await settle()
+
+    assert desktop_replica.ready()
+    assert desktop_replica.verify("laptop", "key-1") == "realm-laptop"
+    assert desktop_replica.verify("laptop", "key-2") is None
+
+    laptop = table.update(laptop, public_key="key-2")
+    await settle()
+    assert desktop_replica.verify("laptop", "key-1") is None
+    assert desktop_replica.verify("laptop", "key-2") == "realm-laptop"
+
+    # a renamed desktop is no longer found under its old authid
+    table.update(laptop, authid="workstation")
+    await settle()
+    assert desktop_replica.verify("laptop", "key-2") is None
+    assert desktop_replica.verify("workstation", "key-2") == "realm-laptop"
+
+    table.delete(table.rows[laptop.id])
+    await settle()
+    assert desktop_replica.verify("workstation", "key-2") is None
+    assert desktop_replica.ready()
+
+
+@pytest.mark.asyncio
+async def test_a_slow_read_of_an_old_row_does_not_overwrite_a_newer_one(table):
+    laptop = table.insert("laptop", "key-1")
+    await settle()
+
+    table.gate.clear()
+    table.update(laptop, public_key="key-2")
+    await settle()
+    # the first reload holds key-2 while key-3 is committed and notified
+    table.update(table.rows[laptop.id], public_key="key-3")
+    table.gate.set()
+    await settle()
+
+    assert desktop_replica.verify("laptop", "key-3") == "realm-laptop"
+    assert desktop_replica.stats["reloads"] == 3
+
+
+@pytest.mark.asyncio
+async def test_the_replica_is_not_ready_while_changes_may_be_missing(table, monkeypatch):
+    table.insert("laptop", "key-1")
+    await settle()
+    assert desktop_replica.ready()
+
+    monkeypatch.setitem(invalidation.stats, "connected", False)
+    assert not desktop_replica.ready()
+    monkeypatch.setitem(invalidation.stats, "connected", True)
+
+    # a truncate loads everything again
+    notify("truncate")
+    assert not desktop_replica.ready()
+    await settle()
+    assert desktop_replica.ready()
+    assert desktop_replica.stats["loads"] == 2
+
+
+@pytest.mark.asyncio
+async def test_a_failed_reload_makes_the_replica_load_everything_again(table, monkeypatch):
+    monkeypatch.setattr(desktop_replica, "RETRY_DELAY", 0.05)
+    laptop = table.insert("laptop", "key-1")
+    await settle()
+
+    table.failing = True
+    table.update(laptop, public_key="key-2")
+    await settle()
+
+    assert desktop_replica.stats["errors"] == 1
+    assert not desktop_replica.ready()
+    # the full load after the failure does not need the failing row read
+    await asyncio.sleep(0.1)
+    await settle()
+
+    assert desktop_replica.ready()
+    assert desktop_replica.verify("laptop", "key-2") == "realm-laptop"
@@ -0,0 +1,110 @@
+from datetime import datetime, timedelta, timezone
+
+from deskconn import helpers
+
+
+def test_cheapest_delta_path_direct():
+    deltas = [("v1", "v2", 10, "a")]
+
+    assert helpers.cheapest_delta_path(deltas, "v1", "v2") == (10, ["a"])
+
+
+def test_cheapest_delta_path_prefers_fewer_bytes_over_fewer_hops():
+    deltas = [
+        ("v1", "v3", 100, "big"),
+        ("v1", "v2", 30, "first"),
+        ("v2", "v3", 40, "second"),
+    ]
+
+    assert helpers.cheapest_delta_path(deltas, "v1", "v3") == (70, ["first", "second"])
+
+
+def test_cheapest_delta_path_ties_do_not_compare_items():
+    # items without an ordering must never be compared when sizes tie
+    first, second = object(), object()
+    deltas = [("v1", "v2", 5, first), ("v1", "v2", 5, second), ("v2", "v3", 5, first)]
+
+    total, chain = helpers.cheapest_delta_path(deltas, "v1", "v3")
+
+    assert total == 10
+    assert len(chain) == 2
+
+
+def test_cheapest_delta_path_unreachable():
+    deltas = [("v1", "v2", 10, "a"), ("v3", "v4", 10, "b")]
+
+    assert helpers.cheapest_delta_path(deltas, "v1", "v4") is None
+
+
+def test_cheapest_delta_path_ignores_cycles():
+    deltas = [("v1", "v2", 1, "a"), ("v2", "v1", 1, "back"), ("v2", "v3", 1, "b")]
+
+    assert helpers.cheapest_delta_path(deltas, "v1", "v3") == (2, ["a", "b"])
+
+
+def test_cheapest_delta_path_same_version():
+    assert helpers.cheapest_delta_path([], "v1", "v1") == (0, [])
+
+
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+END = START + timedelta(days=10)
+
+
+def test_rollout_percentage_is_zero_before_the_start():
+    assert helpers.rollout_percentage(50, START, END, now=START - timedelta(seconds=1)) == 0
+
+
+def test_rollout_percentage_ramps_linearly():
+    assert helpers.rollout_percentage(50, START, END, now=START) == 0
+    assert helpers.rollout_percentage(50, START, END, now=START + timedelta(days=5)) == 25
+    assert helpers.rollout_percentage(50, START, END, now=START + timedelta(days=9)) == 45
+
+
+def test_rollout_percentage_holds_after_the_end():
+    assert helpers.rollout_percentage(50, START, END, now=END) == 50
+    assert helpers.rollout_percentage(50, START, END, now=END + timedelta(days=30)) == 50
+
+
+def test_rollout_percentage_without_a_schedule():
+    assert helpers.rollout_percentage(30, None, None, now=START) == 30
+    # a start without an end switches on at the start
+    assert helpers.rollout_percentage(30, START, None, now=START - timedelta(seconds=1)) == 0
+    assert helpers.rollout_percentage(30, START, None, now=START) == 30
+
+
+def test_rollout_percentage_reads_naive_datetimes_as_utc():
+    naive_start, naive_end = START.replace(tzinfo=None), END.replace(tzinfo=None)
+
+    assert helpers.rollout_percentage(50, naive_start, naive_end, now=START + timedelta(days=5)) == 25
+    assert helpers.rollout_percentage(50, naive_start, naive_end, now=START - timedelta(days=1)) == 0
+
+
+def test_rollout_bucket_is_stable_per_authid():
+    bucket = helpers.rollout_bucket("deskconn", "desktop-1")
+
+    assert helpers.rollout_bucket("deskconn", "desktop-1") == bucket
+    assert 0 <= bucket < helpers.ROLLOUT_BUCKETS
+
+    buckets = {helpers.rollout_bucket("deskconn", f"desktop-{i}") for i in range(1000)}
+    # authids spread over the buckets, so a percentage selects about that share of desktops
+    assert len(buckets) == helpers.ROLLOUT_BUCKETS
+
+
+def test_rollout_bucket_differs_between_apps():
+    authids = [f"desktop-{i}" for i in range(100)]
+
+    first = [helpers.rollout_bucket("deskconn", authid) for authid in authids]
+    second = [helpers.rollout_bucket("deskconn-agent", authid) for authid in authids]
+
+    assert first != second
+
+
+def test_in_rollout_cohort_grows_with_the_ramp():
+    now = helpers.utcnow()
+    starts_at, ends_at = now - timedelta(days=1), now + timedelta(days=1)
+
+    # halfway through a ramp to 100%, about the lower half of the buckets is in
+    assert helpers.in_rollout_cohort(0, 100, starts_at, ends_at)
+    assert not helpers.in_rollout_cohort(helpers.ROLLOUT_BUCKETS - 1, 100, starts_at, ends_at)
+    assert not helpers.in_rollout_cohort(0, 0, None, None)
+    assert helpers.in_rollout_cohort(helpers.ROLLOUT_BUCKETS - 1, 100, None, None)
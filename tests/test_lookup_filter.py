@@ -0,0 +1,119 @@
+import asyncio
+import json
+
+import pytest
+from xconn.exception import ApplicationError
+
+from deskconn import invalidation, lookup_filter, uris
+from deskconn.api import auth
+from deskconn.database.backend import user as user_backend
+from deskconn.lookup_filter import BloomFilter
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(1000, 0.01)
+    values = [f"user{i}@example.com" for i in range(1000)]
+    for value in values:
+        bloom.add(value)
+
+    assert all(value in bloom for value in values)
+    assert bloom.count == 1000
+
+
+def test_bloom_filter_error_rate_is_near_the_target():
+    bloom = BloomFilter(1000, 0.01)
+    for i in range(1000):
+        bloom.add(f"present{i}")
+
+    false_positives = sum(f"absent{i}" in bloom for i in range(10000))
+
+    assert false_positives < 300
+    assert bloom.error_rate == pytest.approx(0.01, rel=0.5)
+
+
+def test_bloom_filter_bytes_round_trip():
+    bloom = BloomFilter(500, 0.05)
+    for i in range(300):
+        bloom.add(f"authid{i}")
+
+    restored = BloomFilter.from_bytes(memoryview(bloom.to_bytes()))
+
+    assert (restored.size, restored.hashes, restored.count) == (bloom.size, bloom.hashes, bloom.count)
+    assert restored.to_bytes() == bloom.to_bytes()
+    assert all(f"authid{i}" in restored for i in range(300))
+
+
+def test_bloom_filter_rejects_truncated_bytes():
+    data = BloomFilter(500, 0.05).to_bytes()
+
+    with pytest.raises(ValueError):
+        BloomFilter.from_bytes(memoryview(data[:-1]))
+
+
+@pytest.fixture
+def listening_filter(monkeypatch):
+    bloom = BloomFilter(100, 0.01)
+    monkeypatch.setattr(lookup_filter, "_filter", bloom)
+    monkeypatch.setattr(lookup_filter, "_rebuild_requested", asyncio.Event())
+    monkeypatch.setattr(lookup_filter, "stats", dict.fromkeys(lookup_filter.stats, 0))
+    monkeypatch.setitem(invalidation.stats, "connected", True)
+    return bloom
+
+
+def notify(table: str, op: str, old: dict | None = None, new: dict | None = None) -> None:
+    invalidation.dispatch(json.dumps({"t": table, "op": op, "old": old, "new": new}))
+
+
+@pytest.mark.asyncio
+async def test_a_burst_of_distinct_unknown_values_makes_no_backend_calls(listening_filter, monkeypatch):
+    looked_up = []
+
+    async def get_user_by_email(db, email):
+        looked_up.append(email)
+
+    monkeypatch.setattr(user_backend, "get_user_by_email", get_user_by_email)
+    verify_cra = auth.component.procedures["io.xconn.deskconn.account.cra.verify"]
+    lookup_filter.add(lookup_filter.KIND_EMAIL, "known@example.com")
+
+    for i in range(1000):
+        with pytest.raises(ApplicationError) as rejected:
+            await verify_cra(f"unknown{i}@example.com", "realm", db=None)
+        assert rejected.value.message == uris.ERROR_USER_NOT_FOUND
+
+    assert looked_up == []
+    assert lookup_filter.stats["rejected"] == 1000
+
+    with pytest.raises(ApplicationError):
+        await verify_cra("known@example.com", "realm", db=None)
+    assert looked_up == ["known@example.com"]
+
+
+def test_a_value_created_on_another_instance_is_found_once_its_notification_arrives(listening_filter):
+    assert not lookup_filter.might_exist(lookup_filter.KIND_EMAIL, "new@example.com")
+
+    notify("users", "insert", new={"email": "new@example.com"})
+    assert lookup_filter.might_exist(lookup_filter.KIND_EMAIL, "new@example.com")
+
+    notify("users", "update", old={"email": "new@example.com"}, new={"email": "renamed@example.com"})
+    assert lookup_filter.might_exist(lookup_filter.KIND_EMAIL, "renamed@example.com")
+
+    notify("desktops", "insert", new={"authid": "desktop-1", "realm": "realm-1"})
+    assert lookup_filter.might_exist(lookup_filter.KIND_AUTHID, "desktop-1")
+    assert lookup_filter.might_exist(lookup_filter.KIND_REALM, "realm-1")
+
+
+def test_might_exist_lets_everything_through_without_the_listener(listening_filter, monkeypatch):
+    monkeypatch.setitem(invalidation.stats, "connected", False)
+
+    assert lookup_filter.might_exist(lookup_filter.KIND_AUTHID, "unknown")
+    assert lookup_filter.stats["unfiltered"] == 1
+
+
+def test_might_exist_lets_everything_through_until_a_flush_is_rebuilt(listening_filter):
+    assert not lookup_filter.might_exist(lookup_filter.KIND_AUTHID, "unknown")
+
+    # changes bypassed the triggers, the filter may miss values until the rebuild it requests completes
+    notify("desktops", "truncate")
+
+    assert lookup_filter._rebuild_requested.is_set()
+    assert lookup_filter.might_exist(lookup_filter.KIND_AUTHID, "unknown")
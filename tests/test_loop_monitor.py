@@ -0,0 +1,53 @@
+import asyncio
+import time
+
+import pytest
+
+from deskconn import loop_monitor
+
+original_run = asyncio.Handle._run
+
+
+def block_the_loop(seconds: float) -> None:
+    time.sleep(seconds)
+
+
+@pytest.fixture
+def monitor(monkeypatch):
+    monkeypatch.setattr(loop_monitor, "LOOP_LAG_INTERVAL_MS", 10)
+    # the watchdog pings the loop every 30ms
+    monkeypatch.setattr(loop_monitor, "SLOW_CALLBACK_MS", 30)
+    monkeypatch.setattr(loop_monitor, "_monitor", None)
+    monkeypatch.setattr(loop_monitor, "_watchdog", None)
+    loop_monitor.slow_callbacks.clear()
+
+    yield loop_monitor
+
+    loop_monitor._monitor.cancel()
+    loop_monitor._watchdog.stop()
+
+
+@pytest.mark.asyncio
+async def test_a_blocked_loop_is_sampled_and_timed(monitor):
+    monitor.start()
+    await asyncio.sleep(0.05)
+    slow_before = monitor.stats.slow_callbacks
+
+    block_the_loop(0.2)
+    await asyncio.sleep(0.05)
+
+    assert monitor.stats.slow_callbacks == slow_before + 1
+    entry = monitor.slow_callbacks[-1]
+    assert entry.callback.endswith("test_loop_monitor:block_the_loop")
+    assert entry.duration_ms >= 100
+    assert monitor.stats.max_lag_ms >= 100
+    # nothing of asyncio is patched to get there
+    assert asyncio.Handle._run is original_run
+
+
+@pytest.mark.asyncio
+async def test_an_idle_loop_reports_no_slow_callbacks(monitor):
+    monitor.start()
+    await asyncio.sleep(0.2)
+
+    assert list(monitor.slow_callbacks) == []
@@ -0,0 +1,217 @@
+import asyncio
+import secrets
+from datetime import timedelta
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import delete, text
+from xconn.types import CallDetails
+
+from deskconn import helpers, models, schemas
+from deskconn.api import auth, coturn, desktop, organization, principal, update, user
+from deskconn.database.database import AsyncSessionLocal, engine
+from deskconn.query_budget import QUERY_BUDGETS
+
+PROCEDURES = {
+    uri: procedure
+    for module in (auth, coturn, desktop, organization, update, user)
+    for uri, procedure in module.component.procedures.items()
+}
+
+OTP = "123456"
+
+# procedures called by the tests of this module, the last test checks that every budget is among them
+called: set[str] = set()
+
+
+class RouterStub:
+    """Accepts the router calls and key publishes of attach, detach and login.verify."""
+
+    def __init__(self):
+        self.calls = []
+        self.published = []
+
+    async def call(self, uri, args=None, kwargs=None, options=None):
+        self.calls.append(uri)
+
+    async def publish(self, topic, args=None, kwargs=None, options=None):
+        self.published.append(topic)
+
+
+def new_key() -> str:
+    return secrets.token_hex(32)
+
+
+def caller(authid: str) -> CallDetails:
+    return CallDetails({"caller": secrets.randbelow(2**53), "caller_authid": authid})
+
+
+async def database_available() -> bool:
+    try:
+        async with asyncio.timeout(2):
+            async with engine.connect() as conn:
+                await conn.execute(text("SELECT 1 FROM deskconn.users LIMIT 1"))
+    except Exception:
+        return False
+
+    return True
+
+
+@pytest_asyncio.fixture
+async def accounts(monkeypatch):
+    if not await database_available():
+        await engine.dispose()
+        pytest.skip("needs a migrated database at DESKCONN_DATABASE_URL")
+
+    router = RouterStub()
+    for component in (desktop.component, principal.component):
+        monkeypatch.setattr(component, "_session", router)
+
+    tag = secrets.token_hex(4)
+    now = helpers.utcnow()
+
+    def new_user(name: str) -> models.User:
+        return models.User(
+            email=f"{name}-{tag}@example.com",
+            password="x",
+            name=name,
+            is_verified=True,
+            otp_hash=helpers.hash_otp(OTP),
+            otp_expires_at=now + timedelta(minutes=10),
+            otp_purpose=helpers.OTP_PURPOSE_LOGIN,
+        )
+
+    alice, bob, carol = new_user("alice"), new_user("bob"), new_user("carol")
+    owned = models.Desktop(authid=f"desktop-{tag}", name="desktop", public_key=new_key(), realm=f"realm-{tag}")
+    owned.user = alice
+    org = models.Organization(name=f"org-{tag}", owner=alice)
+    app = models.App(name=f"app-{tag}")
+    released = now - timedelta(days=2)
+    # the newest release has not reached any desktop yet, so update.check takes the fallback path
+    app.versions = [
+        models.AppVersion(version="1.0", released_at=released, checksum="c", size=1000),
+        models.AppVersion(version="1.1", released_at=released + timedelta(days=1), checksum="c", size=1000),
+        models.AppVersion(
+            version="1.2", released_at=released + timedelta(days=2), checksum="c", size=1000, rollout_percentage=0
+        ),
+    ]
+    app.versions[1].deltas = [
+        models.AppVersionDelta(from_version="1.0", os="linux", cpu_architecture="amd64", size=10, checksum="c"),
+    ]
+
+    device = models.Device(device_id=f"device-{tag}", public_key=new_key(), user=alice)
+    rows = [
+        alice,
+        bob,
+        carol,
+        owned,
+        org,
+        app,
+        device,
+        models.Principal(public_key=new_key(), expires_at=now + timedelta(days=1), user=bob),
+        models.DesktopUserAccess(desktop=owned, user=alice, role=models.DesktopAccessRole.owner),
+        models.DesktopUserAccess(desktop=owned, user=bob, role=models.DesktopAccessRole.member),
+        models.OrganizationMember(organization=org, user=carol, role=models.OrganizationMemberRole.member),
+        models.DesktopOrganizationAccess(desktop=owned, organization=org, role=models.DesktopAccessRole.member),
+    ]
+
+    async with AsyncSessionLocal() as db:
+        db.add_all(rows)
+        await db.commit()
+
+    subjects = {"alice": alice, "bob": bob, "carol": carol, "desktop": owned, "org": org, "app": app, "device": device}
+    subjects["tag"] = tag
+    try:
+        yield subjects
+    finally:
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(models.User).where(models.User.email.like(f"%-{tag}@example.com")))
+            await db.execute(delete(models.App).where(models.App.id == app.id))
+            await db.commit()
+
+        await engine.dispose()
+
+
+async def call(query_counter, uri: str, *args, **kwargs):
+    """Awaits the handler on a fresh session with cold caches, its statements counted against its budget."""
+    coturn.principal_ids.clear()
+    coturn.credentials.clear()
+    called.add(uri)
+
+    async with AsyncSessionLocal() as db:
+        with query_counter.call(uri):
+            return await PROCEDURES[uri](*args, **kwargs, db=db)
+
+
+@pytest.mark.asyncio
+async def test_authentication_procedures_stay_within_their_budgets(accounts, query_counter):
+    alice, bob, owned = accounts["alice"], accounts["bob"], accounts["desktop"]
+    device_key = accounts["device"].public_key
+
+    await call(query_counter, "io.xconn.deskconn.account.cra.verify", alice.email, owned.realm)
+    # a device key is looked up after the principal check misses, then the desktop realm is authorized
+    await call(query_counter, "io.xconn.deskconn.account.cryptosign.verify", alice.email, device_key, owned.realm)
+    await call(
+        query_counter, "io.xconn.deskconn.account.cryptosign.verify", owned.authid, owned.public_key, owned.realm
+    )
+    await call(query_counter, "io.xconn.deskconn.desktop.access", bob.email, owned.authid)
+    await call(query_counter, "io.xconn.deskconn.desktop.access.key.list", caller(owned.authid))
+    await call(query_counter, "io.xconn.deskconn.coturn.credentials.create", caller(owned.authid))
+
+    login = schemas.LoginVerify(email=bob.email, code=OTP, public_key=new_key())
+    await call(query_counter, "io.xconn.deskconn.account.login.verify", login)
+
+
+@pytest.mark.asyncio
+async def test_account_procedures_stay_within_their_budgets(accounts, query_counter):
+    alice, tag = accounts["alice"], accounts["tag"]
+
+    await call(query_counter, "io.xconn.deskconn.account.get", caller(alice.email))
+    await call(query_counter, "io.xconn.deskconn.account.login", alice.email, caller(alice.email))
+    await call(query_counter, "io.xconn.deskconn.account.otp.resend", alice.email, caller(alice.email))
+    await call(query_counter, "io.xconn.deskconn.account.password.forget", alice.email, caller(alice.email))
+
+    signup = schemas.UserCreate(email=f"dave-{tag}@example.com", password="secret", name="dave")
+    await call(query_counter, "io.xconn.deskconn.account.create", signup, caller(signup.email))
+
+
+@pytest.mark.asyncio
+async def test_desktop_procedures_stay_within_their_budgets(accounts, query_counter):
+    alice, carol, owned, org = accounts["alice"], accounts["carol"], accounts["desktop"], accounts["org"]
+    tag = accounts["tag"]
+
+    await call(query_counter, "io.xconn.deskconn.desktop.list", schemas.DesktopList(), caller(alice.email))
+    await call(
+        query_counter,
+        "io.xconn.deskconn.organization.get",
+        schemas.OrganizationDelete(organization_id=org.id),
+        caller(alice.email),
+    )
+
+    invite = schemas.DesktopUserInviteCreate(desktop_id=owned.id, email=carol.email, role="member")
+    await call(query_counter, "io.xconn.deskconn.desktop.invitation.user.create", invite, caller(alice.email))
+    await call(query_counter, "io.xconn.deskconn.desktop.invitation.inbox.list", caller(carol.email))
+
+    # attaching publishes the new desktop key to every desktop alice can access
+    attached = schemas.DesktopCreate(authid=f"laptop-{tag}", public_key=new_key(), name="laptop")
+    await call(query_counter, "io.xconn.deskconn.desktop.attach", attached, caller(alice.email))
+    detached = schemas.DesktopDetach(authid=attached.authid)
+    await call(query_counter, "io.xconn.deskconn.desktop.detach", detached, caller(alice.email))
+
+
+@pytest.mark.asyncio
+async def test_update_check_stays_within_its_budget_outside_the_rollout(accounts, query_counter):
+    check = schemas.AppVersionCheck(name=accounts["app"].name, version="1.0", os="linux", cpu_architecture="amd64")
+
+    result = await call(query_counter, "io.xconn.deskconn.app.update.check", check, caller(accounts["desktop"].authid))
+
+    assert result["latest_version"] == "1.1"
+    assert [delta["to_version"] for delta in result["deltas"]] == ["1.1"]
+
+
+def test_every_budget_is_exercised():
+    if not called:
+        pytest.skip("needs a migrated database at DESKCONN_DATABASE_URL")
+
+    # a new budget comes with a call in this module
+    assert sorted(set(QUERY_BUDGETS) - called) == []
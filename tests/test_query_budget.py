@@ -0,0 +1,94 @@
+from deskconn.query_budget import QueryRecorder, repeated_shapes, statement_shape
+
+pytest_plugins = ["pytester"]
+
+
+def issue(recorder: QueryRecorder, statement: str) -> None:
+    # what the engine's after_cursor_execute event passes on
+    recorder._after_cursor_execute(None, None, statement, (), None, False)
+
+
+def test_statement_shape_drops_parameters_and_literals():
+    statement = "SELECT users.id\n  FROM users\n  WHERE users.email = $1::VARCHAR AND users.name = 'O''Brien' LIMIT 10"
+
+    assert statement_shape(statement) == "SELECT users.id FROM users WHERE users.email = ? AND users.name = ? LIMIT ?"
+
+
+def test_statement_shape_collapses_in_lists():
+    two = statement_shape("SELECT * FROM desktops WHERE desktops.id IN ($1::UUID, $2::UUID)")
+    three = statement_shape("SELECT * FROM desktops WHERE desktops.id IN (%(id_1)s, %(id_2)s, %(id_3)s)")
+
+    assert two == three == "SELECT * FROM desktops WHERE desktops.id IN (?)"
+
+
+def test_repeated_shapes():
+    statements = [f"SELECT * FROM devices WHERE user_id = {i}" for i in range(3)] + ["SELECT * FROM users"]
+
+    assert repeated_shapes(statements) == {"SELECT * FROM devices WHERE user_id = ?": 3}
+
+
+def test_recorder_groups_statements_by_call():
+    recorder = QueryRecorder(engine=None, budgets={"a": 1, "b": 1})
+    with recorder.call("a"):
+        issue(recorder, "SELECT 1")
+    with recorder.call("b"):
+        issue(recorder, "SELECT 1")
+        issue(recorder, "SELECT * FROM users")
+    # outside any invocation, e.g. fixtures preparing data
+    issue(recorder, "INSERT INTO users DEFAULT VALUES")
+
+    assert recorder.statement_count("a") == [1]
+    assert recorder.statement_count("b") == [2]
+
+    violations = recorder.violations()
+    assert len(violations) == 1
+    assert violations[0].startswith("'b' issued 2 statements, budget is 1")
+
+
+def test_recorder_reports_n_plus_one_without_budget():
+    recorder = QueryRecorder(engine=None, budgets={})
+    with recorder.call("a"):
+        for i in range(3):
+            issue(recorder, f"SELECT * FROM devices WHERE user_id = {i}")
+
+    assert recorder.violations() == [
+        "'a' repeated the same statement 3 times (N+1?):\n  SELECT * FROM devices WHERE user_id = ?"
+    ]
+
+
+def test_query_counter_fails_the_test_on_overrun(pytester):
+    pytester.makeconftest('pytest_plugins = ["deskconn.pytest_plugin"]')
+    pytester.makepyfile(
+        """
+        import pytest
+
+        URI = "io.xconn.deskconn.account.get"
+
+
+        def issue(recorder, statement):
+            recorder._after_cursor_execute(None, None, statement, (), None, False)
+
+
+        def test_within_budget(query_counter):
+            with query_counter.call(URI):
+                issue(query_counter, "SELECT 1")
+
+
+        def test_over_budget(query_counter):
+            with query_counter.call(URI):
+                issue(query_counter, "SELECT 1")
+                issue(query_counter, "SELECT * FROM users")
+
+
+        @pytest.mark.query_budget(URI, 2)
+        def test_budget_raised_by_marker(query_counter):
+            with query_counter.call(URI):
+                issue(query_counter, "SELECT 1")
+                issue(query_counter, "SELECT * FROM users")
+        """
+    )
+
+    result = pytester.runpytest()
+
+    result.assert_outcomes(passed=2, failed=1, errors=0)
+    result.stdout.fnmatch_lines(["*test_over_budget*", "*issued 2 statements, budget is 1*"])
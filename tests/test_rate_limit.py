@@ -0,0 +1,147 @@
+import asyncio
+import secrets
+from collections import OrderedDict
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import delete, select, text
+from xconn.exception import ApplicationError
+from xconn.types import CallDetails
+
+from deskconn import models, rate_limit, uris
+from deskconn.database.database import AsyncSessionLocal, engine
+
+LOGIN = "io.xconn.deskconn.account.login"
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def buckets(monkeypatch):
+    monkeypatch.setattr(rate_limit, "_buckets", OrderedDict())
+    monkeypatch.setattr(rate_limit, "stats", {"allowed": 0, "rejected": 0, "shared_rejected": 0})
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_BACKEND", rate_limit.BACKEND_MEMORY)
+    monkeypatch.setattr(rate_limit, "EMAIL_LIMIT", rate_limit.Limit.parse("email", "2/600"))
+    monkeypatch.setattr(rate_limit, "SESSION_LIMIT", rate_limit.Limit.parse("session", "1/600"))
+
+    return rate_limit._buckets
+
+
+def session(session_id: int) -> CallDetails:
+    return CallDetails({"caller": session_id})
+
+
+def test_a_limit_is_a_burst_refilled_over_its_seconds():
+    limit = rate_limit.Limit.parse("DESKCONN_RATE_LIMIT_EMAIL", "5/600")
+
+    assert limit.burst == 5
+    assert limit.rate == pytest.approx(5 / 600)
+    assert limit.refill_seconds == pytest.approx(600)
+
+
+@pytest.mark.parametrize("value", ["5", "5/600/1", "five/600", "0/600", "5/0", "5/-1"])
+def test_a_limit_that_allows_no_calls_is_rejected(value):
+    with pytest.raises(ValueError, match="DESKCONN_RATE_LIMIT_EMAIL"):
+        rate_limit.Limit.parse("DESKCONN_RATE_LIMIT_EMAIL", value)
+
+
+def test_a_bucket_allows_its_burst_then_refills_evenly(buckets, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", clock)
+    keys = [("email:a@example.com", rate_limit.Limit.parse("email", "3/30"))]
+
+    assert [rate_limit._take_local(keys) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert rate_limit._take_local(keys) == pytest.approx(10)
+
+    clock.now += 4
+    assert rate_limit._take_local(keys) == pytest.approx(6)
+
+    clock.now += 6
+    assert rate_limit._take_local(keys) == 0.0
+    assert rate_limit._take_local(keys) > 0
+
+    # a bucket never holds more than its burst, however long it was idle
+    clock.now += 3600
+    assert [rate_limit._take_local(keys) for _ in range(4)][-1] > 0
+
+
+@pytest.mark.asyncio
+async def test_check_rejects_with_a_retry_hint(buckets):
+    await rate_limit.check(LOGIN, "a@example.com", session(1))
+
+    with pytest.raises(ApplicationError) as rejected:
+        await rate_limit.check(LOGIN, "a@example.com", session(1))
+
+    assert rejected.value.message == uris.ERROR_RATE_LIMITED
+    assert rejected.value.args == (f"Too many '{LOGIN}' requests, retry in 600s",)
+    assert rate_limit.stats == {"allowed": 1, "rejected": 1, "shared_rejected": 0}
+
+
+@pytest.mark.asyncio
+async def test_an_empty_session_bucket_does_not_spend_the_email_token(buckets):
+    await rate_limit.check(LOGIN, "a@example.com", session(1))
+
+    with pytest.raises(ApplicationError):
+        await rate_limit.check(LOGIN, "A@example.com ", session(1))
+
+    # the rejected call left the second email token for another session
+    await rate_limit.check(LOGIN, "a@example.com", session(2))
+    with pytest.raises(ApplicationError):
+        await rate_limit.check(LOGIN, "a@example.com", session(3))
+
+
+async def database_available() -> bool:
+    try:
+        async with asyncio.timeout(2):
+            async with engine.connect() as conn:
+                await conn.execute(text("SELECT 1 FROM deskconn.rate_limit_buckets LIMIT 1"))
+    except Exception:
+        return False
+
+    return True
+
+
+@pytest_asyncio.fixture
+async def shared_keys():
+    if not await database_available():
+        await engine.dispose()
+        pytest.skip("needs a migrated database at DESKCONN_DATABASE_URL")
+
+    tag = secrets.token_hex(4)
+    try:
+        yield tag
+    finally:
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(models.RateLimitBucket).where(models.RateLimitBucket.key.like(f"%{tag}%")))
+            await db.commit()
+
+        await engine.dispose()
+
+
+async def shared_tokens(key: str) -> float | None:
+    async with AsyncSessionLocal() as db:
+        return await db.scalar(select(models.RateLimitBucket.tokens).where(models.RateLimitBucket.key == key))
+
+
+@pytest.mark.asyncio
+async def test_an_empty_shared_session_bucket_does_not_spend_the_email_token(shared_keys):
+    email = (f"email:{shared_keys}@example.com", rate_limit.Limit.parse("email", "2/600"))
+    one_call = rate_limit.Limit.parse("session", "1/600")
+    first, second = (f"session:{shared_keys}-1", one_call), (f"session:{shared_keys}-2", one_call)
+
+    assert await rate_limit._take_shared([email, first])
+    assert not await rate_limit._take_shared([email, first])
+    assert await shared_tokens(email[0]) == pytest.approx(1, abs=0.01)
+
+    assert await rate_limit._take_shared([email, second])
+    assert not await rate_limit._take_shared([email, second])
+    # a session bucket that never existed is not created by a rejected call either
+    third = (f"session:{shared_keys}-3", one_call)
+    assert not await rate_limit._take_shared([email, third])
+    assert await shared_tokens(third[0]) is None
@@ -0,0 +1,82 @@
+import asyncio
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+
+from deskconn import desktop_replica, invalidation, lookup_filter, snapshots
+from deskconn.lookup_filter import BloomFilter
+
+WATERMARK = invalidation.Watermark(xid=42, at=datetime(2026, 1, 1, tzinfo=timezone.utc))
+LAPTOP = uuid.uuid4()
+
+
+def empty_caches(monkeypatch) -> None:
+    monkeypatch.setattr(desktop_replica, "_desktops", {})
+    monkeypatch.setattr(desktop_replica, "_authid_by_id", {})
+    monkeypatch.setattr(desktop_replica, "_ready", False)
+    monkeypatch.setattr(desktop_replica, "_loaded", asyncio.Event())
+    monkeypatch.setattr(lookup_filter, "_filter", None)
+    monkeypatch.setattr(lookup_filter, "_built", asyncio.Event())
+
+
+@pytest.fixture
+def saved(monkeypatch, tmp_path):
+    """A snapshot of a replica with one desktop and a filter with its email, with both caches emptied after."""
+    monkeypatch.setattr(snapshots, "SNAPSHOT_DIR", str(tmp_path))
+    monkeypatch.setattr(snapshots, "snapshotters", {})
+    monkeypatch.setattr(snapshots, "stats", dict.fromkeys(snapshots.stats, 0))
+    monkeypatch.setattr(desktop_replica, "_pending", asyncio.Queue())
+    monkeypatch.setattr(invalidation, "synced", lambda: WATERMARK)
+    resumed = []
+    monkeypatch.setattr(invalidation, "resume_from", resumed.append)
+
+    snapshots.register("desktop_replica", desktop_replica.dump, desktop_replica.load)
+    snapshots.register("lookup_filter", lookup_filter.dump, lookup_filter.load)
+
+    empty_caches(monkeypatch)
+    desktop_replica._set(LAPTOP, "laptop", "key-1", "realm-laptop", uuid.uuid4())
+    monkeypatch.setattr(desktop_replica, "_ready", True)
+    bloom = BloomFilter(100, 0.01)
+    bloom.add("email:alice@example.com")
+    monkeypatch.setattr(lookup_filter, "_filter", bloom)
+
+    snapshots.save()
+    assert snapshots.stats["saved"] == 1
+
+    empty_caches(monkeypatch)
+    return resumed
+
+
+def test_restore_loads_every_cache_and_resumes_from_the_watermark(saved):
+    assert snapshots.restore()
+
+    assert desktop_replica._ready
+    assert desktop_replica.verify("laptop", "key-1") == "realm-laptop"
+    assert desktop_replica._authid_by_id == {LAPTOP: "laptop"}
+    assert "email:alice@example.com" in lookup_filter._filter
+    assert lookup_filter._built.is_set()
+    assert saved == [WATERMARK]
+
+
+def test_a_corrupt_section_restores_no_cache(saved):
+    path = snapshots._path()
+    # the lookup filter is written last, the replica before it parses fine
+    path.write_bytes(path.read_bytes()[:-1])
+
+    assert not snapshots.restore()
+
+    assert not desktop_replica._ready
+    assert desktop_replica._desktops == {}
+    assert lookup_filter._filter is None
+    assert saved == []
+    assert snapshots.stats["errors"] == 1
+
+
+def test_a_snapshot_of_other_caches_is_ignored(saved):
+    del snapshots.snapshotters["lookup_filter"]
+
+    assert not snapshots.restore()
+
+    assert desktop_replica._desktops == {}
+    assert saved == []
@@ -0,0 +1,135 @@
+import asyncio
+import os
+import signal
+
+import pytest
+
+from deskconn import healthcheck
+from deskconn.supervisor import Supervisor, Worker
+
+
+class FakeProcess:
+    """Stops when terminated, like a worker that drains in time."""
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.returncode = None
+        self.signals = []
+        self._exited = asyncio.Event()
+
+    def terminate(self):
+        self.signals.append(signal.SIGTERM)
+        self.returncode = 0
+        self._exited.set()
+
+    def kill(self):
+        self.signals.append(signal.SIGKILL)
+        self.returncode = -9
+        self._exited.set()
+
+    async def wait(self) -> int:
+        await self._exited.wait()
+        return self.returncode
+
+
+def port(supervisor: Supervisor, slot: int, generation: int) -> int:
+    return int(supervisor._environment(slot, generation)["DESKCONN_METRICS_PORT"])
+
+
+def test_a_replacement_gets_another_port_than_the_worker_it_replaces(monkeypatch):
+    monkeypatch.setenv("DESKCONN_METRICS_PORT", "9100")
+    supervisor = Supervisor(3, [], drain_timeout=30)
+
+    # spawn counts generations from 1, a rolling restart runs generation n and n + 1 of a slot side by side
+    running = [port(supervisor, slot, 1) for slot in range(3)]
+    replacements = [port(supervisor, slot, 2) for slot in range(3)]
+
+    assert running == [9103, 9104, 9105]
+    assert replacements == [9100, 9101, 9102]
+    assert [port(supervisor, slot, 3) for slot in range(3)] == running
+
+
+def test_the_healthcheck_probes_the_ports_the_supervisor_hands_out(monkeypatch):
+    monkeypatch.setenv("DESKCONN_METRICS_PORT", "9100")
+    supervisor = Supervisor(3, [], drain_timeout=30)
+    probed = []
+
+    def probe(host, port):
+        probed.append(port)
+        return None, f"port {port} did not answer"
+
+    monkeypatch.setattr(healthcheck, "probe", probe)
+    healthcheck.check_workers("127.0.0.1", 9100, 3)
+
+    assert sorted(probed) == sorted(port(supervisor, slot, gen) for slot in range(3) for gen in (1, 2))
+
+
+@pytest.mark.parametrize(
+    ("answers", "healthy"),
+    [
+        ({9100: True}, True),
+        ({9102: True}, True),
+        # a rolling restart has the old and the new generation answering
+        ({9100: True, 9102: True}, True),
+        ({9100: True, 9102: False}, False),
+        ({9100: False}, False),
+        ({}, False),
+    ],
+)
+def test_a_worker_is_healthy_when_it_answers_ready_on_either_port(monkeypatch, answers, healthy):
+    def probe(host, port):
+        return answers.get(port), f"port {port}"
+
+    monkeypatch.setattr(healthcheck, "probe", probe)
+    problems = healthcheck.check_workers("127.0.0.1", 9100, 2)
+
+    # slot 1 (9101 and 9103) answers nothing in any case
+    assert [problem.split(":")[0] for problem in problems] == (["worker 1"] if healthy else ["worker 0", "worker 1"])
+
+
+def test_the_database_pool_is_split_between_the_workers(monkeypatch):
+    monkeypatch.setenv("DESKCONN_DB_POOL_SIZE", "10")
+    monkeypatch.setenv("DESKCONN_DB_MAX_OVERFLOW", "3")
+    monkeypatch.delenv("DESKCONN_METRICS_PORT", raising=False)
+
+    env = Supervisor(4, [], drain_timeout=30)._environment(2, 1)
+
+    assert env["DESKCONN_WORKER_ID"] == "2"
+    assert env["DESKCONN_DB_POOL_SIZE"] == "2"
+    assert env["DESKCONN_DB_MAX_OVERFLOW"] == "0"
+    assert "DESKCONN_METRICS_PORT" not in env
+
+    monkeypatch.setenv("DESKCONN_DB_POOL_SIZE", "1")
+    # every worker keeps at least one connection
+    assert Supervisor(4, [], drain_timeout=30)._environment(0, 1)["DESKCONN_DB_POOL_SIZE"] == "1"
+
+
+@pytest.mark.asyncio
+async def test_sigterm_drains_every_worker_and_stops(monkeypatch):
+    supervisor = Supervisor(2, [], drain_timeout=30)
+
+    async def start():
+        for slot in range(supervisor.count):
+            supervisor.slots[slot] = Worker(slot=slot, generation=1, process=FakeProcess(pid=1000 + slot))
+
+    monkeypatch.setattr(supervisor, "start", start)
+    running = asyncio.create_task(supervisor.run())
+    await asyncio.sleep(0.01)
+
+    os.kill(os.getpid(), signal.SIGTERM)
+    await asyncio.wait_for(running, 1)
+
+    assert [worker.process.signals for worker in supervisor.slots.values()] == [[signal.SIGTERM], [signal.SIGTERM]]
+    assert all(worker.retiring for worker in supervisor.slots.values())
+
+
+@pytest.mark.asyncio
+async def test_a_worker_that_does_not_drain_is_killed():
+    supervisor = Supervisor(1, [], drain_timeout=-9.95)
+    process = FakeProcess(pid=1000)
+    # ignores SIGTERM
+    process.terminate = lambda: process.signals.append(signal.SIGTERM)
+
+    await supervisor.retire(Worker(slot=0, generation=1, process=process))
+
+    assert process.signals == [signal.SIGTERM, signal.SIGKILL]
@@ -0,0 +1,86 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from deskconn import models
+from deskconn.api import update
+from deskconn.database.backend import update as update_backend
+
+APP_ID = uuid.uuid4()
+RELEASED = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def app_version(version: str, day: int, percentage: int = 100) -> models.AppVersion:
+    return models.AppVersion(
+        app_id=APP_ID, version=version, released_at=RELEASED + timedelta(days=day), rollout_percentage=percentage
+    )
+
+
+@pytest.fixture
+def releases(monkeypatch):
+    """Install releases in place of the database, answering the query select_rollout_version makes."""
+    versions: list[models.AppVersion] = []
+
+    async def get_previous_app_versions(db, app_id, released_before, including_version):
+        previous = [
+            v
+            for v in versions
+            if v.released_at < released_before and (v.rollout_percentage > 0 or v.version == including_version)
+        ]
+        return sorted(previous, key=lambda v: v.released_at, reverse=True)
+
+    monkeypatch.setattr(update_backend, "get_previous_app_versions", get_previous_app_versions)
+
+    return versions
+
+
+async def select(versions: list[models.AppVersion], bucket: int, current_version: str) -> str | None:
+    selected = await update.select_rollout_version(None, APP_ID, versions[-1], bucket, current_version)
+
+    return None if selected is None else selected.version
+
+
+@pytest.mark.asyncio
+async def test_outside_the_newest_cohort_the_newest_release_of_its_cohort_is_offered(releases):
+    releases += [app_version("1.0", 0), app_version("1.1", 1), app_version("1.2", 2, percentage=30)]
+
+    assert await select(releases, bucket=80, current_version="1.0") == "1.1"
+
+
+@pytest.mark.asyncio
+async def test_partially_rolled_out_previous_releases_are_skipped_outside_their_cohort(releases):
+    releases += [app_version("1.0", 0), app_version("1.1", 1, percentage=10), app_version("1.2", 2, percentage=30)]
+
+    assert await select(releases, bucket=80, current_version="0.9") == "1.0"
+    assert await select(releases, bucket=5, current_version="0.9") == "1.1"
+
+
+@pytest.mark.asyncio
+async def test_the_running_release_is_not_offered_again(releases):
+    releases += [app_version("1.0", 0), app_version("1.1", 1), app_version("1.2", 2, percentage=30)]
+
+    assert await select(releases, bucket=80, current_version="1.1") is None
+
+
+@pytest.mark.asyncio
+async def test_no_downgrade_from_a_release_pulled_back_to_zero(releases):
+    # 1.1 reached this desktop before it was pulled back, so it is no longer a candidate
+    releases += [app_version("1.0", 0), app_version("1.1", 1, percentage=0), app_version("1.2", 2, percentage=30)]
+
+    assert await select(releases, bucket=80, current_version="1.1") is None
+
+
+@pytest.mark.asyncio
+async def test_no_downgrade_from_a_release_outside_the_cohort(releases):
+    # a desktop that got 1.1 while it ramped stays on it after the ramp is lowered
+    releases += [app_version("1.0", 0), app_version("1.1", 1, percentage=10), app_version("1.2", 2, percentage=30)]
+
+    assert await select(releases, bucket=80, current_version="1.1") is None
+
+
+@pytest.mark.asyncio
+async def test_nothing_is_offered_when_no_release_includes_the_cohort(releases):
+    releases += [app_version("1.0", 0, percentage=10), app_version("1.1", 1, percentage=30)]
+
+    assert await select(releases, bucket=80, current_version="0.9") is None
@@ -0,0 +1,145 @@
+import asyncio
+import os
+import signal
+
+import pytest
+from xconn import App
+
+from deskconn import middleware, workers
+
+
+class FakeRegistration:
+    def __init__(self, registration_id: int, hangs: bool = False):
+        self.registration_id = registration_id
+        self.hangs = hangs
+        self.unregistered = False
+
+    async def unregister(self):
+        if self.hangs:
+            await asyncio.Event().wait()
+
+        self.unregistered = True
+
+
+class FakeSession:
+    def __init__(self):
+        self.registered = []
+
+    async def register(self, uri, endpoint, options=None):
+        self.registered.append(uri)
+        return FakeRegistration(len(self.registered))
+
+
+@pytest.fixture
+def worker(monkeypatch):
+    """Fresh drain state, with the SIGINT that stops the process recorded instead of raised."""
+    monkeypatch.setattr(workers, "in_flight", 0)
+    monkeypatch.setattr(workers, "_idle", asyncio.Event())
+    workers._idle.set()
+    monkeypatch.setattr(workers, "_drain_task", None)
+    monkeypatch.setattr(workers, "drain_hooks", [])
+    monkeypatch.setattr(workers, "registrations", [])
+
+    raised = []
+    monkeypatch.setattr(workers.signal, "raise_signal", raised.append)
+    workers.raised = raised
+    yield workers
+    del workers.raised
+
+
+def test_every_procedure_is_registered_round_robin_through_the_middleware():
+    app = App()
+
+    @app.register("io.xconn.deskconn.test.echo", options={"match": "exact"})
+    async def echo(value: str) -> str:
+        return value
+
+    middleware.install(app, [workers.middleware])
+    workers.share_registrations(app)
+
+    wrapper = app.procedures["io.xconn.deskconn.test.echo"]
+    assert wrapper is not echo
+    assert wrapper.__xconn_register_options__ == {"match": "exact", "invoke": "roundrobin"}
+
+
+@pytest.mark.asyncio
+async def test_registrations_made_by_the_app_are_tracked(worker):
+    app = App()
+    session = FakeSession()
+    worker.track_registrations(app)
+
+    app.set_session(session)
+    first = await session.register("io.xconn.deskconn.test.one", None)
+    second = await session.register("io.xconn.deskconn.test.two", None)
+
+    assert app.session is session
+    assert worker.registrations == [first, second]
+
+
+@pytest.mark.asyncio
+async def test_drain_unregisters_then_waits_for_invocations_in_flight(worker, monkeypatch):
+    monkeypatch.setattr(worker, "UNREGISTER_TIMEOUT", 0.05)
+    registrations = [FakeRegistration(1), FakeRegistration(2, hangs=True), FakeRegistration(3)]
+    worker.registrations.extend(registrations)
+    events = []
+    worker.drain_hooks.append(lambda: events.append("hook"))
+
+    finish = asyncio.Event()
+
+    async def invocation():
+        await finish.wait()
+        events.append("invocation")
+
+    call = middleware.ProcedureCall(uri="io.xconn.deskconn.test.slow", kwargs={})
+    running = asyncio.create_task(worker.middleware(call, invocation))
+    await asyncio.sleep(0)
+    assert worker.in_flight == 1
+
+    draining = asyncio.create_task(worker.drain())
+    await asyncio.sleep(0.1)
+
+    # a router that does not answer the unregister does not hold the drain up
+    assert [r.unregistered for r in registrations] == [True, False, True]
+    assert worker.registrations == []
+    assert worker.raised == []
+
+    finish.set()
+    await asyncio.wait_for(draining, 1)
+    await running
+
+    assert events == ["invocation", "hook"]
+    assert worker.in_flight == 0
+    assert worker.raised == [signal.SIGINT]
+
+
+@pytest.mark.asyncio
+async def test_drain_stops_the_process_when_invocations_outlast_the_timeout(worker, monkeypatch):
+    monkeypatch.setattr(worker, "DRAIN_TIMEOUT", 0.05)
+    call = middleware.ProcedureCall(uri="io.xconn.deskconn.test.stuck", kwargs={})
+    stuck = asyncio.create_task(worker.middleware(call, asyncio.Event().wait))
+    await asyncio.sleep(0)
+
+    await asyncio.wait_for(worker.drain(), 1)
+
+    assert worker.raised == [signal.SIGINT]
+    stuck.cancel()
+
+
+@pytest.mark.asyncio
+async def test_sigterm_starts_one_drain(worker, monkeypatch):
+    drains = []
+
+    async def drain():
+        drains.append(asyncio.current_task())
+
+    monkeypatch.setattr(worker, "drain", drain)
+    worker.install_drain()
+    try:
+        os.kill(os.getpid(), signal.SIGTERM)
+        await asyncio.sleep(0.01)
+        os.kill(os.getpid(), signal.SIGTERM)
+        await asyncio.sleep(0.01)
+    finally:
+        asyncio.get_running_loop().remove_signal_handler(signal.SIGTERM)
+
+    assert len(drains) == 1